@@ -0,0 +1,305 @@
+'''
+@license:
+Copyright 2011 Andrei N. Ciobanu
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Benchmarks of pysert: next_value() and next_batch() of every data set
+type, then rendering, writing and the whole run (rendering + writing
+through a PipelinedWriter) for meal_gen.xml and user_gen.xml at several
+iteration counts . Results are rows/s (and bytes/s) in JSON, compared
+with a stored baseline:
+
+    python benchmark.py --save-baseline     # on the reference revision
+    python benchmark.py                     # later: flags regressions
+'''
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import pysert
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, 'benchmark_baseline.json')
+CONFIGS = ('meal_gen.xml', 'user_gen.xml')
+
+# The properties of the data set benchmarked for every type, besides its
+# name . A type without an entry is reported as skipped .
+DATASET_SPECS = {
+    'RandomNumber': {'min': '1', 'max': '1000000'},
+    'LoremIpsum': {'length': '20'},
+    'PersonName': {},
+    'Sequence': {},
+    'NumberSequence': {'length': '7'},
+    'AlphaNumeric': {'min_length': '5', 'max_length': '15'},
+    'Date': {'min_year': '1900', 'max_year': '2100'},
+    'RandomFoodImage': {},
+    'RandomIngredient': {'result': 'IngredientType'},
+    'MealType': {},
+    'ForeignKey': {'references': 'Sequence'},
+    'Expression': {'expression': 'lower(PersonName) + str(Sequence)'},
+}
+
+
+# ------------------------------------------------------------------------------
+def best_time(function, repeat):
+    '''
+    Returns the shortest of repeat timings of function() .
+    '''
+    best = None
+    for _ in xrange(repeat):
+        started = time.time()
+        function()
+        elapsed = time.time() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return max(best, 1e-9)
+
+
+def xml_with_iterations(filename, iterations, directory):
+    '''
+    Copies the XML file filename to directory with its iterations
+    replaced . Returns the path of the copy .
+    '''
+    f = open(filename)
+    try:
+        text = f.read()
+    finally:
+        f.close()
+    text = re.sub(r'iterations="\d+"', 'iterations="%d"' % iterations, text,
+                  count=1)
+    path = os.path.join(directory, '%d_%s' % (iterations,
+                                              os.path.basename(filename)))
+    f = open(path, 'w')
+    try:
+        f.write(text)
+    finally:
+        f.close()
+    return path
+
+
+def dataset_xml(rows, directory):
+    '''
+    Writes an XML file with a data set of every type of DATASET_SPECS,
+    named after the type . Returns (path, skipped types) .
+    '''
+    types = sorted(pysert.DataSetBuilder().classes)
+    skipped = [name for name in types if name not in DATASET_SPECS]
+    lines = ['<pysert iterations="%d">' % rows]
+    for name in types:
+        if name in DATASET_SPECS:
+            attributes = ''.join(' %s="%s"' % item for item in
+                                 sorted(DATASET_SPECS[name].items()))
+            lines.append('    <dataset name="%s" type="%s"%s/>' %
+                         (name, name, attributes))
+    lines.append('    <template>%s</template>' %
+                 ' '.join('#{%s}' % name for name in types
+                          if name in DATASET_SPECS))
+    lines.append('</pysert>')
+    path = os.path.join(directory, 'datasets.xml')
+    f = open(path, 'w')
+    try:
+        f.write('\n'.join(lines) + '\n')
+    finally:
+        f.close()
+    return (path, skipped)
+
+
+# ------------------------------------------------------------------------------
+def bench_datasets(rows, repeat, directory):
+    '''
+    Times rows calls of next_value(), and next_batch(rows), of every
+    data set type . Returns {metric: {'rows_per_sec': ...}} .
+    '''
+    (path, skipped) = dataset_xml(rows, directory)
+    for name in skipped:
+        sys.stderr.write('Skipped %s: no entry in DATASET_SPECS .\n' % name)
+    dsv = pysert.DataSetEvaluator(path, seed=1)
+    results = {}
+    for (name, instance) in sorted(dsv.instances.items()):
+
+        def values():
+            instance.seek(0)
+            next_value = instance.next_value
+            for _ in xrange(rows):
+                next_value()
+
+        def batch():
+            instance.seek(0)
+            instance.next_batch(rows)
+
+        results['next_value/%s' % name] = {
+            'rows_per_sec': rows / best_time(values, repeat)}
+        results['next_batch/%s' % name] = {
+            'rows_per_sec': rows / best_time(batch, repeat)}
+    return results
+
+
+def bench_config(filename, iterations, block_size, repeat, directory):
+    '''
+    Times the rendering of the rows of the XML file filename (in memory),
+    the writing of the rendered text to a file, and the whole run as
+    the command line does it . Returns {metric: {'rows_per_sec': ...,
+    'bytes_per_sec': ...}} .
+    '''
+    path = xml_with_iterations(filename, iterations, directory)
+    dsv = pysert.DataSetEvaluator(path, seed=1)
+    output = os.path.join(directory, 'output.sql')
+    texts = []
+
+    def render():
+        del texts[:]
+        dsv.seek(0)
+        for (row, text) in dsv.iter_output(block_size=block_size):
+            texts.append(text)
+
+    def write():
+        f = open(output, 'w')
+        for text in texts:
+            f.write(text)
+        f.close()
+
+    def run():
+        f = open(output, 'w')
+        pipe = pysert.PipelinedWriter(f)
+        dsv.write_output(pipe, block_size=block_size, start=0)
+        pipe.close()
+        f.close()
+
+    key = '%s/%d/%s' % (os.path.splitext(os.path.basename(filename))[0],
+                        iterations, 'block' if block_size else 'row')
+    results = {}
+    for (metric, function) in (('render', render), ('write', write),
+                               ('end_to_end', run)):
+        elapsed = best_time(function, repeat)
+        size = sum(len(text) for text in texts)
+        results['%s/%s' % (metric, key)] = {
+            'rows_per_sec': iterations / elapsed,
+            'bytes_per_sec': size / elapsed}
+    return results
+
+
+# ------------------------------------------------------------------------------
+def compare(results, baseline, tolerance):
+    '''
+    Returns the (metric, measure, baseline value, value) of the results
+    slower than the baseline by more than tolerance (a fraction) .
+    '''
+    regressions = []
+    for (metric, measures) in sorted(results.items()):
+        for (measure, value) in sorted(measures.items()):
+            reference = baseline.get(metric, {}).get(measure)
+            if reference and value < reference * (1 - tolerance):
+                regressions.append((metric, measure, reference, value))
+    return regressions
+
+
+def report(results, baseline, out=sys.stderr):
+    '''
+    Writes a table of the results (rows/s, and the change from the
+    baseline if any) to out .
+    '''
+    for (metric, measures) in sorted(results.items()):
+        value = measures['rows_per_sec']
+        line = '%-44s %14.0f rows/s' % (metric, value)
+        if 'bytes_per_sec' in measures:
+            line += ' %10.1f MB/s' % (measures['bytes_per_sec'] / 1e6)
+        reference = baseline.get(metric, {}).get('rows_per_sec')
+        if reference:
+            line += ' %+7.1f%%' % (100.0 * (value / reference - 1))
+        out.write(line + '\n')
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='  Benchmark pysert.')
+    ap.add_argument('--sizes', dest='sizes', default='1000,10000',
+                    help='comma separated iteration counts of the end to end '
+                         'runs (default: 1000,10000)')
+    ap.add_argument('--rows', dest='rows', type=int, default=100000,
+                    help='rows drawn from every data set type (default: '
+                         '100000)')
+    ap.add_argument('-b', '--block-size', dest='block_size', type=int,
+                    default=1024,
+                    help='block size of the block mode runs (default: 1024)')
+    ap.add_argument('--repeat', dest='repeat', type=int, default=3,
+                    help='the best of REPEAT timings is kept (default: 3)')
+    ap.add_argument('-o', '--output', dest='ofile',
+                    help='write the results (JSON) to OFILE instead of '
+                         'stdout')
+    ap.add_argument('--baseline', dest='baseline', default=DEFAULT_BASELINE,
+                    help='the baseline results (default: %s)' %
+                         os.path.basename(DEFAULT_BASELINE))
+    ap.add_argument('--save-baseline', dest='save_baseline',
+                    action='store_true',
+                    help='store the results as the baseline')
+    ap.add_argument('--tolerance', dest='tolerance', type=float, default=0.2,
+                    help='flag results slower than the baseline by more than '
+                         'this fraction (default: 0.2)')
+    results = ap.parse_args()
+    if results.block_size < 1:
+        ap.error('--block-size must be positive')
+    try:
+        sizes = [int(size) for size in results.sizes.split(',')]
+    except ValueError:
+        ap.error('--sizes must be a comma separated list of integers')
+
+    # imports NumPy (see pysert.LazyModule) before anything is timed
+    numpy_version = pysert.numpy.__version__ if pysert.numpy else None
+    directory = tempfile.mkdtemp(prefix='pysert-benchmark-')
+    measured = {}
+    try:
+        measured.update(bench_datasets(results.rows, results.repeat,
+                                       directory))
+        for config in CONFIGS:
+            for size in sizes:
+                for block_size in (None, results.block_size):
+                    measured.update(bench_config(
+                        os.path.join(HERE, config), size, block_size,
+                        results.repeat, directory))
+    finally:
+        shutil.rmtree(directory)
+
+    document = {'python': platform.python_version(),
+                'numpy': numpy_version,
+                'results': measured}
+    text = json.dumps(document, indent=1, sort_keys=True,
+                      separators=(',', ': ')) + '\n'
+    if results.ofile is None:
+        sys.stdout.write(text)
+    else:
+        f = open(results.ofile, 'w')
+        f.write(text)
+        f.close()
+
+    baseline = {}
+    if results.save_baseline:
+        f = open(results.baseline, 'w')
+        f.write(text)
+        f.close()
+    elif os.path.exists(results.baseline):
+        f = open(results.baseline)
+        baseline = json.load(f)['results']
+        f.close()
+    report(measured, baseline)
+    regressions = compare(measured, baseline, results.tolerance)
+    for (metric, measure, reference, value) in regressions:
+        sys.stderr.write('Regression: %s %s %.0f -> %.0f (%+.1f%%)\n' %
+                         (metric, measure, reference, value,
+                          100.0 * (value / reference - 1)))
+    sys.exit(1 if regressions else 0)
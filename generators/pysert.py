@@ -14,520 +14,5003 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 '''
-from abc import abstractmethod as abstractclassmethod
 import abc
 import argparse
+import array
+import ast
+import bisect
+import cPickle
+import hashlib
+import imp
+import math
 import random
 import re
 import string
 import sys
 import textwrap
+import threading
 import datetime
+import errno
+import json
+import signal
+import zlib
+import os
+import time
+import Queue
 
 from xml.etree.ElementTree import ElementTree
 
+# Part of the key of the cached configurations (see ConfigCache)
+__version__ = '1.1'
+
+
+class LazyModule(object):
+    '''
+    Stands for the module name until one of its attributes is used: the
+    module is imported then, and replaces the LazyModule in the globals
+    of this module . Runs that never need it do not pay for its import .
+    The LazyModule is false if the module fails to import (and is then
+    replaced by None): code using the module tests "if not numpy" first .
+    '''
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+
+    def __load(self):
+        # name mangled: never an attribute of the module (numpy.load)
+        try:
+            module = __import__(self._name)
+        except ImportError:
+            module = None
+        globals()[self._name] = module
+        return module
+
+    def __nonzero__(self):
+        return self.__load() is not None
+
+    __bool__ = __nonzero__
+
+    def __getattr__(self, attribute):
+        module = self.__load()
+        if module is None:
+            raise ImportError('No module named %s' % self._name)
+        return getattr(module, attribute)
+
+
+try:
+    imp.find_module('numpy')
+    numpy = LazyModule('numpy')
+except ImportError:
+    # batch_at() falls back to value_at() without NumPy
+    numpy = None
+
+
+# ------------------------------------------------------------------------------
+MASK64 = (1 << 64) - 1
+
+
+def _mix64(x):
+    '''
+    SplitMix64 finalizer: a bijection of 64 bit integers with good
+    avalanche, used to turn counters into random bits .
+    '''
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & MASK64
+    return x ^ (x >> 31)
+
+
+def _mix64_array(x):
+    '''
+    NumPy counterpart of _mix64() for uint64 arrays (which wrap around
+    on overflow, like the & MASK64 above) .
+    '''
+    x = (x ^ (x >> numpy.uint64(30))) * numpy.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> numpy.uint64(27))) * numpy.uint64(0x94d049bb133111eb)
+    return x ^ (x >> numpy.uint64(31))
+
+
+class CounterRandom(object):
+    '''
+    Counter based random numbers . Draw j of row k is a pure function
+    of (seed, name, k, j): rows can be generated on their own, in any
+    order and on any process, always with the same result .
+    The NumPy *_batch methods return exactly the same values as the
+    scalar ones, row by row .
+    '''
+
+    golden = 0x9e3779b97f4a7c15
+    unit = 1.0 / (1 << 53)
+
+    def __init__(self, seed, name):
+        crc = zlib.crc32(name.encode('utf-8')) & 0xffffffff
+        self.key = _mix64((seed * self.golden + crc) & MASK64)
+        # one key per draw index j (see @stream_key)
+        self.keys = []
+
+    def stream_key(self, j):
+        while len(self.keys) <= j:
+            self.keys.append(_mix64(self.key ^ len(self.keys)))
+        return self.keys[j]
+
+    def bits(self, row, j=0):
+        '''
+        Returns 64 random bits for draw j of row .
+        '''
+        return _mix64((self.stream_key(j) + row * self.golden) & MASK64)
+
+    def randint(self, row, j, a, b):
+        '''
+        Returns an integer in [a, b] .
+        '''
+        return a + self.bits(row, j) % (b - a + 1)
+
+    def uniform(self, row, j, a, b):
+        '''
+        Returns a float in [a, b) .
+        '''
+        return a + (b - a) * ((self.bits(row, j) >> 11) * self.unit)
+
+    def choice(self, row, j, pool):
+        return pool[self.bits(row, j) % len(pool)]
+
+    def bits_batch(self, start, n, j=0):
+        '''
+        Returns the uint64 array of draw j for rows start .. start+n-1 .
+        If j is a list of draw indices the array has shape (n, len(j)) .
+        '''
+        rows = numpy.arange(start, start + n, dtype=numpy.uint64)
+        rows *= numpy.uint64(self.golden)
+        if isinstance(j, list):
+            keys = numpy.array([self.stream_key(i) for i in j],
+                               dtype=numpy.uint64)
+            return _mix64_array(rows[:, None] + keys)
+        return _mix64_array(rows + numpy.uint64(self.stream_key(j)))
+
+    def randint_batch(self, start, n, j, a, b):
+        bits = self.bits_batch(start, n, j) % numpy.uint64(b - a + 1)
+        return bits.astype(numpy.int64) + a
+
+    def uniform_batch(self, start, n, j, a, b):
+        bits = self.bits_batch(start, n, j) >> numpy.uint64(11)
+        return a + (b - a) * (bits.astype(numpy.float64) * self.unit)
+
+    def choice_batch(self, start, n, j, pool):
+        '''
+        pool is a sequence or (faster) an object array .
+        '''
+        idx = self.bits_batch(start, n, j) % numpy.uint64(len(pool))
+        return numpy.asarray(pool, dtype=object)[idx.astype(numpy.intp)]
+
+
+class Permutation(object):
+    '''
+    A keyed bijection of range(size): a balanced Feistel network over
+    the smallest even number of bits holding size, with cycle walking
+    to stay below size . Rows 0 .. size-1 are mapped to distinct values
+    without remembering the values already used, in constant memory
+    and time per row .
+    '''
+
+    rounds = 4
+    # keeps the round keys apart from the CounterRandom draw keys
+    salt = 0x7065726d << 32
+
+    def __init__(self, random, size):
+        self.size = size
+        bits = max(2, (size - 1).bit_length())
+        self.half = (bits + 1) // 2
+        self.mask = (1 << self.half) - 1
+        self.keys = [_mix64(random.key ^ (self.salt | r))
+                     for r in range(self.rounds)]
+
+    def permute(self, x):
+        (left, right) = (x >> self.half, x & self.mask)
+        for key in self.keys:
+            (left, right) = (right, left ^ (_mix64(key ^ right) & self.mask))
+        return (left << self.half) | right
+
+    def __call__(self, row):
+        if not 0 <= row < self.size:
+            raise ValueError('row %d out of the %d unique values' %
+                             (row, self.size))
+        x = self.permute(row)
+        while x >= self.size:
+            x = self.permute(x)
+        return x
+
+    def permute_batch(self, x):
+        half = numpy.uint64(self.half)
+        mask = numpy.uint64(self.mask)
+        (left, right) = (x >> half, x & mask)
+        for key in self.keys:
+            (left, right) = (right, left ^ (_mix64_array(right ^
+                                                         numpy.uint64(key))
+                                            & mask))
+        return (left << half) | right
+
+    def batch(self, start, n):
+        '''
+        Returns the uint64 array of the values of rows start .. start+n-1 .
+        '''
+        if start < 0 or start + n > self.size:
+            raise ValueError('rows %d .. %d out of the %d unique values' %
+                             (start, start + n - 1, self.size))
+        x = self.permute_batch(numpy.arange(start, start + n,
+                                            dtype=numpy.uint64))
+        walk = numpy.flatnonzero(x >= numpy.uint64(self.size))
+        while len(walk):
+            x[walk] = self.permute_batch(x[walk])
+            walk = walk[x[walk] >= numpy.uint64(self.size)]
+        return x
+
+
+def _digits(value, base, width):
+    '''
+    Returns the width digits of value in base, most significant first .
+    '''
+    digits = []
+    for i in xrange(width):
+        (value, digit) = divmod(value, base)
+        digits.append(digit)
+    return digits[::-1]
+
+
+def _digits_batch(values, base, width):
+    '''
+    NumPy counterpart of _digits(): a (n, width) array of digits .
+    '''
+    powers = numpy.array([base ** (width - 1 - i) for i in xrange(width)],
+                         dtype=numpy.uint64)
+    return (values[:, None] // powers) % numpy.uint64(base)
+
+
+# ------------------------------------------------------------------------------
+def _join_codes(codes):
+    '''
+    Returns the rows of a (n, length) uint8 array of ASCII codes as a
+    list of strings . Zero codes at the end of a row are dropped, which
+    is how variable length rows are encoded .
+    '''
+    (n, length) = codes.shape
+    if length == 0:
+        return [''] * n
+    rows = numpy.ascontiguousarray(codes).view('S%d' % length).ravel()
+    if bytes is not str:
+        rows = rows.astype('U%d' % length)
+    return rows.tolist()
+
+
+# ------------------------------------------------------------------------------
+class AliasTable(object):
+    '''
+    Walker's alias method (Vose's construction): samples the index i
+    with probability weights[i] / sum(weights) in O(1) from 64 random
+    bits, whatever the number of weights . The high 32 bits pick a
+    column, the low 32 bits keep it or take its alias .
+    '''
+
+    __slots__ = ('size', 'threshold', 'alias', 'threshold_array',
+                 'alias_array')
+
+    def __init__(self, weights):
+        self.size = len(weights)
+        total = float(sum(weights))
+        scaled = [weight * self.size / total for weight in weights]
+        # column i is kept if the low bits are < threshold[i]
+        threshold = [float(1 << 32)] * self.size
+        alias = list(range(self.size))
+        small = [i for (i, p) in enumerate(scaled) if p < 1.0]
+        large = [i for (i, p) in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            (less, more) = (small.pop(), large.pop())
+            threshold[less] = math.floor(scaled[less] * (1 << 32))
+            alias[less] = more
+            scaled[more] += scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        self.threshold = array.array('d', threshold)
+        self.alias = array.array('l', alias)
+        # NumPy views of threshold and alias, made by sample_batch()
+        self.threshold_array = None
+        self.alias_array = None
+
+    def __getstate__(self):
+        # the arrays pickle as machine words, not as lists of numbers
+        return (self.size, self.threshold.tostring(), self.alias.tostring())
+
+    def __setstate__(self, state):
+        (self.size, threshold, alias) = state
+        self.threshold = array.array('d')
+        self.threshold.fromstring(threshold)
+        self.alias = array.array('l')
+        self.alias.fromstring(alias)
+        self.threshold_array = None
+        self.alias_array = None
+
+    def sample(self, bits):
+        i = ((bits >> 32) * self.size) >> 32
+        if (bits & 0xffffffff) < self.threshold[i]:
+            return i
+        return self.alias[i]
+
+    def sample_batch(self, bits):
+        '''
+        The NumPy version of sample(), bits being a uint64 array .
+        '''
+        if self.alias_array is None:
+            self.threshold_array = numpy.frombuffer(self.threshold,
+                                                    dtype=numpy.float64)
+            self.alias_array = numpy.frombuffer(
+                self.alias, dtype='i%d' % self.alias.itemsize)
+        i = (((bits >> numpy.uint64(32)) * numpy.uint64(self.size)) >>
+             numpy.uint64(32)).astype(numpy.intp)
+        keep = (bits & numpy.uint64(0xffffffff)).astype(numpy.float64) < \
+            self.threshold_array[i]
+        return numpy.where(keep, i, self.alias_array[i])
+
+
+# ------------------------------------------------------------------------------
+# The samplers of the zipf, normal and exponential distributions invert
+# (or reject) a uniform draw analytically: they take O(1) time and memory
+# whatever the number of positions . Each function below has a NumPy
+# twin (suffix _array) computing the same values element by element,
+# the transcendental functions of NumPy being those of the C library .
+
+def _unit(bits):
+    '''
+    Returns the float in [0, 1) of the high 53 of 64 random bits .
+    '''
+    return (bits >> 11) * CounterRandom.unit
+
+
+def _unit_array(bits):
+    return (bits >> numpy.uint64(11)).astype(numpy.float64) * \
+        CounterRandom.unit
+
+
+def _next_bits(bits):
+    '''
+    Returns the bits of the next attempt of a rejection sampler .
+    '''
+    return _mix64((bits + CounterRandom.golden) & MASK64)
+
+
+def _next_bits_array(bits):
+    return _mix64_array(bits + numpy.uint64(CounterRandom.golden))
+
+
+def _horner(coefficients, x):
+    '''
+    Evaluates the polynomial of coefficients (highest degree first) at
+    x, a float or a float64 array .
+    '''
+    result = coefficients[0]
+    for coefficient in coefficients[1:]:
+        result = result * x + coefficient
+    return result
+
+
+# Numerical Recipes' erfc approximation (fractional error < 1.2e-7)
+ERFC_COEFFICIENTS = (0.17087277, -0.82215223, 1.48851587, -1.13520398,
+                     0.27886807, -0.18628806, 0.09678418, 0.37409196,
+                     1.00002368, -1.26551223)
+
+
+def _normal_cdf(x):
+    '''
+    Returns the standard normal cumulative distribution function at x .
+    '''
+    z = abs(x) * math.sqrt(0.5)
+    t = 1.0 / (1.0 + 0.5 * z)
+    tail = 0.5 * t * math.exp(_horner(ERFC_COEFFICIENTS, t) - z * z)
+    return 1.0 - tail if x >= 0 else tail
+
+
+def _normal_cdf_array(x):
+    z = numpy.abs(x) * math.sqrt(0.5)
+    t = 1.0 / (1.0 + 0.5 * z)
+    tail = 0.5 * t * numpy.exp(_horner(ERFC_COEFFICIENTS, t) - z * z)
+    return numpy.where(x >= 0, 1.0 - tail, tail)
+
+
+# Acklam's inverse of the normal distribution function (relative error
+# < 1.2e-9): a rational function of p in the central region, of
+# sqrt(-2 log p) in the tails
+QUANTILE_CENTRAL = ((-3.969683028665376e+01, 2.209460984245205e+02,
+                     -2.759285104469687e+02, 1.383577518672690e+02,
+                     -3.066479806614716e+01, 2.506628277459239e+00),
+                    (-5.447609879822406e+01, 1.615858368580409e+02,
+                     -1.556989798598866e+02, 6.680131188771972e+01,
+                     -1.328068155288572e+01, 1.0))
+QUANTILE_TAIL = ((-7.784894002430293e-03, -3.223964580411365e-01,
+                  -2.400758277161838e+00, -2.549671348887910e+00,
+                  4.374664141464968e+00, 2.938163982698783e+00),
+                 (7.784695709041462e-03, 3.224671290700398e-01,
+                  2.445134137142996e+00, 3.754408661907416e+00, 1.0))
+QUANTILE_LOW = 0.02425
+
+
+def _normal_quantile(p):
+    '''
+    Returns x such that _normal_cdf(x) = p, for 0 < p < 1 .
+    '''
+    if p < QUANTILE_LOW:
+        q = math.sqrt(-2.0 * math.log(p))
+        return _horner(QUANTILE_TAIL[0], q) / _horner(QUANTILE_TAIL[1], q)
+    if p > 1.0 - QUANTILE_LOW:
+        q = math.sqrt(-2.0 * math.log(1.0 - p))
+        return -_horner(QUANTILE_TAIL[0], q) / _horner(QUANTILE_TAIL[1], q)
+    q = p - 0.5
+    r = q * q
+    return _horner(QUANTILE_CENTRAL[0], r) * q / \
+        _horner(QUANTILE_CENTRAL[1], r)
+
+
+def _normal_quantile_array(p):
+    x = numpy.empty_like(p)
+    low = p < QUANTILE_LOW
+    high = p > 1.0 - QUANTILE_LOW
+    central = ~(low | high)
+    q = numpy.sqrt(-2.0 * numpy.log(p[low]))
+    x[low] = _horner(QUANTILE_TAIL[0], q) / _horner(QUANTILE_TAIL[1], q)
+    q = numpy.sqrt(-2.0 * numpy.log(1.0 - p[high]))
+    x[high] = -_horner(QUANTILE_TAIL[0], q) / _horner(QUANTILE_TAIL[1], q)
+    q = p[central] - 0.5
+    r = q * q
+    x[central] = _horner(QUANTILE_CENTRAL[0], r) * q / \
+        _horner(QUANTILE_CENTRAL[1], r)
+    return x
+
+
+def _log1p_ratio(x):
+    '''
+    log(1 + x) / x, accurate near 0 .
+    '''
+    if abs(x) > 1e-8:
+        return math.log1p(x) / x
+    return 1.0 - x * (0.5 - x * (1.0 / 3.0 - 0.25 * x))
+
+
+def _log1p_ratio_array(x):
+    small = numpy.abs(x) <= 1e-8
+    safe = numpy.where(small, 1.0, x)
+    series = 1.0 - x * (0.5 - x * (1.0 / 3.0 - 0.25 * x))
+    return numpy.where(small, series, numpy.log1p(safe) / safe)
+
+
+def _expm1_ratio(x):
+    '''
+    (exp(x) - 1) / x, accurate near 0 .
+    '''
+    if abs(x) > 1e-8:
+        return math.expm1(x) / x
+    return 1.0 + x * 0.5 * (1.0 + x * (1.0 / 3.0) * (1.0 + 0.25 * x))
+
+
+def _expm1_ratio_array(x):
+    small = numpy.abs(x) <= 1e-8
+    safe = numpy.where(small, 1.0, x)
+    series = 1.0 + x * 0.5 * (1.0 + x * (1.0 / 3.0) * (1.0 + 0.25 * x))
+    return numpy.where(small, series, numpy.expm1(safe) / safe)
+
+
+class ZipfSampler(object):
+    '''
+    Samples the positions i of 0 .. size-1 with probability proportional
+    to 1 / (i + 1) ** skew, by rejection-inversion (Hoermann and
+    Derflinger, "Rejection-inversion to generate variates from monotone
+    discrete distributions", 1996): a draw inverts the integral of a hat
+    function and is accepted with a probability close to 1 whatever size
+    and skew . Rejected draws retry with the _next_bits() .
+    count, given to sample(), restricts the positions to 0 .. count-1 .
+    '''
+
+    __slots__ = ('size', 'skew', 'integral_first', 'integral_last',
+                 'accept')
+
+    def __init__(self, size, skew):
+        self.size = size
+        self.skew = skew
+        self.integral_first = self.integral(1.5) - 1.0
+        self.integral_last = self.integral(size + 0.5)
+        # x is accepted without computing the hat when k - x <= accept
+        self.accept = 2.0 - self.integral_inverse(self.integral(2.5) -
+                                                  self.hat(2.0))
+
+    def hat(self, x):
+        return math.exp(-self.skew * math.log(x))
+
+    def hat_array(self, x):
+        return numpy.exp(-self.skew * numpy.log(x))
+
+    def integral(self, x):
+        '''
+        The integral of hat() from 1 to x (up to a constant) .
+        '''
+        log_x = math.log(x)
+        return _expm1_ratio((1.0 - self.skew) * log_x) * log_x
+
+    def integral_array(self, x):
+        log_x = numpy.log(x)
+        return _expm1_ratio_array((1.0 - self.skew) * log_x) * log_x
+
+    def integral_inverse(self, x):
+        t = max(x * (1.0 - self.skew), -1.0)
+        return math.exp(_log1p_ratio(t) * x)
+
+    def integral_inverse_array(self, x):
+        t = numpy.maximum(x * (1.0 - self.skew), -1.0)
+        return numpy.exp(_log1p_ratio_array(t) * x)
+
+    def sample(self, bits, count=None):
+        if count is None:
+            (count, last) = (self.size, self.integral_last)
+        else:
+            last = self.integral(count + 0.5)
+        while True:
+            u = last + _unit(bits) * (self.integral_first - last)
+            x = self.integral_inverse(u)
+            k = min(max(int(x + 0.5), 1), count)
+            if k - x <= self.accept or \
+                    u >= self.integral(k + 0.5) - self.hat(float(k)):
+                return k - 1
+            bits = _next_bits(bits)
+
+    def sample_batch(self, bits, counts=None):
+        '''
+        The NumPy version of sample(), bits being a uint64 array and
+        counts None or an int64 array .
+        '''
+        if counts is None:
+            (counts, last) = (self.size, self.integral_last)
+        else:
+            last = self.integral_array(counts + 0.5)
+        result = numpy.empty(len(bits), dtype=numpy.int64)
+        todo = numpy.arange(len(bits))
+        while len(todo):
+            u = last + _unit_array(bits) * (self.integral_first - last)
+            x = self.integral_inverse_array(u)
+            k = numpy.minimum(numpy.maximum((x + 0.5).astype(numpy.int64),
+                                            1), counts)
+            done = (k - x <= self.accept) | \
+                (u >= self.integral_array(k + 0.5) -
+                 self.hat_array(k.astype(numpy.float64)))
+            result[todo[done]] = k[done] - 1
+            rejected = ~done
+            todo = todo[rejected]
+            bits = _next_bits_array(bits[rejected])
+            if not numpy.isscalar(last):
+                (counts, last) = (counts[rejected], last[rejected])
+        return result
+
+
+class ExponentialSampler(object):
+    '''
+    Samples the positions 0 .. size-1 with an exponential distribution
+    of mean scale, rounded to the nearest position and truncated to the
+    range by inversion of its distribution function .
+    '''
+
+    __slots__ = ('size', 'scale', 'mass')
+
+    def __init__(self, size, scale):
+        self.size = size
+        self.scale = scale
+        self.mass = self.range_mass(size)
+
+    def range_mass(self, count):
+        '''
+        The probability of the values rounded to 0 .. count-1 .
+        '''
+        return -math.expm1(-(count - 0.5) / self.scale)
+
+    def sample(self, bits, count=None):
+        if count is None:
+            (count, mass) = (self.size, self.mass)
+        else:
+            mass = self.range_mass(count)
+        x = -self.scale * math.log1p(-_unit(bits) * mass)
+        return min(int(x + 0.5), count - 1)
+
+    def sample_batch(self, bits, counts=None):
+        if counts is None:
+            (counts, mass) = (self.size, self.mass)
+        else:
+            mass = -numpy.expm1(-(counts - 0.5) / self.scale)
+        x = -self.scale * numpy.log1p(-_unit_array(bits) * mass)
+        return numpy.minimum((x + 0.5).astype(numpy.int64), counts - 1)
+
+
+class NormalSampler(object):
+    '''
+    Samples the positions 0 .. size-1 with a normal distribution of
+    parameters mean and stddev, rounded to the nearest position and
+    truncated to the range by inversion of its distribution function .
+    '''
+
+    __slots__ = ('size', 'mean', 'stddev', 'low', 'high')
+
+    # the probabilities given to _normal_quantile() are clamped to
+    # [tiny, 1 - tiny]: the draws land on the ends of the range then
+    tiny = 1e-300
+
+    def __init__(self, size, mean, stddev):
+        self.size = size
+        self.mean = mean
+        self.stddev = stddev
+        self.low = _normal_cdf((-0.5 - mean) / stddev)
+        self.high = _normal_cdf((size - 0.5 - mean) / stddev)
+
+    def sample(self, bits, count=None):
+        if count is None:
+            (count, high) = (self.size, self.high)
+        else:
+            high = _normal_cdf((count - 0.5 - self.mean) / self.stddev)
+        p = self.low + _unit(bits) * (high - self.low)
+        p = min(max(p, self.tiny), 1.0 - CounterRandom.unit)
+        x = self.mean + self.stddev * _normal_quantile(p)
+        return min(max(int(math.floor(x + 0.5)), 0), count - 1)
+
+    def sample_batch(self, bits, counts=None):
+        if counts is None:
+            (counts, high) = (self.size, self.high)
+        else:
+            high = _normal_cdf_array((counts - 0.5 - self.mean) /
+                                     self.stddev)
+        p = self.low + _unit_array(bits) * (high - self.low)
+        p = numpy.minimum(numpy.maximum(p, self.tiny),
+                          1.0 - CounterRandom.unit)
+        x = self.mean + self.stddev * _normal_quantile_array(p)
+        return numpy.minimum(numpy.maximum(
+            numpy.floor(x + 0.5).astype(numpy.int64), 0), counts - 1)
+
+
+# ------------------------------------------------------------------------------
+class ConfigError(Exception):
+    '''
+    Raised for an invalid generator configuration . errors lists every
+    problem found, not only the first one .
+    '''
+
+    def __init__(self, errors):
+        super(ConfigError, self).__init__('\n'.join(errors))
+        self.errors = list(errors)
+
+
+# Default of the Field objects that must be present in the XML file
+REQUIRED = object()
+
+
+def escape_sql(value, quote="'"):
+    '''
+    Returns value escaped for a SQL literal delimited by quote: the
+    quote is doubled and, in strings, backslashes too (MySQL) . Values
+    that are not strings (numbers) are returned as they are .
+    '''
+    if not isinstance(value, basestring):
+        return value
+    if quote != '`':
+        value = value.replace('\\', '\\\\')
+    return value.replace(quote, quote * 2)
+
+
+def unescape_sql(value, quote="'"):
+    '''
+    The inverse of escape_sql() .
+    '''
+    if not isinstance(value, basestring):
+        return value
+    value = value.replace(quote * 2, quote)
+    if quote != '`':
+        value = value.replace('\\\\', '\\')
+    return value
+
+
+def requote_sql(value, escape, quote):
+    '''
+    Returns value, escaped for a literal delimited by escape (None: not
+    escaped), escaped for a literal delimited by quote instead .
+    '''
+    if escape == quote:
+        return value
+    if escape:
+        value = unescape_sql(value, escape)
+    if quote:
+        value = escape_sql(value, quote)
+    return value
+
+
+class Field(object):
+    '''
+    A typed property of a data set . parse converts the XML attribute
+    value and raises ValueError if it is invalid, default is used when
+    the attribute is missing (REQUIRED: the attribute is mandatory) .
+    '''
+
+    __slots__ = ('name', 'parse', 'default')
+
+    def __init__(self, name, parse, default=REQUIRED):
+        self.name = name
+        self.parse = parse
+        self.default = default
+
+
+def boolean(value):
+    '''
+    Parses a boolean attribute: True/False (any case) or 1/0 .
+    '''
+    lowered = value.strip().lower()
+    if lowered in ('true', '1'):
+        return True
+    if lowered in ('false', '0'):
+        return False
+    raise ValueError('\'%s\' is not a boolean (True/False)' % value)
+
+
+def one_of(*choices):
+    '''
+    Returns a parser accepting only the given strings .
+    '''
+
+    def parse(value):
+        if value not in choices:
+            raise ValueError('\'%s\' is not one of %s' %
+                             (value, ', '.join(choices)))
+        return value
+    return parse
+
+
+def weight_list(value):
+    '''
+    Parses a comma separated list of non negative weights .
+    '''
+    try:
+        weights = [float(weight) for weight in value.split(',')]
+    except ValueError:
+        raise ValueError('\'%s\' is not a list of numbers' % value)
+    if min(weights) < 0 or sum(weights) <= 0:
+        raise ValueError('weights must be non negative, not all zero')
+    return weights
+
+
+# The optional distribution of the data sets sampling a pool of values or
+# a range of integers (see AbstractDataSet.make_sampler) . mean is a value
+# of the range for RandomNumber, a position in the pool (0 based) for the
+# other data sets, and stddev is in the same units . Both are parameters
+# of the distribution before it is truncated to the range: the mean of the
+# values drawn differs when much of it falls outside .
+DISTRIBUTIONS = ('uniform', 'zipf', 'normal', 'exponential', 'weights')
+DISTRIBUTION_FIELDS = (Field('distribution', one_of(*DISTRIBUTIONS), 'uniform'),
+                       Field('skew', float, 1.0), Field('mean', float, None),
+                       Field('stddev', float, None),
+                       Field('weights', weight_list, None))
+DISTRIBUTION_SLOTS = tuple(field.name for field in DISTRIBUTION_FIELDS)
+
+
+def check_distribution(values):
+    '''
+    Returns the errors in the distribution fields of values .
+    '''
+    errors = []
+    if (values['weights'] is None) != (values['distribution'] != 'weights'):
+        errors.append('weights must be given with distribution="weights" '
+                      '(only)')
+    if values['skew'] <= 0:
+        errors.append('skew is not positive')
+    if values['stddev'] is not None and values['stddev'] <= 0:
+        errors.append('stddev is not positive')
+    return errors
+
+
+# ------------------------------------------------------------------------------
+class AbstractDataSet(object):
+    '''
+    Abstract class base for data sets .
+    Classes based on AbstractDataSet are dynamic and must implement
+    value_at() method . The value of a data set at a given row only
+    depends on the seed, the data set name and the row (see
+    CounterRandom), next_value() and next_batch() walk the rows in
+    order starting at the position set by seek() .
+    '''
+
+    __metaclass__ = abc.ABCMeta
+    __slots__ = ('name', 'row', 'random', 'table', 'table_array', 'escape',
+                 'sampler', 'built')
+
+    # The typed properties of the data set besides name (see Field) .
+    # Subclasses list them in __slots__ too, with the attributes
+    # precomputed by build() and prepare() .
+    fields = ()
+
+    # Largest domain() tabulated by build()
+    max_table = 1 << 16
+
+    @classmethod
+    def parse_spec(cls, ds_dict):
+        '''
+        Coerces and validates the XML attributes of a data set once .
+        Returns a ({field name: value}, [error messages]) tuple .
+        '''
+        name = ds_dict.get('name')
+        prefix = 'Invalid data set \'%s\' (%s): ' % (name, cls.__name__)
+        values = {}
+        errors = []
+        known = set(field.name for field in cls.fields)
+        for key in sorted(ds_dict):
+            if key != 'name' and key not in known:
+                errors.append(prefix + 'unknown property \'%s\' .' % key)
+        for field in cls.fields:
+            if field.name not in ds_dict:
+                if field.default is REQUIRED:
+                    errors.append(prefix + 'missing property \'%s\' .' %
+                                  field.name)
+                else:
+                    values[field.name] = field.default
+                continue
+            try:
+                values[field.name] = field.parse(ds_dict[field.name])
+            except ValueError as err:
+                errors.append(prefix + 'property \'%s\': %s .' %
+                              (field.name, err))
+        if not errors:
+            errors.extend(prefix + error + ' .' for error in cls.check(values))
+            if 'distribution' in values:
+                errors.extend(prefix + error + ' .' for error in
+                              check_distribution(values))
+        return (values, errors)
+
+    @classmethod
+    def check(cls, values):
+        '''
+        Returns the errors in the combination of the (coerced) values
+        of the fields, e.g. min > max .
+        '''
+        return []
+
+    def __init__(self, ds_dict):
+        '''
+        ds_dict holds the XML attributes of the data set, coerced and
+        validated by parse_spec() . Raises ConfigError if invalid .
+        '''
+        (values, errors) = self.parse_spec(ds_dict)
+        if errors:
+            raise ConfigError(errors)
+        self.name = ds_dict['name']
+        for (k, v) in values.items():
+            setattr(self, k, v)
+        self.row = 0
+        # quote of the literals the values are rendered in (see build)
+        self.escape = None
+        self.built = False
+
+    def __getstate__(self):
+        '''
+        Only the properties are pickled (see ConfigCache): everything
+        else is derived from them again by build() and set_seed() .
+        '''
+        state = {field.name: getattr(self, field.name)
+                 for field in self.fields}
+        state.update(name=self.name, row=self.row, escape=self.escape)
+        return state
+
+    def __setstate__(self, state):
+        for (slot, value) in state.items():
+            setattr(self, slot, value)
+        self.built = False
+
+    def set_escape(self, quote):
+        '''
+        Sets the quote of the literals the values are rendered in . The
+        derived state is built again by the next set_seed() .
+        '''
+        if quote != self.escape:
+            self.escape = quote
+            self.built = False
+
+    def set_seed(self, seed):
+        '''
+        Seeds the values: build() runs once, on the first call,
+        prepare() on every call .
+        '''
+        if not self.built:
+            self.build()
+            self.built = True
+        self.random = CounterRandom(seed, self.name)
+        self.prepare()
+
+    def build(self):
+        '''
+        Precomputes what value_at() needs that does not depend on the
+        seed, once . A small domain() is stored in self.table (see
+        @array_table for NumPy) so that a value is an integer draw and
+        a lookup .
+        If the values are rendered in quoted literals (self.escape, set
+        by the DataSetEvaluator), the table is escaped here once
+        (see escape_sql): values taken from it never need escaping .
+        Data sets whose values may contain quotes or backslashes and are
+        not taken from the table must escape them in value_at() .
+        Subclasses overriding this must call it once their own
+        attributes are ready .
+        '''
+        self.table = None
+        self.table_array = None
+        self.sampler = None
+        domain = self.domain()
+        if domain is not None and len(domain) <= self.max_table:
+            self.table = list(domain)
+            if self.escape:
+                self.table = [escape_sql(value, self.escape)
+                              for value in self.table]
+            self.sampler = self.make_sampler(len(self.table))
+
+    def prepare(self):
+        '''
+        Precomputes what value_at() needs for the current self.random,
+        e.g. the generator function bound to it, on every set_seed() .
+        '''
+        pass
+
+    def array_table(self):
+        '''
+        Returns self.table as a NumPy object array, made on first use .
+        '''
+        if self.table_array is None:
+            self.table_array = numpy.array(self.table, dtype=object)
+        return self.table_array
+
+    def make_sampler(self, n, origin=0):
+        '''
+        Returns the sampler of n positions with the distribution of the
+        data set (see DISTRIBUTION_FIELDS), None if uniform: an
+        AliasTable for weights, built once as it only depends on n and
+        the fields, an analytic sampler for the other distributions .
+        origin is the value of position 0 in the units of mean .
+        '''
+        distribution = getattr(self, 'distribution', 'uniform')
+        if distribution == 'uniform' or n <= 1:
+            return None
+        if self.sampler is not None and self.sampler.size == n:
+            return self.sampler
+        prefix = 'Invalid data set \'%s\' (%s): ' % (self.name,
+                                                     type(self).__name__)
+        mean = None if self.mean is None else self.mean - origin
+        if mean is not None and not 0 <= mean <= n - 1:
+            raise ConfigError([prefix + 'mean is not a position of the %d '
+                               'values (0 .. %d) .' % (n, n - 1)])
+        if distribution == 'zipf':
+            return ZipfSampler(n, self.skew)
+        if distribution == 'normal':
+            return NormalSampler(n, (n - 1) / 2.0 if mean is None else mean,
+                                 n / 6.0 if self.stddev is None
+                                 else self.stddev)
+        if distribution == 'exponential':
+            if mean == 0:
+                raise ConfigError([prefix + 'the mean of the exponential '
+                                   'distribution is its first value .'])
+            return ExponentialSampler(n, n / 10.0 if mean is None else mean)
+        if len(self.weights) != n:
+            raise ConfigError([prefix + '%d weights for %d values .' %
+                               (len(self.weights), n)])
+        return AliasTable(self.weights)
+
+    def pick(self, row, j=0):
+        '''
+        Returns the value of self.table drawn by draw j of row, with the
+        distribution of self.sampler if any .
+        '''
+        if self.sampler is None:
+            return self.random.choice(row, j, self.table)
+        return self.table[self.sampler.sample(self.random.bits(row, j))]
+
+    def pick_batch(self, start, n, j=0):
+        '''
+        The NumPy version of pick() for rows start .. start+n-1 .
+        '''
+        if self.sampler is None:
+            return self.random.choice_batch(start, n, j,
+                                            self.array_table()).tolist()
+        return self.array_table()[self.sampler.sample_batch(
+            self.random.bits_batch(start, n, j))].tolist()
+
+    def domain(self):
+        '''
+        Returns every (formatted) value the data set can take, in a
+        fixed order, or None if that is not a finite list .
+        '''
+        return None
+
+    def capacity(self):
+        '''
+        Returns the number of rows the data set can generate, None if
+        unlimited . Data sets with unique values are limited by the
+        size of their value space (see DataSetEvaluator.init_instances) .
+        '''
+        return None
+
+    def is_constant(self):
+        '''
+        True if value_at() returns the same value for every row and
+        every seed . Constant data sets are folded into the compiled
+        template (see DataSetEvaluator.precompute) .
+        '''
+        return self.table is not None and len(self.table) == 1
+
+    def value_kind(self):
+        '''
+        Returns the kind of the values in columns (see ColumnWriter):
+        'int', 'float', 'date' or 'string', None if only the values
+        tell .
+        '''
+        return 'string'
+
+    @abc.abstractmethod
+    def value_at(self, row):
+        '''
+        Returns the value of the data set at row (0 based) .
+        '''
+        return
+
+    def batch_at(self, start, n):
+        '''
+        Returns a list with the values of rows start .. start+n-1 .
+        Subclasses override this with a NumPy vectorized version when
+        NumPy is available .
+        '''
+        return [self.value_at(row) for row in xrange(start, start + n)]
+
+    def next_value(self):
+        value = self.value_at(self.row)
+        self.row += 1
+        return value
+
+    def next_batch(self, n):
+        '''
+        Returns a list with the next n values .
+        '''
+        values = self.batch_at(self.row, n)
+        self.row += n
+        return values
+
+    def seek(self, row):
+        '''
+        Positions the data set so that the next value is the one of
+        row (0 based) .
+        '''
+        self.row = row
+
+    def dependencies(self):
+        '''
+        Returns the names of the data sets this data set reads values
+        from . Only these and the data sets referenced by the template
+        are built (see DataSetEvaluator.init_instances) .
+        '''
+        return []
+
+    def link(self, instances, rows):
+        '''
+        Called after set_seed(), once the dependencies() are seeded and
+        linked, with the {name: data set} dictionary and the number of
+        rows of the run . Data sets with dependencies() look them up
+        here .
+        '''
+        pass
+
+    def key_pool(self, rows, escape=None):
+        '''
+        Returns the keys emitted by the first rows rows, for ForeignKey
+        data sets referencing this one, escaped for the literals quoted
+        by escape .
+        '''
+        return KeyRows(self, rows, escape)
+
+
+# ------------------------------------------------------------------------------
+class RandomNumber(AbstractDataSet):
+    '''
+    ds_dict will contain the following:
+            {
+                "name" : <string value>
+                "floating" : "<boolean value>" , (default False)
+                "min": "<integer value>",
+                "max": "<integer value>",
+                "distribution": "uniform" (default), "zipf", "normal",
+                                "exponential" or "weights"
+                "skew", "mean", "stddev", "weights": see DISTRIBUTION_FIELDS
+            }
+    Integers follow the distribution over the offsets from min, e.g.
+    with zipf min is the most frequent value, and mean is a value of
+    min .. max (default: the middle for normal, min + (max - min + 1) / 10
+    for exponential) . Floating values are uniform .
+    '''
+
+    __slots__ = ('floating', 'min', 'max', 'draw', 'draw_batch') + \
+        DISTRIBUTION_SLOTS
+    fields = (Field('floating', boolean, False), Field('min', int),
+              Field('max', int)) + DISTRIBUTION_FIELDS
+
+    @classmethod
+    def check(cls, values):
+        if values['min'] > values['max']:
+            return ['min is greater than max']
+        if values['distribution'] != 'uniform' and values['floating']:
+            return ['distribution requires floating="False"']
+        mean = values['mean']
+        if mean is not None and not values['min'] <= mean <= values['max']:
+            return ['mean is not in min .. max']
+        if values['distribution'] == 'exponential' and mean == values['min']:
+            return ['mean of the exponential distribution equals min']
+        return []
+
+    def build(self):
+        super(RandomNumber, self).build()
+        if not self.floating:
+            self.sampler = self.make_sampler(self.max - self.min + 1,
+                                             self.min)
+
+    def prepare(self):
+        if self.floating:
+            (self.draw, self.draw_batch) = (self.random.uniform,
+                                            self.random.uniform_batch)
+        else:
+            (self.draw, self.draw_batch) = (self.random.randint,
+                                            self.random.randint_batch)
+
+    def is_constant(self):
+        return self.min == self.max and not self.floating
+
+    def value_kind(self):
+        return 'float' if self.floating else 'int'
+
+    def value_at(self, row):
+        '''
+        Returns a random value based on in the ds_dict properties .
+        '''
+        if self.sampler is not None:
+            return self.min + self.sampler.sample(self.random.bits(row, 0))
+        return self.draw(row, 0, self.min, self.max)
+
+    def batch_at(self, start, n):
+        if not numpy:
+            return super(RandomNumber, self).batch_at(start, n)
+        if self.sampler is not None:
+            return (self.sampler.sample_batch(self.random.bits_batch(
+                start, n, 0)) + self.min).tolist()
+        return self.draw_batch(start, n, 0, self.min, self.max).tolist()
+
+
+# ------------------------------------------------------------------------------
+class LoremIpsum(AbstractDataSet):
+    '''
+    ds_dict will contain the following :
+        {
+            "name" : <string value>
+            "length" : "<integer value>"
+        }
+    '''
+
+    lorem_impsum = textwrap.dedent('''
+    Lorem ipsum dolor sit amet, consectetur adipiscing elit. Ut quis justo leo.
+    Quisque congue elit eu ante euismod ut aliquam nisi bibendum. Donec mollis
+    ipsum nec sapien auctor ut blandit ante aliquet. Fusce eget ante nunc.
+    Praesent ullamcorper neque sit amet diam scelerisque condimentum. Nulla
+    faucibus, justo non pretium consequat, tortor ligula consequat elit, vitae
+    dapibus orci metus eget nisl. Fusce ante ante, placerat et gravida ac,
+    fermentum eu nisl. Aenean posuere, orci vel dapibus adipiscing, ipsum dui
+    imperdiet dolor, eu rutrum lorem dolor id felis. Curabitur accumsan enim et
+    ipsum volutpat feugiat. Vivamus eget diam eros, in volutpat justo.
+    Curabitur bibendum, velit ac fermentum tincidunt, dui nulla volutpat nulla,
+    in ornare dui turpis ultrices dolor. Sed gravida suscipit arcu, ut
+    scelerisque augue aliquet non. Sed sagittis, turpis id ullamcorper rhoncus,
+    lorem nisi fringilla leo, et tristique odio augue id tortor. Integer
+    vehicula imperdiet nisl, eu ultrices neque condimentum eu. Ut sed purus
+    diam, eu euismod diam. Fusce eget venenatis arcu. Mauris porta, enim vel
+    pretium sagittis, ligula elit rutrum magna, sed pulvinar orci elit sit amet
+    leo. Pellentesque habitant morbi tristique senectus et netus et malesuada
+    fames ac turpis egestas.
+    ''').strip().replace('\n', '')
+
+    __slots__ = ('length', 'text')
+    fields = (Field('length', int),)
+
+    @classmethod
+    def check(cls, values):
+        if values['length'] < 0:
+            return ['length is negative']
+        return []
+
+    def build(self):
+        div = int(self.length / len(LoremIpsum.lorem_impsum))
+        mod = self.length % len(LoremIpsum.lorem_impsum)
+        self.text = div * LoremIpsum.lorem_impsum + \
+            LoremIpsum.lorem_impsum[:mod]
+        super(LoremIpsum, self).build()
+
+    def domain(self):
+        return [self.text]
+
+    def value_at(self, row):
+        '''
+        Returns a lorem ipsum text .
+        '''
+        return self.table[0]
+
+    def batch_at(self, start, n):
+        return [self.table[0]] * n
+
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+class PersonName(AbstractDataSet):
+    '''
+    ds_dict will contain the following :
+        {
+            "name" : <string value>
+            "firstname" : "<boolean value>", (default True)
+            "lastname" : "<boolean value>" (default True)
+            "distribution", ... : see DISTRIBUTION_FIELDS
+        }
+    '''
+
+    __slots__ = ('firstname', 'lastname') + DISTRIBUTION_SLOTS
+    fields = (Field('firstname', boolean, True),
+              Field('lastname', boolean, True)) + DISTRIBUTION_FIELDS
+
+    ''' Popular first names in 2010 '''
+    fname = ['Ava', 'Aaron', 'Agathe', 'Agnes', 'Alba', 'Alexander', 'Alexis',
+             'Alvaro', 'Andrew', 'Andrei', 'Angelina', 'Anthony', 'Anna', 'Ariana',
+             'Brian', 'Bogdan', 'Carmen', 'Cristopher', 'Connor', 'Daan',
+             'Daniel', 'David', 'Diego', 'Ella', 'Elizabeth', 'Elsa',
+             'Emma', 'Enzo', 'Ethan', 'Gabriel', 'Grace', 'Gustav',
+             'Isaac', 'Jacob', 'Javier', 'Jayden', 'John', 'Juliette',
+             'Kacper', 'Lars', 'Leah', 'Levi', 'Logan', 'Lotte', 'Lucas',
+             'Lieke', 'Linus', 'Lucia', 'Mateusz', 'Maxime', 'Melvin',
+             'Mia', 'Michael', 'Mikolaj', 'Milan', 'Natalie', 'Natalia',
+             'Olivia', 'Oscar', 'Pablo', 'Paul', 'Paula', 'Piotr', 'Quentin',
+             'Sarah', 'Samuel', 'Sophia', 'Sem', 'Szymon', 'Thijs', 'Teodore',
+             'Valeria', 'Valter', 'William', 'Wilma']
+
+    ''' Last names '''
+    lname = ['Abbott', 'Alcott', 'Antonescu', 'Bartok', 'Bayard', 'Banciu',
+             'Bethmann', 'Bergen', 'Botev', 'Brown', 'Bush', 'Corvinus',
+             'Chehachkov', 'Dimitrof', 'Dinev', 'Delano', 'Eisenhower', 'Enescu',
+             'Frels', 'Fugger', 'Gilman', 'Hancock', 'Hoza', 'Ionescu', 'Iordache',
+             'Kalish', 'Kafka', 'Krasniki', 'Lukasewicz', 'McCormick', 'Medici',
+             'Menier', 'Morgan', 'Palagyi', 'Parrocel', 'Romanov', 'Rozycki',
+             'Rufus', 'Olaru', 'Otis', 'Schoenberger', 'Strauss', 'Somoza',
+             'Sowinski', 'Szigete', 'Tessedik', 'Tisch', 'Vajda', 'Vlas',
+             'Walker', 'Warhola', 'Varchol', 'Wojnar', 'Zelenjcik']
+
+    def domain(self):
+        '''
+        Every name, e.g. all 75 * 54 first name / last name pairs .
+        '''
+        if self.firstname and self.lastname:
+            return [' ' + f + l for f in self.fname for l in self.lname]
+        elif self.firstname:
+            return self.fname
+        elif self.lastname:
+            return self.lname
+        return ['']
+
+    def value_at(self, row):
+        '''
+        Returns a random string based on ds_dict properties
+        '''
+        return self.pick(row)
+
+    def batch_at(self, start, n):
+        if not numpy:
+            return super(PersonName, self).batch_at(start, n)
+        return self.pick_batch(start, n)
+
+
+# ------------------------------------------------------------------------------
+class Sequence(AbstractDataSet):
+    '''
+     ds_dict will contain the following:
+        {
+            "name" : <string value>
+            "start" : "<integer value>", (default 1)
+            "increment" : "<integer value>" (default 1)
+        }
+    '''
+
+    __slots__ = ('start', 'increment')
+    fields = (Field('start', int, 1), Field('increment', int, 1))
+
+    def is_constant(self):
+        return self.increment == 0
+
+    def value_kind(self):
+        return 'int'
+
+    def value_at(self, row):
+        '''
+        Returns the row-th value in the sequence: start + row * increment
+        '''
+        return self.start + row * self.increment
+
+    def batch_at(self, start, n):
+        first = self.start + start * self.increment
+        if self.increment == 0:
+            return [first] * n
+        return list(range(first, first + n * self.increment, self.increment))
+
+    def key_pool(self, rows, escape=None):
+        return KeyRange(self.start, self.increment, rows)
+
+
+# -----------------------------------------------------------------------------
+class NumberSequence(AbstractDataSet):
+    '''
+     ds_dict will contain the following:
+        {
+            "name" : <string value>
+            "length" : "<integer value>",
+            "unique" : "<boolean value>" (default False)
+        }
+    With unique="True" no value is repeated: the last (up to 18)
+    digits are a Permutation of the row, the leading digits (if any)
+    are random . The first digit is never 0 .
+    '''
+
+    __slots__ = ('length', 'unique', 'width', 'permutation')
+    fields = (Field('length', int), Field('unique', boolean, False))
+
+    def build(self):
+        self.width = min(self.length, 18)
+        super(NumberSequence, self).build()
+
+    def prepare(self):
+        self.permutation = None
+        if self.unique and self.length > 0:
+            self.permutation = Permutation(self.random, self.capacity())
+
+    def capacity(self):
+        if not self.unique or self.length <= 0:
+            return None
+        if self.length <= 18:
+            return 9 * 10 ** (self.length - 1)
+        return 10 ** 18
+
+    def value_at(self, row):
+        if self.length <= 0:
+            return ''
+        if self.permutation is not None:
+            if self.width == self.length:
+                return str(10 ** (self.length - 1) + self.permutation(row))
+            unique = _digits(self.permutation(row), 10, self.width)
+        else:
+            unique = []
+        p = [str(self.random.randint(row, 0, 1, 9))]
+        p.extend(str(self.random.randint(row, i, 0, 9))
+                 for i in xrange(1, self.length - len(unique)))
+        p.extend(str(digit) for digit in unique)
+        p = ''.join(p)
+        return p
+
+    def batch_at(self, start, n):
+        if not numpy:
+            return super(NumberSequence, self).batch_at(start, n)
+        length = self.length
+        if length <= 0:
+            return [''] * n
+        codes = self.random.randint_batch(start, n, list(range(length)), 0, 9)
+        codes[:, 0] = self.random.randint_batch(start, n, 0, 1, 9)
+        if self.permutation is not None:
+            unique = self.permutation.batch(start, n)
+            if self.width == self.length:
+                unique += numpy.uint64(10 ** (self.length - 1))
+            codes[:, length - self.width:] = _digits_batch(unique, 10,
+                                                           self.width)
+        return _join_codes(codes.astype(numpy.uint8) + ord('0'))
+
+
+# ------------------------------------------------------------------------------
+class AlphaNumeric(AbstractDataSet):
+    '''
+     ds_dict will contain the following:
+        {
+            "name" : <string value>
+            "min_length" : <long value>
+            "max_length" : <long value>
+            "alphabet" : <boolean value> (default True)
+            "numeric" : <boolean value> (default True)
+            "unique" : <boolean value> (default False)
+        }
+    With unique="True" no value is repeated: the last characters of
+    every value (min_length of them, at most 62 bits worth) encode a
+    Permutation of the row, the characters before them are random .
+    The number of rows is then limited by the size of that suffix .
+    '''
+    alpha = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    number = "0123456789"
+
+    __slots__ = ('min_length', 'max_length', 'alphabet', 'numeric', 'unique',
+                 'lst', 'width', 'permutation')
+    fields = (Field('min_length', int), Field('max_length', int),
+              Field('alphabet', boolean, True), Field('numeric', boolean, True),
+              Field('unique', boolean, False))
+
+    @classmethod
+    def check(cls, values):
+        errors = []
+        if values['min_length'] < 0:
+            errors.append('min_length is negative')
+        if values['min_length'] > values['max_length']:
+            errors.append('min_length is greater than max_length')
+        if not values['alphabet'] and not values['numeric']:
+            errors.append('alphabet and numeric are both False')
+        return errors
+
+    def characters(self):
+        return (self.alpha if self.alphabet else '') + \
+            (self.number if self.numeric else '')
+
+    def suffix_width(self):
+        '''
+        Returns the length of the unique suffix: the widest of at most
+        min_length characters and 62 bits .
+        '''
+        size = len(self.characters())
+        width = 0
+        while width < self.min_length and size ** (width + 1) <= 1 << 62:
+            width += 1
+        return width
+
+    def build(self):
+        self.lst = self.characters()
+        self.width = self.suffix_width()
+        super(AlphaNumeric, self).build()
+
+    def prepare(self):
+        self.permutation = None
+        if self.unique:
+            self.permutation = Permutation(self.random, self.capacity())
+
+    def capacity(self):
+        if self.unique:
+            return len(self.characters()) ** self.suffix_width()
+        return None
+
+    def is_constant(self):
+        return self.max_length == 0
+
+    def value_at(self, row):
+        # draw 0 is the length, draws 1 .. length the characters
+        length = self.random.randint(row, 0, self.min_length, self.max_length)
+        if self.permutation is None:
+            return ''.join(self.random.choice(row, i, self.lst) for i in
+                           xrange(1, length + 1))
+        unique = _digits(self.permutation(row), len(self.lst), self.width)
+        return ''.join([self.random.choice(row, i, self.lst) for i in
+                        xrange(1, length - self.width + 1)] +
+                       [self.lst[digit] for digit in unique])
+
+    def batch_at(self, start, n):
+        if not numpy:
+            return super(AlphaNumeric, self).batch_at(start, n)
+        lst = self.lst
+        table = numpy.frombuffer(lst.encode('ascii'), dtype=numpy.uint8)
+        max_length = self.max_length
+        lengths = self.random.randint_batch(start, n, 0,
+                                            self.min_length, max_length)
+        idx = self.random.bits_batch(start, n,
+                                     list(range(1, max_length + 1)))
+        codes = table[(idx % numpy.uint64(len(lst))).astype(numpy.intp)]
+        if self.permutation is not None and self.width:
+            # the unique suffix ends at each row's length
+            unique = _digits_batch(self.permutation.batch(start, n),
+                                   len(lst), self.width)
+            columns = (lengths - self.width)[:, None] + \
+                numpy.arange(self.width)
+            codes[numpy.arange(n)[:, None], columns] = \
+                table[unique.astype(numpy.intp)]
+        # zero codes past each row's length are dropped by _join_codes()
+        codes[numpy.arange(max_length) >= lengths[:, None]] = 0
+        return _join_codes(codes)
+
+
+# ------------------------------------------------------------------------------
+class Date(AbstractDataSet):
+    '''
+     ds_dict will contain the following:
+        {
+            "name" : <string value>
+            "max_year" : "<int value>",
+            "min_year" : "<int value>"
+        }
+    Years are clamped to 1 .. 9999 . Up to max_table / 336 years, the
+    dates are drawn from a table of all the formatted dates .
+    '''
+
+    __slots__ = ('max_year', 'min_year')
+    fields = (Field('max_year', int), Field('min_year', int))
+
+    @classmethod
+    def check(cls, values):
+        if values['min_year'] > values['max_year']:
+            return ['min_year is greater than max_year']
+        return []
+
+    def build(self):
+        self.max_year = min(9999, self.max_year)
+        self.min_year = max(1, self.min_year)
+        super(Date, self).build()
+
+    def value_kind(self):
+        return 'date'
+
+    def domain(self):
+        if (self.max_year - self.min_year + 1) * 12 * 28 > self.max_table:
+            return None
+        return [datetime.date(year, month, day).isoformat()
+                for year in xrange(self.min_year, self.max_year + 1)
+                for month in xrange(1, 13) for day in xrange(1, 29)]
+
+    def value_at(self, row):
+        if self.table is not None:
+            return self.random.choice(row, 0, self.table)
+        dt = datetime.date(self.random.randint(row, 0, self.min_year, self.max_year),
+                           self.random.randint(row, 1, 1, 12),
+                           self.random.randint(row, 2, 1, 28))
+        return dt.isoformat()
+
+    def batch_at(self, start, n):
+        if not numpy:
+            return super(Date, self).batch_at(start, n)
+        if self.table is not None:
+            return self.random.choice_batch(start, n, 0,
+                                            self.array_table()).tolist()
+        year = self.random.randint_batch(start, n, 0, self.min_year,
+                                         self.max_year)
+        month = self.random.randint_batch(start, n, 1, 1, 12)
+        day = self.random.randint_batch(start, n, 2, 1, 28)
+        # YYYY-MM-DD built directly as ASCII codes
+        codes = numpy.empty((n, 10), dtype=numpy.uint8)
+        codes[:, 0] = year // 1000
+        codes[:, 1] = year // 100 % 10
+        codes[:, 2] = year // 10 % 10
+        codes[:, 3] = year % 10
+        codes[:, 5] = month // 10
+        codes[:, 6] = month % 10
+        codes[:, 8] = day // 10
+        codes[:, 9] = day % 10
+        codes += ord('0')
+        codes[:, 4] = codes[:, 7] = ord('-')
+        return _join_codes(codes)
+
+
+# ------------------------------------------------------------------------------
+class RandomFoodImage(AbstractDataSet):
+    '''
+    ds_dict will contain the following:
+        {
+            "name" : <string value>
+            "distribution", ... : see DISTRIBUTION_FIELDS
+        }
+    '''
+
+    ''' Random food images from Google '''
+    food_img_list = [
+        'http://cdn.playbuzz.com/cdn/89c9243a-e0cd-495e-90e0-11642327f13f/f4b834c8-a506-43f5-8c2c-3e125311275c_560_420.jpg',
+        'http://images2.fanpop.com/images/photos/5400000/Random-Food-random-5409310-1280-800.jpg',
+        'http://images4.fanpop.com/image/photos/23600000/creative-food-3-random-23639450-500-333.jpg',
+        'http://photos1.blogger.com/blogger/3914/618/1600/untitled1.JPG',
+        'http://www.hangukdrama.com/wp-content/uploads/2012/11/IMG_4526.jpg',
+        'http://images2.fanpop.com/images/photos/5400000/Random-Food-random-5409303-1280-800.jpg',
+        'http://40.media.tumblr.com/bbe6be2ef523c45a694cd570eb4d7deb/tumblr_inline_nocovf6iGQ1s9623o_500.jpg',
+        'https://images.rapgenius.com/ce46193adc445413cb49e35c0cefbb90.1000x669x1.jpg',
+        'http://stupiddope.com/wp-content/uploads/2014/04/gold-plated-grilled-cheese-sandwich-1.jpg',
+        'http://images2.fanpop.com/images/photos/5400000/Random-Food-random-5409295-1280-800.jpg',
+        'http://melissadreamsofsushi.com/wp-content/uploads/2013/11/IMG_3490.jpg',
+        'http://static.giantbomb.com/uploads/original/11/118908/2646473-6885497418-sicil.jpg',
+        'http://3.bp.blogspot.com/_VF64TeUDSR0/TSxboB_zruI/AAAAAAAAABY/rlNIAyYNS3E/s1600/bacon-wrapped-hot-dog-maple-bar.jpg',
+        'http://www.hungryhungryhippie.com/wp-content/uploads/2014/12/IMG_0887.jpg',
+        'http://2.bp.blogspot.com/-JRaJSeLq3Sw/Ui8FbMPm6yI/AAAAAAAAHh4/F_uZh6hrG2U/s1600/01+Candy+Show+Time.JPG']
+
+    __slots__ = DISTRIBUTION_SLOTS
+    fields = DISTRIBUTION_FIELDS
+
+    def domain(self):
+        return self.food_img_list
+
+    def value_at(self, row):
+        return self.pick(row)
+
+    def batch_at(self, start, n):
+        if not numpy:
+            return super(RandomFoodImage, self).batch_at(start, n)
+        return self.pick_batch(start, n)
+
+
+# ------------------------------------------------------------------------------
+class RandomIngredient(AbstractDataSet):
+    '''
+    ds_dict will contain the following:
+        {
+            "name" : <string value>
+            "result" : <string value>
+            "distribution", ... : see DISTRIBUTION_FIELDS
+        }
+    '''
+
+    ''' Random food ingredients '''
+    ingredient_type_list = ['curry powder', 'succotash', 'heavy cream', 'tofu', 'leeks', 'raw sugar',
+                            'cream of tartar', 'dried leeks', 'cranberries', 'pig\'s feet', 'lemon juice',
+                            'rabbits', 'peaches', 'black-eyed peas', 'onion powder', 'coriander', 'cannellini beans',
+                            'tortillas', 'chickpeas', 'green beans', 'wine', 'brandy', 'brown rice',
+                            'orange peels', 'cider vinegar', 'haddock', ' wine vinegar', 'spinach', 'amaretto',
+                            'chard', 'brunoise', 'oatmeal', 'navy beans', 'berries', 'cooking wine', 'corn syrup',
+                            'mmolasses', 'swiss cheese', 'thyme', 'breadfruit', 'pepper', 'hot sauce', 'potato chips',
+                            'cornmeal', 'plum tomatoes', 'graham crackers', 'apricot', 'quail', 'almond paste',
+                            'almonds', 'melons', 'mozzarella', 'cream', 'focaccia', 'bard', 'pasta', 'cabbage',
+                            'rosemary', 'crabs', 'pumpkins', 'oregano', 'bacon', 'milk', 'venison', 'pesto', 'sushi',
+                            'lettuce', 'cantaloupes', 'kale', 'eggs', 'shrimp', 'pinto beans', 'tomatoes',
+                            'tomato paste', 'celery seeds', 'garlic powder', 'chicken', 'lamb', 'barbecue sauce',
+                            'mushrooms', 'salt', 'chicory', 'flour', 'onion', 'coconut oil', 'olives', 'passion fruit',
+                            'pea beans', 'cheese', 'tartar sauce', 'pine nuts', 'lobsters', 'plums', 'yogurt',
+                            'oranges', 'corn', 'turkeys', 'ale', 'red beans', 'chestnuts', 'truffles', 'cheddar cheese',
+                            'basil', 'pickles', 'buttermilk', 'potatoes', 'butter', 'sour cream', 'tarragon',
+                            'pork', 'soy beans', 'rice', 'figs', 'salmon', 'hazelnuts', 'broccoli', 'margarine', 'eel',
+                            'parsley', 'sauerkraut', 'beef', 'liver', 'mackerel', 'prunes', 'maple syrup', 'apples',
+                            'granola', 'pears', 'water', 'ham', 'radishes', 'bagels', 'honey', 'steak', 'macaroni',
+                            'pineapples', 'squid', 'cherries', 'walnuts', 'fish sauce', 'cocoa powder',
+                            'brussel sprouts', 'garlic', 'ketchup', 'tonic water', 'ginger', 'tuna']
+
+    ''' Unit amounts '''
+    ingredient_unit_amt_list = ['1/2', '1/4', '1/5', '3/4', '1/16', '1/8', '3/8', '2/3', '1/6', '1', '2', '3', '4', '5',
+                                '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19', '20',
+                                '100', '140', '160', '200', '240', '300', '180', '220', '250', '280', '500', '450']
+
+    ''' Ingredient unit '''
+    ingredient_unit_list = ['teaspoon', 'tablespoon', 'cup', 'oz', 'quart', 'lb', 'cubic centimeter', 'cm', 'liter',
+                            'ml', 'gram', 'kg', 'pint', 'gallon', 'ounce']
+
+    __slots__ = ('result', 'pool') + DISTRIBUTION_SLOTS
+    fields = (Field('result', one_of('IngredientType', 'IngredientUnitAmt',
+                                     'IngredientUnit')),) + DISTRIBUTION_FIELDS
+
+    def build(self):
+        if self.result == 'IngredientType':
+            self.pool = self.ingredient_type_list
+        elif self.result == 'IngredientUnitAmt':
+            self.pool = self.ingredient_unit_amt_list
+        elif self.result == 'IngredientUnit':
+            self.pool = self.ingredient_unit_list
+        super(RandomIngredient, self).build()
+
+    def domain(self):
+        return self.pool
+
+    def value_at(self, row):
+        return self.pick(row)
+
+    def batch_at(self, start, n):
+        if not numpy:
+            return super(RandomIngredient, self).batch_at(start, n)
+        return self.pick_batch(start, n)
+
+
+# ------------------------------------------------------------------------------
+class MealType(AbstractDataSet):
+    '''
+    ds_dict will contain the following:
+        {
+            "name" : <string value>
+            "distribution", ... : see DISTRIBUTION_FIELDS
+        }
+    '''
+
+    ''' Valid food types '''
+    food_type_list = ['Breakfast', 'Lunch', 'Dinner']
+
+    __slots__ = DISTRIBUTION_SLOTS
+    fields = DISTRIBUTION_FIELDS
+
+    def domain(self):
+        return self.food_type_list
+
+    def value_at(self, row):
+        return self.pick(row)
+
+    def batch_at(self, start, n):
+        if not numpy:
+            return super(MealType, self).batch_at(start, n)
+        return self.pick_batch(start, n)
+
+
+# ------------------------------------------------------------------------------
+class KeyRange(object):
+    '''
+    The keys start, start + step, ... emitted by count rows of a Sequence,
+    in constant memory .
+    '''
+
+    __slots__ = ('start', 'step', 'count')
+
+    def __init__(self, start, step, count):
+        self.start = start
+        self.step = step
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.start + i * self.step
+
+    def take(self, idx):
+        '''
+        Returns the list of the keys at the indices of the int64 array idx .
+        '''
+        return (self.start + idx * self.step).tolist()
+
+    def value_kind(self):
+        return 'int'
+
+
+class KeyRows(object):
+    '''
+    The keys emitted by count rows of any other data set, source, taken
+    from source.value_at() row by row: nothing is stored . Keys rendered
+    in literals quoted differently from escape are escaped again .
+    '''
+
+    __slots__ = ('source', 'count', 'escape')
+
+    def __init__(self, source, count, escape=None):
+        self.source = source
+        self.count = count
+        self.escape = escape
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return requote_sql(self.source.value_at(i), self.source.escape,
+                           self.escape)
+
+    def take(self, idx):
+        # frequent keys (e.g. zipf) are looked up once
+        (rows, inverse) = numpy.unique(idx, return_inverse=True)
+        keys = [self[i] for i in rows.tolist()]
+        return [keys[i] for i in inverse.tolist()]
+
+    def value_kind(self):
+        return self.source.value_kind()
+
+
+class ParentRows(object):
+    '''
+    Maps the rows of a nested template to the rows of its parent that
+    render them (see TemplateNode) . count is the count of the nested
+    template: an integer, or the data set giving the count at every
+    parent row . The running totals of a data set count are kept every
+    span parent rows, and row by row for the last span used only: the
+    memory does not grow with the iterations .
+    '''
+
+    __slots__ = ('count', 'marks', 'first', 'ends')
+
+    span = 1 << 10
+
+    def __init__(self, count):
+        self.count = count
+        # marks[i]: the rows rendered by the parent rows before i * span
+        self.marks = array.array('l', [0])
+        # ends[j]: the rows rendered by the parent rows up to first + j
+        self.first = None
+        self.ends = None
+
+    def span_ends(self, i):
+        '''
+        Returns the running totals of the parent rows of span i .
+        '''
+        if self.first != i * self.span:
+            total = self.marks[i]
+            ends = []
+            for value in self.count.batch_at(i * self.span, self.span):
+                total += max(0, int(value))
+                ends.append(total)
+            (self.first, self.ends) = (i * self.span, ends)
+        return self.ends
+
+    def find_span(self, row):
+        '''
+        Returns the index of the span of the parent row of row .
+        '''
+        while self.marks[-1] <= row:
+            self.marks.append(self.span_ends(len(self.marks) - 1)[-1])
+        return bisect.bisect_right(self.marks, row) - 1
+
+    def __call__(self, row):
+        if not isinstance(self.count, AbstractDataSet):
+            return row // self.count
+        i = self.find_span(row)
+        return i * self.span + bisect.bisect_right(self.span_ends(i), row)
+
+    def batch(self, rows):
+        '''
+        The NumPy version of __call__() for the sorted int64 array rows .
+        '''
+        if not isinstance(self.count, AbstractDataSet):
+            return rows // self.count
+        if not len(rows):
+            return rows
+        self.find_span(int(rows[-1]))
+        marks = numpy.frombuffer(self.marks, dtype='i%d' %
+                                 self.marks.itemsize)
+        spans = numpy.searchsorted(marks, rows, 'right') - 1
+        parents = numpy.empty_like(rows)
+        bounds = [0] + (numpy.flatnonzero(numpy.diff(spans)) + 1).tolist() + \
+            [len(rows)]
+        for (low, high) in zip(bounds[:-1], bounds[1:]):
+            i = int(spans[low])
+            ends = numpy.array(self.span_ends(i), dtype=numpy.int64)
+            parents[low:high] = i * self.span + numpy.searchsorted(
+                ends, rows[low:high], 'right')
+        return parents
+
+
+class ForeignKey(AbstractDataSet):
+    '''
+    ds_dict will contain the following:
+        {
+            "name" : <string value>
+            "references" : <data set name>
+            "rows" : <integer value> (default: the iterations)
+            "only_emitted" : <boolean value> (default False)
+            "distribution", ... : see DISTRIBUTION_FIELDS
+        }
+    Values are keys emitted by the first rows rows of the referenced
+    data set: a KeyRange for a Sequence, a KeyRows for other types .
+    With only_emitted="True" the value of row k is one of the keys of
+    rows 0 .. k, i.e. of rows already written when the referencing
+    statement comes after the referenced one in the template, so the
+    output loads with foreign key checks enabled . In a nested template
+    they are the keys of the rows up to the ancestor row of row k that
+    renders the referenced data set (see owners), and in a job all the
+    keys of the other configuration, written first .
+    A distribution other than uniform skews the keys, e.g. with zipf
+    the first keys are the hot ones . With only_emitted it is
+    truncated to the keys already emitted (weights cannot be) .
+    In a job, references may be <config>.<data set>, a data set of
+    another configuration of the job (see KeySpace): rows defaults to
+    the iterations of that configuration .
+    '''
+
+    __slots__ = ('references', 'rows', 'only_emitted', 'keys', 'bounded',
+                 'owners') + DISTRIBUTION_SLOTS
+    fields = (Field('references', str), Field('rows', int, None),
+              Field('only_emitted', boolean, False)) + DISTRIBUTION_FIELDS
+
+    @classmethod
+    def check(cls, values):
+        if values['rows'] is not None and values['rows'] <= 0:
+            return ['rows is not positive']
+        if values['only_emitted'] and values['distribution'] == 'weights':
+            return ['only_emitted cannot be used with distribution="weights"']
+        return []
+
+    def dependencies(self):
+        return [self.references]
+
+    def prepare(self):
+        # the ParentRows from the rows of the key up to the rows of the
+        # template rendering the referenced data set, nearest first, set
+        # by the DataSetEvaluator
+        self.owners = ()
+
+    def link(self, instances, rows):
+        source = instances[self.references]
+        if self.rows is not None:
+            rows = self.rows
+        elif isinstance(source, ImportedKeys):
+            rows = source.iterations()
+        self.keys = source.key_pool(max(1, rows), self.escape)
+        self.sampler = self.make_sampler(len(self.keys))
+        self.bounded = self.only_emitted and \
+            not isinstance(source, ImportedKeys)
+
+    def value_kind(self):
+        return self.keys.value_kind()
+
+    def emitted(self, row):
+        '''
+        Returns how many rows of the referenced data set are written
+        before the value of row (with only_emitted) .
+        '''
+        for owners in self.owners:
+            row = owners(row)
+        return row + 1
+
+    def value_at(self, row):
+        count = len(self.keys)
+        if self.bounded:
+            count = min(count, self.emitted(row))
+        if self.sampler is not None:
+            return self.keys[self.sampler.sample(self.random.bits(row),
+                                                 count)]
+        return self.keys[self.random.bits(row) % count]
+
+    def batch_at(self, start, n):
+        if not numpy:
+            return super(ForeignKey, self).batch_at(start, n)
+        bits = self.random.bits_batch(start, n)
+        if self.bounded:
+            rows = numpy.arange(start, start + n, dtype=numpy.int64)
+            for owners in self.owners:
+                rows = owners.batch(rows)
+            counts = numpy.minimum(rows + 1, len(self.keys))
+        else:
+            counts = None
+        if self.sampler is not None:
+            return self.keys.take(self.sampler.sample_batch(bits, counts))
+        if counts is None:
+            counts = numpy.uint64(len(self.keys))
+        else:
+            counts = counts.astype(numpy.uint64)
+        return self.keys.take((bits % counts).astype(numpy.int64))
+
+
+# ------------------------------------------------------------------------------
+def parse_date(value):
+    '''
+    Returns the datetime.date of a YYYY-MM-DD string .
+    '''
+    return datetime.date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+
+
+# The functions of Expression data sets (besides randint and uniform)
+EXPRESSION_FUNCTIONS = {
+    'lower': lambda value: value.lower(),
+    'upper': lambda value: value.upper(),
+    'title': lambda value: value.title(),
+    'strip': lambda value: value.strip(),
+    'substr': lambda value, start, length: value[start:start + length],
+    'str': str, 'int': int, 'float': float, 'len': len, 'abs': abs,
+    'min': min, 'max': max, 'round': round,
+    'days': lambda n: datetime.timedelta(days=n),
+    'date': parse_date,
+}
+# The functions drawing a random number, compiled with the row and a draw
+# index of their own as first arguments (see CounterRandom)
+EXPRESSION_DRAWS = ('randint', 'uniform')
+
+# "<operand> days" is days(<operand>), string literals are left alone
+_DAYS_SUFFIX = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|"""
+                          r"""(\w+\s*\([^()]*\)|\b\w+)\s+days\b""")
+
+
+class ExpressionCompiler(ast.NodeTransformer):
+    '''
+    Compiles the text of an Expression into the code of a function
+    lambda row, value_0, value_1, ... returning its value, where value_i
+    is the value of the data set names[i] at row .
+    Only arithmetic, comparisons, and/or/not, x if c else y, literals,
+    data set names and calls to the known functions are accepted .
+    '''
+
+    allowed = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp,
+               ast.Compare, ast.IfExp, ast.Call, ast.Name, ast.Num, ast.Str,
+               ast.Load, ast.operator, ast.unaryop, ast.boolop, ast.cmpop)
+    constants = ('True', 'False', 'None')
+
+    def __init__(self):
+        self.names = []
+        self.draws = 0
+
+    @staticmethod
+    def parse(text):
+        '''
+        Returns the syntax tree of the expression text . Raises ValueError
+        if text is not a Python expression .
+        '''
+        source = _DAYS_SUFFIX.sub(
+            lambda m: m.group(1) or 'days(%s)' % m.group(2), text.strip())
+        try:
+            return ast.parse(source, mode='eval')
+        except SyntaxError:
+            raise ValueError('invalid syntax in \'%s\'' % text)
+
+    def compile(self, text):
+        '''
+        Returns the code object of the function . Raises ValueError if
+        text is not a valid expression .
+        '''
+        body = self.visit(self.parse(text).body)
+        params = [ast.Name(id='_row', ctx=ast.Param())] + \
+            [ast.Name(id='_v%d' % i, ctx=ast.Param())
+             for i in xrange(len(self.names))]
+        function = ast.Lambda(args=ast.arguments(args=params, vararg=None,
+                                                 kwarg=None, defaults=[]),
+                              body=body)
+        tree = ast.fix_missing_locations(ast.Expression(body=function))
+        return compile(tree, '<expression>', 'eval')
+
+    def generic_visit(self, node):
+        if not isinstance(node, self.allowed):
+            raise ValueError('%s is not supported' % type(node).__name__)
+        return super(ExpressionCompiler, self).generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id in self.constants:
+            return node
+        if node.id in EXPRESSION_FUNCTIONS or node.id in EXPRESSION_DRAWS:
+            raise ValueError('function %s() is not called' % node.id)
+        if node.id not in self.names:
+            self.names.append(node.id)
+        return ast.copy_location(
+            ast.Name(id='_v%d' % self.names.index(node.id), ctx=ast.Load()),
+            node)
+
+    def visit_Call(self, node):
+        name = getattr(node.func, 'id', None)
+        if name not in EXPRESSION_FUNCTIONS and name not in EXPRESSION_DRAWS:
+            raise ValueError('unknown function %s()' %
+                             (name or type(node.func).__name__))
+        if node.keywords or node.starargs or node.kwargs:
+            raise ValueError('%s() only takes positional arguments' % name)
+        args = [self.visit(arg) for arg in node.args]
+        if name in EXPRESSION_DRAWS:
+            if len(args) != 2:
+                raise ValueError('%s() takes 2 arguments' % name)
+            args = [ast.Name(id='_row', ctx=ast.Load()),
+                    ast.Num(n=self.draws)] + args
+            self.draws += 1
+        return ast.copy_location(
+            ast.Call(func=ast.Name(id='_' + name, ctx=ast.Load()), args=args,
+                     keywords=[], starargs=None, kwargs=None), node)
+
+
+class ExpressionTypes(ast.NodeVisitor):
+    '''
+    Infers the type of the value of an expression accepted by
+    ExpressionCompiler from the kinds of the data sets it reads, kinds
+    ({name: kind}, see AbstractDataSet.value_kind), without evaluating
+    it . Types are 'number', 'string', 'date', 'days' (a timedelta) or
+    None when unknown, which goes with any type . check() raises
+    ValueError on an operation or a call the types do not support .
+    '''
+
+    types = {'int': 'number', 'float': 'number', 'date': 'date',
+             'string': 'string'}
+
+    # {function: (minimum arguments, types of the arguments, type of the
+    # value)}, None standing for any type (min and max: see visit_Call)
+    functions = {
+        'lower': (1, ('string',), 'string'),
+        'upper': (1, ('string',), 'string'),
+        'title': (1, ('string',), 'string'),
+        'strip': (1, ('string',), 'string'),
+        'substr': (3, ('string', 'number', 'number'), 'string'),
+        'str': (1, (None,), 'string'),
+        'int': (1, (None,), 'number'),
+        'float': (1, (None,), 'number'),
+        'len': (1, ('string',), 'number'),
+        'abs': (1, ('number',), 'number'),
+        'round': (1, ('number', 'number'), 'number'),
+        'days': (1, ('number',), 'days'),
+        'date': (1, ('string',), 'date'),
+        'randint': (2, ('number', 'number'), 'number'),
+        'uniform': (2, ('number', 'number'), 'number'),
+    }
+
+    # {(operator, left type, right type): type}, operators on numbers
+    # giving numbers besides
+    operations = {
+        ('Add', 'string', 'string'): 'string',
+        ('Add', 'date', 'days'): 'date', ('Add', 'days', 'date'): 'date',
+        ('Add', 'days', 'days'): 'days', ('Sub', 'date', 'days'): 'date',
+        ('Sub', 'date', 'date'): 'days', ('Sub', 'days', 'days'): 'days',
+        ('Mult', 'string', 'number'): 'string',
+        ('Mult', 'number', 'string'): 'string',
+        ('Mult', 'days', 'number'): 'days',
+        ('Mult', 'number', 'days'): 'days',
+        ('Div', 'days', 'number'): 'days',
+        ('FloorDiv', 'days', 'number'): 'days',
+    }
+
+    symbols = {'Add': '+', 'Sub': '-', 'Mult': '*', 'Div': '/',
+               'FloorDiv': '//', 'Mod': '%', 'Pow': '**'}
+
+    def __init__(self, kinds):
+        self.kinds = kinds
+
+    def check(self, text):
+        '''
+        Returns the type of the value of the expression text .
+        '''
+        return self.visit(ExpressionCompiler.parse(text).body)
+
+    @staticmethod
+    def common(types):
+        types = set(types)
+        return types.pop() if len(types) == 1 else None
+
+    def visit_Num(self, node):
+        return 'number'
+
+    def visit_Str(self, node):
+        return 'string'
+
+    def visit_Name(self, node):
+        if node.id in ('True', 'False'):
+            return 'number'
+        return self.types.get(self.kinds.get(node.id))
+
+    def visit_BinOp(self, node):
+        (left, right) = (self.visit(node.left), self.visit(node.right))
+        operator = type(node.op).__name__
+        if left is None or right is None:
+            return None
+        if (operator, left, right) in self.operations:
+            return self.operations[(operator, left, right)]
+        if left == right == 'number':
+            return 'number'
+        if operator == 'Mod' and left == 'string':
+            return 'string'
+        raise ValueError('unsupported operand types for %s: %s and %s' %
+                         (self.symbols.get(operator, operator), left, right))
+
+    def visit_UnaryOp(self, node):
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.Not):
+            return 'number'
+        if operand in (None, 'number') or \
+                operand == 'days' and not isinstance(node.op, ast.Invert):
+            return operand
+        raise ValueError('bad operand type for unary %s: %s' %
+                         (type(node.op).__name__, operand))
+
+    def visit_BoolOp(self, node):
+        return self.common(self.visit(value) for value in node.values)
+
+    def visit_Compare(self, node):
+        for operand in [node.left] + node.comparators:
+            self.visit(operand)
+        return 'number'
+
+    def visit_IfExp(self, node):
+        self.visit(node.test)
+        return self.common((self.visit(node.body), self.visit(node.orelse)))
+
+    def visit_Call(self, node):
+        name = node.func.id
+        types = [self.visit(arg) for arg in node.args]
+        if name in ('min', 'max'):
+            if not types:
+                raise ValueError('%s() takes at least 1 argument' % name)
+            return self.common(types)
+        (minimum, expected, result) = self.functions[name]
+        if not minimum <= len(types) <= len(expected):
+            raise ValueError('%s() takes %s argument%s' % (
+                name, minimum if minimum == len(expected) else
+                '%d to %d' % (minimum, len(expected)),
+                '' if len(expected) == 1 else 's'))
+        for (i, (found, wanted)) in enumerate(zip(types, expected)):
+            if None not in (found, wanted) and found != wanted:
+                raise ValueError('argument %d of %s() is a %s, not a %s' %
+                                 (i + 1, name, found, wanted))
+        return result
+
+
+class Expression(AbstractDataSet):
+    '''
+    ds_dict will contain the following:
+        {
+            "name" : <string value>
+            "expression" : <expression>
+        }
+    A value computed from the values of other data sets at the same
+    row, e.g. start_date + randint(30, 365) days or
+    lower(firstname) + '.' + lower(lastname) .
+    Names are data sets, the functions are EXPRESSION_FUNCTIONS and
+    randint(a, b) / uniform(a, b), a draw of their own per row each .
+    "n days" is days(n) . Date values are datetime.date objects, dates
+    are formatted back to YYYY-MM-DD .
+    The expression is parsed and compiled to a Python function once
+    (see ExpressionCompiler), the data sets it reads are evaluated
+    before it (see AbstractDataSet.dependencies) . The types of its
+    operations are checked against the kinds of these data sets when
+    they are linked (see ExpressionTypes), nothing is evaluated .
+    '''
+
+    __slots__ = ('expression', 'names', 'code', 'function', 'inputs')
+    fields = (Field('expression', str),)
+
+    @classmethod
+    def check(cls, values):
+        try:
+            ExpressionCompiler().compile(values['expression'])
+        except ValueError as err:
+            return ['expression: %s' % err]
+        return []
+
+    def __init__(self, ds_dict):
+        super(Expression, self).__init__(ds_dict)
+        self.compile()
+
+    def compile(self):
+        compiler = ExpressionCompiler()
+        self.code = compiler.compile(self.expression)
+        self.names = compiler.names
+        self.inputs = []
+
+    def build(self):
+        # unpickled expressions (see ConfigCache) are compiled again
+        if getattr(self, 'code', None) is None:
+            self.compile()
+        super(Expression, self).build()
+
+    def prepare(self):
+        namespace = {'_' + name: function
+                     for (name, function) in EXPRESSION_FUNCTIONS.items()}
+        namespace['_randint'] = self.random.randint
+        namespace['_uniform'] = self.random.uniform
+        namespace['__builtins__'] = {}
+        self.function = eval(self.code, namespace)
+
+    def dependencies(self):
+        return list(self.names)
+
+    def value_kind(self):
+        return None
+
+    def link(self, instances, rows):
+        # (data set, its quote, conversion of its values) per argument
+        self.inputs = []
+        for name in self.names:
+            instance = instances[name]
+            convert = parse_date if isinstance(instance, Date) else None
+            self.inputs.append((instance, instance.escape, convert))
+        # type errors show up here rather than mid-output
+        kinds = {name: instances[name].value_kind() for name in self.names}
+        try:
+            ExpressionTypes(kinds).check(self.expression)
+        except ValueError as err:
+            raise ConfigError(['Invalid data set \'%s\' (Expression): '
+                               '\'%s\': %s .' %
+                               (self.name, self.expression, err)])
+
+    def finish(self, value):
+        if isinstance(value, datetime.date):
+            return value.isoformat()
+        if self.escape:
+            return escape_sql(value, self.escape)
+        return value
+
+    def value_at(self, row):
+        args = []
+        for (instance, quote, convert) in self.inputs:
+            value = instance.value_at(row)
+            if quote:
+                value = unescape_sql(value, quote)
+            if convert is not None:
+                value = convert(value)
+            args.append(value)
+        return self.finish(self.function(row, *args))
+
+    def batch_at(self, start, n):
+        columns = []
+        for (instance, quote, convert) in self.inputs:
+            column = instance.batch_at(start, n)
+            if quote:
+                column = [unescape_sql(value, quote) for value in column]
+            if convert is not None:
+                column = [convert(value) for value in column]
+            columns.append(column)
+        (function, finish) = (self.function, self.finish)
+        rows = xrange(start, start + n)
+        if not columns:
+            return [finish(function(row)) for row in rows]
+        return [finish(function(row, *args))
+                for (row, args) in zip(rows, zip(*columns))]
+
+
+# ------------------------------------------------------------------------------
+class Requoted(object):
+    '''
+    Stands in DataSetEvaluator.instances for the data set dataset where
+    the template renders it in literals quoted with quote, other than
+    the quote its values are escaped for (see
+    DataSetEvaluator.check_quotes): the values of dataset, escaped for
+    quote instead . dataset is seeded and linked on its own .
+    '''
+
+    def __init__(self, dataset, quote):
+        self.dataset = dataset
+        self.name = dataset.name + quote
+        self.escape = quote
+        self.table = None
+        self.row = 0
+
+    def dependencies(self):
+        return [self.dataset.name]
+
+    def capacity(self):
+        # checked on dataset
+        return None
+
+    def is_constant(self):
+        return self.dataset.is_constant()
+
+    def value_kind(self):
+        return self.dataset.value_kind()
+
+    def set_escape(self, quote):
+        pass
+
+    def set_seed(self, seed):
+        pass
+
+    def link(self, instances, rows):
+        pass
+
+    def value_at(self, row):
+        return requote_sql(self.dataset.value_at(row), self.dataset.escape,
+                           self.escape)
+
+    def batch_at(self, start, n):
+        (escape, quote) = (self.dataset.escape, self.escape)
+        return [requote_sql(value, escape, quote)
+                for value in self.dataset.batch_at(start, n)]
+
+    def next_value(self):
+        value = self.value_at(self.row)
+        self.row += 1
+        return value
+
+    def next_batch(self, n):
+        values = self.batch_at(self.row, n)
+        self.row += n
+        return values
+
+    def seek(self, row):
+        self.row = row
+
+
+# ------------------------------------------------------------------------------
+class DataSetBuilder(object):
+    '''
+    Returns a new instance of a data set based on
+    subclass name (see @get_name function)
+    '''
+
+    def __init__(self):
+        '''
+        __classes will be a dictionary of AbstractDataSet subclasses
+        in the following form:
+        {
+            <__classname__1>:<__class_object__1>,
+            <__classname__2>:<__class_object__2>,
+            ...
+        }
+        '''
+        # @PydevCodeAnalysisIgnore
+        self.classes = {c.__name__: c for c in \
+                        AbstractDataSet.__subclasses__()}
+
+    def new(self, name, ds_dict):
+        '''
+        Returns the instance of the class based on class name .
+        Every object instantiated with this method will be instances
+        of AbstractDataSet subclasses .
+        '''
+        return self.classes[name](ds_dict)
+
+
+# ------------------------------------------------------------------------------
+class CompiledTemplate(object):
+    '''
+    A template parsed once into literal segments and slot indices .
+    Every #{data_set_name} placeholder becomes a positional field of
+    a str.format() string, so rendering a row is a single format call
+    over the values of the referenced data sets (see @names) .
+    '''
+
+    # #{word} or #{parent.word} not preceded by another '#' ('##{word}' is
+    # left untouched)
+    regex = re.compile(r'(?:^|(?<=[^#]))#{((?:parent\.)*\w+)}')
+
+    def __init__(self, text):
+        '''
+        Splits text into literals and slots .
+        '''
+        self.text = text
+        literals = []
+        keys = []
+        pos = 0
+        for matchobj in self.regex.finditer(text):
+            literals.append(text[pos:matchobj.start()])
+            keys.append(matchobj.group(1))
+            pos = matchobj.end()
+        literals.append(text[pos:])
+        self.set_parts(literals, keys)
+
+    def set_parts(self, literals, keys):
+        '''
+        literals[i] is followed by the value of the data set keys[i] .
+        '''
+        # unique data set names, in order of first appearance
+        self.names = []
+        # literals[i] is followed by the value of names[slots[i]]
+        self.literals = literals
+        self.slots = []
+        index = {}
+        for key in keys:
+            if key not in index:
+                index[key] = len(self.names)
+                self.names.append(key)
+            self.slots.append(index[key])
+
+        # str.format() string with the literal braces escaped
+        parts = []
+        for (literal, slot) in zip(self.literals, self.slots):
+            parts.append(self.escape(literal))
+            parts.append('{%d}' % slot)
+        parts.append(self.escape(self.literals[-1]))
+        self.fmt = ''.join(parts)
+
+    @staticmethod
+    def escape(literal):
+        return literal.replace('{', '{{').replace('}', '}}')
+
+    def quotes(self):
+        '''
+        Scans the SQL quoting of the template text . Returns (quotes,
+        line): quotes[i] is the quote (' " or `) of the literal the i-th
+        placeholder is in, None if it is not in a literal, and line is
+        None if every quote is closed, otherwise the line where the
+        quote left open starts (or the first line a literal does not
+        end on, which is usually the culprit) . -- comments are skipped .
+        '''
+        text = self.text
+        starts = [matchobj.start() for matchobj in self.regex.finditer(text)]
+        quotes = []
+        quote = None
+        (opened, unended) = (None, None)
+        pos = 0
+        while pos < len(text):
+            while len(quotes) < len(starts) and starts[len(quotes)] <= pos:
+                quotes.append(quote)
+            char = text[pos]
+            if quote:
+                if char == '\\' and quote != '`':
+                    pos += 1
+                elif char == quote:
+                    if text.startswith(quote, pos + 1):
+                        pos += 1
+                    else:
+                        quote = None
+                elif char == '\n' and unended is None:
+                    unended = opened
+            elif char in '\'"`':
+                (quote, opened) = (char, pos)
+            elif text.startswith('--', pos):
+                pos = text.find('\n', pos)
+                if pos < 0:
+                    break
+            pos += 1
+        quotes.extend([quote] * (len(starts) - len(quotes)))
+        if quote is None:
+            return (quotes, None)
+        if unended is not None:
+            opened = unended
+        start = text.rfind('\n', 0, opened) + 1
+        end = text.find('\n', opened)
+        return (quotes, text[start:end if end >= 0 else len(text)].strip())
+
+    def render(self, values):
+        '''
+        Returns the template filled with values, a sequence aligned
+        with @names .
+        '''
+        return self.fmt.format(*values)
+
+    def fold(self, constants):
+        '''
+        Returns a copy of the template where the data sets of the
+        constants dictionary ({name: value}) are replaced by their
+        value, merged with the surrounding literals .
+        '''
+        literals = [self.literals[0]]
+        keys = []
+        for (slot, literal) in zip(self.slots, self.literals[1:]):
+            key = self.names[slot]
+            if key in constants:
+                literals[-1] += '{0}'.format(constants[key]) + literal
+            else:
+                keys.append(key)
+                literals.append(literal)
+        folded = CompiledTemplate.__new__(CompiledTemplate)
+        folded.text = self.text
+        folded.set_parts(literals, keys)
+        return folded
+
+
+# ------------------------------------------------------------------------------
+class TemplateNode(object):
+    '''
+    A <template> element . Its text is split by the nested <template>
+    elements (the children) into segments, one CompiledTemplate each:
+    a row renders segments[0], the rows of children[0], segments[1],
+    and so on .
+    A child is rendered count times per row of its parent, count being
+    an integer or the name of a data set evaluated at the parent row .
+    The rows of a child are numbered across all the parent rows (a
+    Sequence in a child template numbers the child rows) and row is the
+    next one to render . A #{parent.name} placeholder is the value of
+    the data set name at the parent row, #{parent.parent.name} at the
+    grandparent row, ...
+    folded holds the names of the data sets read at level 0 (or counting
+    the children) that were folded into the segments as constants .
+    '''
+
+    __slots__ = ('segments', 'refs', 'children', 'count', 'depth', 'row',
+                 'folded')
+
+    def __init__(self, segments, children, count=None, depth=0):
+        self.segments = segments
+        self.children = children
+        self.count = count
+        self.depth = depth
+        self.row = 0
+        self.folded = set()
+        self.set_refs()
+
+    def set_refs(self):
+        '''
+        refs[i] lists the (ancestor level, data set name) pairs of
+        segments[i].names, level 0 being this template .
+        '''
+        self.refs = [[self.split_ref(key) for key in segment.names]
+                     for segment in self.segments]
+
+    @staticmethod
+    def split_ref(key):
+        '''
+        'parent.parent.name' -> (2, 'name')
+        '''
+        level = 0
+        while key.startswith('parent.'):
+            level += 1
+            key = key[len('parent.'):]
+        return (level, key)
+
+    def walk(self):
+        '''
+        Yields this template and its descendants .
+        '''
+        yield self
+        for child in self.children:
+            for node in child.walk():
+                yield node
+
+    def dataset_names(self):
+        '''
+        Returns the names of the data sets the template reads, at any
+        level, including its count .
+        '''
+        names = [name for refs in self.refs for (level, name) in refs]
+        if isinstance(self.count, str):
+            names.append(self.count)
+        return names
+
+
+# ------------------------------------------------------------------------------
+class InsertStatement(object):
+    '''
+    An INSERT INTO table(columns) VALUES (values); statement of a
+    template . values are the texts of the value expressions, with their
+    #{...} placeholders .
+    In record mode (see DataSetEvaluator.use_records) a statement renders
+    a record: RECORD, its index and a UNIT before every value, which the
+    bulk-load writers (see BatchedInsertWriter, TableFileWriter) split .
+    '''
+
+    __slots__ = ('table', 'columns', 'table_text', 'columns_text', 'values')
+
+    RECORD = '\x1e'
+    UNIT = '\x1f'
+
+    regex = re.compile(r'INSERT\s+INTO\s+([^\s(]+)\s*\(([^)]*)\)\s*VALUES\s*\(',
+                       re.IGNORECASE)
+    # escapes of escape_sql() in a quoted literal: \x or a doubled quote
+    unescape = re.compile(r'\\(.)|([\'"])\2', re.DOTALL)
+    # text allowed between the statements: blanks and -- comments
+    blank = re.compile(r'\s*(?:--[^\n]*\s*)*$')
+
+    def __init__(self, table_text, columns_text, values):
+        self.table_text = table_text
+        self.columns_text = columns_text
+        self.values = values
+        self.table = table_text.strip('`"[]')
+        self.columns = [column.strip().strip('`"[]')
+                        for column in columns_text.split(',')]
+
+    @classmethod
+    def parse(cls, text):
+        '''
+        Returns the (statements, errors) of text, every piece of text
+        that is not an INSERT statement, a blank or a comment being an
+        error .
+        '''
+        statements = []
+        errors = []
+        pos = 0
+        while True:
+            matchobj = cls.regex.search(text, pos)
+            end = matchobj.start() if matchobj else len(text)
+            if not cls.blank.match(text, pos, end):
+                errors.append('Template text outside of INSERT statements: '
+                              '\'%s\' .' % ' '.join(text[pos:end].split()))
+            if matchobj is None:
+                return (statements, errors)
+            (values, pos) = cls.split_values(text, matchobj.end())
+            statement = cls(matchobj.group(1), matchobj.group(2), values)
+            tail = re.compile(r'\s*;').match(text, pos)
+            if values is None or tail is None:
+                errors.append('Unsupported INSERT INTO %s statement: a single '
+                              'row of values followed by \';\' is expected .'
+                              % statement.table)
+                return (statements, errors)
+            if len(values) != len(statement.columns):
+                errors.append('INSERT INTO %s: %d columns but %d values .' %
+                              (statement.table, len(statement.columns),
+                               len(values)))
+            statements.append(statement)
+            pos = tail.end()
+
+    @staticmethod
+    def split_values(text, pos):
+        '''
+        Splits the values of the tuple starting at text[pos] (after its
+        opening parenthesis) on the commas outside of quotes and nested
+        parentheses . Returns (values, position after the closing
+        parenthesis), values being None if the tuple is not closed .
+        '''
+        values = []
+        start = pos
+        depth = 0
+        quote = None
+        while pos < len(text):
+            char = text[pos]
+            if quote:
+                if char == '\\':
+                    pos += 1
+                elif char == quote:
+                    quote = None
+            elif char in '\'"`':
+                quote = char
+            elif char == '(':
+                depth += 1
+            elif char == ')' and depth:
+                depth -= 1
+            elif char == ')' or (char == ',' and not depth):
+                values.append(text[start:pos].strip())
+                if char == ')':
+                    return (values, pos + 1)
+                start = pos + 1
+            pos += 1
+        return (None, pos)
+
+    def record(self, index):
+        '''
+        Returns the template text of the record of this statement .
+        '''
+        return self.RECORD + str(index) + ''.join(self.UNIT + value for
+                                                  value in self.values)
+
+    @staticmethod
+    def literal(value):
+        '''
+        Returns the value of a rendered SQL literal: the text of a quoted
+        string, None for NULL and the text of anything else .
+        '''
+        if len(value) > 1 and value[0] == value[-1] and value[0] in '\'"':
+            return InsertStatement.unescape.sub(
+                lambda matchobj: matchobj.group(1) or matchobj.group(2),
+                value[1:-1])
+        if value.upper() == 'NULL':
+            return None
+        return value
+
+    @classmethod
+    def split_records(cls, text):
+        '''
+        Yields the (statement index, values) records of rendered text .
+        '''
+        for record in text.split(cls.RECORD)[1:]:
+            values = record.split(cls.UNIT)
+            yield (int(values[0]), values[1:])
+
+
+# ------------------------------------------------------------------------------
+class RowValues(dict):
+    '''
+    The values of the data sets at one row . A value is computed on
+    first use and reused when the data set appears more than once in
+    the row .
+    '''
+
+    def __init__(self, instances, row):
+        super(RowValues, self).__init__()
+        self.instances = instances
+        self.row = row
+
+    def __missing__(self, key):
+        value = self[key] = self.instances[key].value_at(self.row)
+        return value
+
+
+# ------------------------------------------------------------------------------
+class DataSetEvaluator(object):
+    # Written before every checkpoint-th row (see @iter_output) so that an
+    # interrupted run can be resumed (see find_checkpoint)
+    checkpoint_marker = '-- pysert:checkpoint row=%d seed=%d every=%d\n'
+
+    def __init__(self, xml_filename, seed=None, records=False, key_space=None,
+                 overrides=None):
+        '''
+        Raises ConfigError listing every problem of the XML file if it
+        is not a valid generator configuration .
+        If records is True, the output is made of the records of the
+        INSERT statements of the template (see @use_records) .
+        key_space, a KeySpace, resolves the <config>.<data set> names
+        referenced by the data sets of a job . overrides is a list of
+        data set attribute dictionaries replacing the data sets of the
+        XML file of the same name .
+        '''
+        # Build element tree
+        self.__elem_tree = ElementTree()
+        self.__elem_tree.parse(xml_filename)
+
+        # Initialize class attributes
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(32)
+        self.row = 0
+        # Problems found while loading the configuration
+        self.errors = []
+        self.iterations = self.init_iterations()
+        self.template = self.init_template()
+        self.specs = self.init_specs(overrides or [])
+        # {data set name: quote of the literals it is rendered in}
+        self.quotes = {}
+        # {name + quote: (data set name, quote)} of the data sets also
+        # rendered in literals quoted otherwise (see Requoted)
+        self.requoted = {}
+        self.root = self.compile_template(self.template)
+        self.statements = None
+        if records and not self.errors:
+            self.statements = self.use_records()
+        if self.errors:
+            raise ConfigError(self.errors)
+        self.instances = self.init_instances(key_space)
+        self.owner_nodes = self.init_owners()
+        self.set_seed(seed)
+        self.check_rows(0, self.iterations)
+        self.precompute()
+
+    @classmethod
+    def load(cls, xml_filename, seed=None, records=False, cache=None,
+             key_space=None, overrides=None):
+        '''
+        Returns a DataSetEvaluator for xml_filename (see __init__) . If
+        cache, a ConfigCache, holds one compiled from the same XML (and
+        options), it is only seeded: the XML is neither parsed nor
+        validated again . Otherwise the new evaluator is stored in cache .
+        '''
+        if cache is None:
+            return cls(xml_filename, seed, records, key_space, overrides)
+        f = open(xml_filename, 'rb')
+        try:
+            key = cache.key(f.read(), (
+                records, key_space.names() if key_space else [],
+                sorted(sorted(override.items())
+                       for override in overrides or [])))
+        finally:
+            f.close()
+        evaluator = cache.load(key)
+        if evaluator is None:
+            evaluator = cls(xml_filename, seed, records, key_space, overrides)
+            cache.save(key, evaluator)
+            return evaluator
+        for instance in evaluator.instances.values():
+            if isinstance(instance, ImportedKeys):
+                instance.key_space = key_space
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(32)
+        evaluator.set_seed(seed)
+        # the rows of the nested templates depend on the seed
+        evaluator.check_rows(0, evaluator.iterations)
+        return evaluator
+
+    def __getstate__(self):
+        # the parsed XML is only read while loading
+        state = self.__dict__.copy()
+        state.pop('_DataSetEvaluator__elem_tree', None)
+        return state
+
+    def set_seed(self, seed):
+        self.seed = seed
+        for instance in self.instances.values():
+            instance.set_seed(seed)
+        for name in self.link_order:
+            self.instances[name].link(self.instances, self.iterations)
+        for (name, nodes) in self.owner_nodes.items():
+            self.instances[name].owners = tuple(
+                ParentRows(self.instances.get(node.count, node.count))
+                for node in nodes)
+
+    def init_specs(self, overrides=()):
+        '''
+        Parse __elem_tree to determine the data sets defined in the
+        XML file . Returns a {name: (type, ds_dict)} dictionary . The
+        properties of every data set are validated (see
+        AbstractDataSet.parse_spec) . overrides are the attributes of
+        data sets replacing the ones of the same name .
+        '''
+        # Obtain all the <dataset> elements from the XML file
+        specs = {}
+        dsb = DataSetBuilder()
+        dataset_list = [dict(dataset.attrib) for dataset in
+                        self.__elem_tree.iter("dataset")]
+        if len(dataset_list) == 0:
+            sys.stderr.write('Warning: Data sets not defined.\n')
+        replaced = {attrib.get('name'): attrib for attrib in overrides}
+        for (i, attrib) in enumerate(dataset_list):
+            dataset_list[i] = replaced.pop(attrib.get('name'), attrib)
+        for name in sorted(replaced):
+            self.errors.append('Override of the undefined data set \'%s\' .'
+                               % name)
+        for attrib in dataset_list:
+            dataset_name = attrib.get('name')
+            dataset_type = attrib.get('type')
+            if dataset_name is None:
+                self.errors.append('Unnamed data set (%s) .' % dataset_type)
+                continue
+            if dataset_type is None:
+                self.errors.append('Untyped data set \'%s\' .' % dataset_name)
+                continue
+            if dataset_name in specs:
+                self.errors.append('Duplicate data set \'%s\' .' %
+                                   dataset_name)
+                continue
+            if dataset_type not in dsb.classes:
+                self.errors.append('Unknown type \'%s\' of data set \'%s\' .'
+                                   % (dataset_type, dataset_name))
+                continue
+            # Create the ds_dict for the Abstract Data Set subclasses
+            ds_dict = {key: value for (key, value) in attrib.items() if
+                       key != 'type'}
+            self.errors.extend(dsb.classes[dataset_type].parse_spec(ds_dict)[1])
+            specs[dataset_name] = (dataset_type, ds_dict)
+        return specs
+
+    def init_instances(self, key_space=None):
+        '''
+        New the data set objects the template depends on: the data sets
+        it references and, transitively, the data sets these depend on
+        (see AbstractDataSet.dependencies) . Data sets nobody uses are
+        never built nor evaluated . The data sets of other
+        configurations are ImportedKeys from key_space, if given .
+        '''
+        instances = {}
+        dsb = DataSetBuilder()
+        errors = []
+        pending = [(name, 'the template') for node in self.root.walk()
+                   for name in node.dataset_names()]
+        while pending:
+            (dataset_name, user) = pending.pop()
+            if dataset_name in instances:
+                continue
+            if dataset_name in self.requoted:
+                pending.append((self.requoted[dataset_name][0], user))
+                continue
+            if dataset_name not in self.specs:
+                imported = key_space and key_space.source(dataset_name)
+                if imported:
+                    instances[dataset_name] = imported
+                    continue
+                errors.append('Unknown data set \'%s\' used by %s .' %
+                              (dataset_name, user))
+                continue
+            (dataset_type, ds_dict) = self.specs[dataset_name]
+            # Build instances of Data Sets
+            instances[dataset_name] = dsb.new(dataset_type, ds_dict)
+            pending.extend((name, '\'%s\'' % dataset_name) for name in
+                           instances[dataset_name].dependencies())
+        if errors:
+            raise ConfigError(errors)
+        for (key, (name, quote)) in self.requoted.items():
+            instances[key] = Requoted(instances[name], quote)
+        self.link_order = self.dependency_order(instances)
+        # values are escaped for the literals they are rendered in, the
+        # dependencies that are not rendered take the quote of their user
+        for name in reversed(self.link_order):
+            instance = instances[name]
+            instance.set_escape(self.quotes.get(name, instance.escape))
+            for dependency in instance.dependencies():
+                if instances[dependency].escape is None:
+                    instances[dependency].set_escape(instance.escape)
+        return instances
+
+    def init_owners(self):
+        '''
+        Returns {name: nodes} for the ForeignKey data sets with
+        only_emitted evaluated in a nested template: the keys written
+        before row k of such a data set are those of the rows of the
+        referenced data set up to the ancestor row of k rendering it
+        (see ForeignKey.emitted), nodes being the templates from the
+        one of the key up to that ancestor (excluded) . The referenced
+        data set must be rendered by that ancestor before the nested
+        template .
+        '''
+        paths = self.evaluation_paths()
+        owner_nodes = {}
+        errors = []
+        for (name, instance) in sorted(self.instances.items()):
+            if not isinstance(instance, ForeignKey) or \
+                    not instance.only_emitted or \
+                    isinstance(self.instances[instance.references],
+                               ImportedKeys):
+                continue
+            chains = set()
+            for path in paths.get(name, ()):
+                level = self.rendering_level(path, instance.references)
+                if level is None and len(path) > 1:
+                    errors.append('Data set \'%s\' (only_emitted) is used '
+                                  'by a nested template, but \'%s\' is not '
+                                  'rendered before it by an enclosing '
+                                  'template .' % (name, instance.references))
+                chains.add(path[:level or 0])
+            if len(chains) > 1:
+                errors.append('Data set \'%s\' (only_emitted) is used by '
+                              'several templates .' % name)
+            elif chains and chains != set([()]):
+                owner_nodes[name] = chains.pop()
+        if errors:
+            raise ConfigError(errors)
+        return owner_nodes
+
+    def evaluation_paths(self):
+        '''
+        Returns {name: set of paths}, the paths being the templates
+        evaluating the data set name at their rows, each followed by its
+        ancestors (nearest first) . A data set is evaluated at the rows
+        of the templates of its users .
+        '''
+        paths = {}
+        stack = [(self.root,)]
+        while stack:
+            path = stack.pop()
+            node = path[0]
+            for refs in node.refs:
+                for (level, name) in refs:
+                    paths.setdefault(name, set()).add(path[level:])
+            for child in node.children:
+                if isinstance(child.count, str):
+                    paths.setdefault(child.count, set()).add(path)
+                stack.append((child,) + path)
+        for name in reversed(self.link_order):
+            for dependency in self.instances[name].dependencies():
+                paths.setdefault(dependency, set()).update(
+                    paths.get(name, ()))
+        return paths
+
+    def template_rows(self, path, rows, found):
+        '''
+        Returns how many rows of the template path[0] (path as in
+        @evaluation_paths) the rows 0 .. rows - 1 of the outer template
+        render . found caches the results, {template: rows} .
+        '''
+        node = path[0]
+        if node not in found:
+            if len(path) == 1:
+                found[node] = rows
+            else:
+                found[node] = self.count_rows(
+                    node, 0, self.template_rows(path[1:], rows, found))
+        return found[node]
+
+    @staticmethod
+    def rendering_level(path, name):
+        '''
+        Returns the level in path (a template and its ancestors, nearest
+        first) of the nearest template rendering the data set name
+        (or a Requoted view of it) before the rows of path, None if
+        there is none .
+        '''
+        for (level, node) in enumerate(path):
+            refs = node.refs
+            if level:
+                refs = refs[:node.children.index(path[level - 1]) + 1]
+            if [ref for segment in refs for ref in segment
+                    if ref[0] == 0 and ref[1].rstrip('\'"`') == name]:
+                return level
+        return None
+
+    def check_rows(self, start, count=None):
+        '''
+        Raises ConfigError if the rows start .. start + count - 1
+        (count default: up to the iterations) are not rows of the
+        iterations, or if a data set with unique values (see
+        AbstractDataSet.capacity) cannot generate them, so that nothing
+        is written before the run fails . A data set evaluated in nested
+        templates must generate all their rows up to those rendered by
+        the outer rows: the counts of the templates are drawn for that,
+        so the data sets must be seeded .
+        '''
+        if start < 0 or start > self.iterations:
+            raise ConfigError(['The first row %d is not in 0 .. %d (the '
+                               'iterations) .' % (start, self.iterations)])
+        if count is None:
+            count = self.iterations - start
+        if count < 0:
+            raise ConfigError(['The number of rows %d is negative .' %
+                               count])
+        if start + count > self.iterations:
+            raise ConfigError(['Rows %d .. %d are past the %d iterations .' %
+                               (start, start + count - 1, self.iterations)])
+        errors = []
+        (paths, found) = (None, {})
+        for (dataset_name, instance) in sorted(self.instances.items()):
+            capacity = instance.capacity()
+            if capacity is None:
+                continue
+            if paths is None:
+                paths = self.evaluation_paths()
+            rows = max([start + count] +
+                       [self.template_rows(path, start + count, found)
+                        for path in paths.get(dataset_name, ())])
+            if capacity < rows:
+                errors.append('Data set \'%s\' has only %d unique values '
+                              'for %d rows .' %
+                              (dataset_name, capacity, rows))
+        if errors:
+            raise ConfigError(errors)
+
+    @staticmethod
+    def dependency_order(instances):
+        '''
+        Returns the names of instances, every data set after its
+        dependencies() . Raises ConfigError on a dependency cycle .
+        '''
+        order = []
+        state = {}
+        for root in sorted(instances):
+            if root in state:
+                continue
+            state[root] = 'visiting'
+            stack = [(root, iter(instances[root].dependencies()))]
+            while stack:
+                (name, deps) = stack[-1]
+                dep = next(deps, None)
+                if dep is None:
+                    stack.pop()
+                    state[name] = 'done'
+                    order.append(name)
+                elif state.get(dep) == 'visiting':
+                    raise ConfigError(['Data set \'%s\' depends on itself .'
+                                       % dep])
+                elif dep not in state:
+                    state[dep] = 'visiting'
+                    stack.append((dep, iter(instances[dep].dependencies())))
+        return order
+
+    def init_iterations(self):
+        '''
+        Returns the number of iterations (how many subsequent lines
+        to generate)
+        '''
+        iterations = self.__elem_tree.getroot().attrib.get('iterations')
+        try:
+            if int(iterations) >= 0:
+                return int(iterations)
+        except (TypeError, ValueError):
+            pass
+        self.errors.append('Invalid iterations \'%s\' .' % iterations)
+        return 0
+
+    def init_template(self):
+        '''
+        Retrieves the <template> element from the XML file
+        '''
+        templates = self.__elem_tree.findall('template')
+        if not templates:
+            self.errors.append('Template not defined .')
+            return None
+        return templates[0]
+
+    def compile_template(self, element, depth=0):
+        '''
+        Parses the template element and its nested templates once into
+        a TemplateNode, checking that every placeholder refers to a
+        defined data set (and every #{parent.name} to an existing
+        parent template) .
+        '''
+        if element is None:
+            return TemplateNode([CompiledTemplate('')], [])
+        texts = [element.text or '']
+        children = []
+        for child in element:
+            if child.tag == 'template':
+                children.append(self.compile_template(child, depth + 1))
+                texts.append(child.tail or '')
+            else:
+                self.errors.append('Unexpected <%s> in a template .' %
+                                   child.tag)
+                texts[-1] += child.tail or ''
+        count = None
+        if depth:
+            count = self.init_count(element.attrib.get('count'))
+        node = TemplateNode([CompiledTemplate(text) for text in texts],
+                            children, count, depth)
+        unknown = [key for (segment, refs) in zip(node.segments, node.refs)
+                   for (key, (level, name)) in zip(segment.names, refs)
+                   if level > depth or name not in self.specs]
+        if unknown:
+            self.errors.append('Unknown data set(s) in template: %s .' %
+                               ', '.join(unknown))
+        else:
+            self.check_quotes(node)
+        return node
+
+    def check_quotes(self, node):
+        '''
+        Checks that the quotes of every segment of node are balanced and
+        records in self.quotes the quote of the literals every data set
+        is rendered in (see CompiledTemplate.quotes) . The values of a
+        data set are escaped for the first quote found: its placeholders
+        in literals quoted otherwise are renamed name + quote, a
+        Requoted view of the data set (see self.requoted) .
+        '''
+        for (segment, refs) in zip(node.segments, node.refs):
+            (quotes, line) = segment.quotes()
+            if line is not None:
+                self.errors.append('Unbalanced quote in template: %s .' %
+                                   line)
+            keys = [segment.names[slot] for slot in segment.slots]
+            for (i, (slot, quote)) in enumerate(zip(segment.slots, quotes)):
+                name = refs[slot][1]
+                if quote is None or \
+                        self.quotes.setdefault(name, quote) == quote:
+                    continue
+                keys[i] += quote
+                self.requoted[name + quote] = (name, quote)
+            if keys != [segment.names[slot] for slot in segment.slots]:
+                segment.set_parts(segment.literals, keys)
+        node.set_refs()
+
+    def use_records(self):
+        '''
+        Replaces the text of the templates by the records of their
+        INSERT statements (see InsertStatement.record) . Returns the
+        list of statements, record i being a row of statements[i] .
+        Statements into the same table and columns share an index .
+        '''
+        statements = []
+        indexes = {}
+        tables = {}
+        for node in self.root.walk():
+            segments = []
+            for segment in node.segments:
+                (found, errors) = InsertStatement.parse(segment.text)
+                self.errors.extend(errors)
+                records = []
+                for statement in found:
+                    key = (statement.table, tuple(statement.columns))
+                    if tables.setdefault(statement.table, key) != key:
+                        self.errors.append('Table %s is inserted with '
+                                           'different columns .' %
+                                           statement.table)
+                    if key not in indexes:
+                        indexes[key] = len(statements)
+                        statements.append(statement)
+                    records.append(statement.record(indexes[key]))
+                segments.append(CompiledTemplate(''.join(records)))
+            node.segments = segments
+            node.set_refs()
+            # the records are rendered in the quotes of the statements
+            self.check_quotes(node)
+        return statements
+
+    def init_count(self, count):
+        '''
+        Parses the count attribute of a nested template: a non negative
+        integer or the name of a data set .
+        '''
+        if count is None:
+            self.errors.append('Nested template without count .')
+            return 0
+        try:
+            if int(count) >= 0:
+                return int(count)
+        except ValueError:
+            if count in self.specs:
+                return count
+        self.errors.append('Invalid count \'%s\' of a nested template .' %
+                           count)
+        return 0
+
+    def precompute(self):
+        '''
+        Folds the constant data sets (see AbstractDataSet.is_constant)
+        into the compiled template: they are evaluated once instead of
+        on every row . Data sets with a small domain already sample
+        tables of formatted values (see AbstractDataSet.build) .
+        '''
+        for node in self.root.walk():
+            for child in node.children:
+                if isinstance(child.count, str) and \
+                        self.instances[child.count].is_constant():
+                    node.folded.add(child.count)
+                    child.count = int(self.instances[child.count].value_at(0))
+            segments = []
+            for (segment, refs) in zip(node.segments, node.refs):
+                constants = {}
+                for (key, (level, name)) in zip(segment.names, refs):
+                    if self.instances[name].is_constant():
+                        constants[key] = self.instances[name].value_at(0)
+                        if level == 0:
+                            node.folded.add(name)
+                if constants:
+                    segment = segment.fold(constants)
+                segments.append(segment)
+            node.segments = segments
+            node.set_refs()
+
+    def row_values(self, row):
+        '''
+        Returns the (lazily evaluated) values of the data sets at row .
+        '''
+        return RowValues(self.instances, row)
+
+    def seek(self, row):
+        '''
+        Positions the evaluator so that the next rendered row is row
+        (0 based) . Used to start in the middle of the iteration range
+        (shards, --start, --resume) .
+        '''
+        self.seek_children(self.root, self.row, row)
+        self.row = row
+
+    def seek_children(self, node, old, new):
+        '''
+        Moves the row of the children of node from where they are when
+        node is at row old to where they are when it is at row new .
+        Forward moves only count the rows in between .
+        '''
+        for child in node.children:
+            if new >= old:
+                row = child.row + self.count_rows(child, old, new)
+            else:
+                row = self.count_rows(child, 0, new)
+            self.seek_children(child, child.row, row)
+            child.row = row
+
+    def count_rows(self, node, start, end):
+        '''
+        Returns how many rows of node its parent rows start .. end - 1
+        render .
+        '''
+        if not isinstance(node.count, str):
+            return node.count * (end - start)
+        dataset = self.instances[node.count]
+        total = 0
+        for first in xrange(start, end, 1 << 16):
+            total += sum(max(0, int(value)) for value in
+                         dataset.batch_at(first, min(1 << 16, end - first)))
+        return total
+
+    def render_row(self, node, row, ancestors=()):
+        '''
+        Yields the texts of row of node, the rows of its children
+        rendered in between . ancestors are the RowValues of the parent
+        rows, nearest first .
+        '''
+        values = (self.row_values(row),) + ancestors
+        for (i, segment) in enumerate(node.segments):
+            if i:
+                child = node.children[i - 1]
+                count = child.count
+                if isinstance(count, str):
+                    count = max(0, int(values[0][count]))
+                for _ in xrange(count):
+                    child.row += 1
+                    for text in self.render_row(child, child.row - 1,
+                                                values):
+                        yield text
+            yield segment.render([values[level][name] for (level, name)
+                                  in node.refs[i]])
+
+    def render_block(self, node, start, n, ancestors=()):
+        '''
+        Returns the list of the texts of the rows start .. start + n - 1
+        of node, every data set drawing its column with batch_at() .
+        ancestors are (column, owners) pairs, nearest parent first:
+        column(name) is the column of the data set name in the block of
+        that parent and owners[i] the index in that block of the parent
+        row of the row start + i .
+        The rows of the children of a block are rendered in one block .
+        '''
+        columns = {}
+
+        def column(name):
+            if name not in columns:
+                columns[name] = self.instances[name].batch_at(start, n)
+            return columns[name]
+
+        children = []
+        for child in node.children:
+            if isinstance(child.count, str):
+                counts = [max(0, int(value))
+                          for value in column(child.count)]
+            else:
+                counts = [child.count] * n
+            owners = [i for (i, count) in enumerate(counts)
+                      for _ in xrange(count)]
+            texts = self.render_block(
+                child, child.row, len(owners),
+                ((column, owners),) +
+                tuple((parent_column, [parent_owners[i] for i in owners])
+                      for (parent_column, parent_owners) in ancestors))
+            child.row += len(owners)
+            rows = []
+            pos = 0
+            for count in counts:
+                rows.append(''.join(texts[pos:pos + count]))
+                pos += count
+            children.append(rows)
+
+        texts = None
+        for (i, segment) in enumerate(node.segments):
+            values = []
+            for (level, name) in node.refs[i]:
+                if level == 0:
+                    values.append(column(name))
+                else:
+                    (parent_column, owners) = ancestors[level - 1]
+                    parent_values = parent_column(name)
+                    values.append([parent_values[j] for j in owners])
+            if values:
+                segment_texts = map(segment.fmt.format, *values)
+            else:
+                segment_texts = [segment.fmt.format()] * n
+            if texts is None:
+                texts = segment_texts
+            else:
+                texts = [a + b + c for (a, b, c) in
+                         zip(texts, children[i - 1], segment_texts)]
+        return texts
+
+    def iter_output(self, count=None, block_size=None, checkpoint=None):
+        '''
+        Renders count rows (default: up to self.iterations) starting
+        at self.row and yields (row, text) pairs, text being the text
+        of row . If block_size is given, rows are rendered in blocks of
+        that many rows: every data set draws a whole column of values
+        with batch_at() and the rows of a block are rendered at once
+        (see @render_block) .
+        The rows of the nested templates are rendered within the rows
+        of their parents (see TemplateNode) .
+        If checkpoint is given, a checkpoint_marker is yielded before
+        every row but row 0 whose index is a multiple of checkpoint .
+        '''
+        assert block_size is None or block_size > 0, block_size
+        assert checkpoint is None or checkpoint > 0, checkpoint
+        if count is None:
+            count = self.iterations - self.row
+        end = self.row + count
+
+        def marker():
+            if checkpoint and self.row and self.row % checkpoint == 0:
+                return self.checkpoint_marker % (self.row, self.seed,
+                                                 checkpoint)
+
+        if not block_size and self.root.children:
+            while self.row < end:
+                text = marker()
+                if text:
+                    yield (self.row, text)
+                yield (self.row, ''.join(self.render_row(self.root,
+                                                         self.row)))
+                self.row += 1
+            return
+
+        if not block_size:
+            render = self.root.segments[0].render
+            names = [name for (level, name) in self.root.refs[0]]
+            while self.row < end:
+                text = marker()
+                if text:
+                    yield (self.row, text)
+                values = self.row_values(self.row)
+                yield (self.row, render([values[n] for n in names]))
+                self.row += 1
+            return
+
+        while self.row < end:
+            text = marker()
+            if text:
+                yield (self.row, text)
+            size = min(block_size, end - self.row)
+            if checkpoint:
+                # blocks never span a checkpoint
+                size = min(size, checkpoint - self.row % checkpoint)
+            for text in self.render_block(self.root, self.row, size):
+                yield (self.row, text)
+                self.row += 1
+
+    def write_output(self, output=sys.stdout, block_size=None, start=None,
+                     count=None, checkpoint=None, progress=None, stats=None):
+        '''
+        Parse the template and write the output to a stream .
+        The default stream is sys.stdout .
+        If start is given, the output starts at that row instead of the
+        current one . progress, if given, is called with every multiple
+        of 10000 rows reached (see report_progress) . The rendering
+        time is added to stats, a RunStats, if given . See @iter_output
+        for the other arguments .
+        '''
+        if start is not None:
+            self.seek(start)
+        report = -(-self.row // 10000) * 10000
+        items = self.iter_output(count, block_size, checkpoint)
+        if stats is not None:
+            items = stats.timed(items, 'render')
+        for (row, text) in items:
+            while progress and report <= row:
+                progress(report)
+                report += 10000
+            output.write(text)
+
+    def column_nodes(self, node, start, n):
+        '''
+        Yields the (node, start, n) triples of the rows of node and its
+        descendants rendered by the rows start .. start + n - 1 of node,
+        the children starting at their current row .
+        '''
+        yield (node, start, n)
+        for child in node.children:
+            for found in self.column_nodes(
+                    child, child.row, self.count_rows(child, start, start + n)):
+                yield found
+
+    def write_columns(self, directory, block_size=None, start=None,
+                      count=None, progress=None):
+        '''
+        Writes the values of the data sets of the template to one
+        column file each in directory (see ColumnWriter), with a
+        columns.json manifest to read them back (see ColumnReader) .
+        Nothing is rendered . The column of a data set has a value per
+        row of the template that reads it at level 0 (or counts its
+        nested templates): the iterations, or the rows of a nested
+        template . The columns of the nested templates are named
+        template<i>.<data set>, i numbering the templates in document
+        order (the outer one is 0) . Values are written unescaped: the
+        data sets are prepared again without the quotes of the template .
+        start and count select the rows of the outer template, blocks
+        of block_size rows are drawn with batch_at() . progress is
+        called as in @write_output .
+        '''
+        if not numpy:
+            raise ImportError('write_columns() requires NumPy')
+        # {node: (column name prefix, names of its data sets)}
+        nodes = {}
+        for (i, node) in enumerate(self.root.walk()):
+            names = set(self.requoted.get(name, (name,))[0]
+                        for refs in node.refs for (level, name) in refs
+                        if level == 0)
+            names.update(self.requoted.get(name, (name,))[0]
+                         for name in node.folded)
+            names.update(child.count for child in node.children
+                         if isinstance(child.count, str))
+            nodes[node] = ('template%d.' % i if i else '', sorted(names))
+        for instance in self.instances.values():
+            instance.set_escape(None)
+        self.set_seed(self.seed)
+        if start is not None:
+            self.seek(start)
+        if count is None:
+            count = self.iterations - self.row
+        block_size = block_size or 1 << 16
+        columns = {}
+        for (node, first, n) in list(self.column_nodes(self.root, self.row,
+                                                        count)):
+            (prefix, names) = nodes[node]
+            writers = {}
+            for name in names:
+                instance = self.instances[name]
+                writers[name] = ColumnWriter(directory, prefix + name, n,
+                                             instance.value_kind(),
+                                             instance.table)
+            for offset in xrange(0, n, block_size):
+                size = min(block_size, n - offset)
+                for name in names:
+                    writers[name].write(offset, self.instances[name].batch_at(
+                        first + offset, size))
+                if progress and node is self.root:
+                    for row in xrange(-(-(first + offset) // 10000) * 10000,
+                                      first + offset + size, 10000):
+                        progress(row)
+            for name in names:
+                columns[prefix + name] = description = writers[name].close()
+                description['dataset'] = name
+                description['type'] = type(self.instances[name]).__name__
+        start = self.row
+        self.seek(start + count)
+        f = open(os.path.join(directory, ColumnReader.manifest), 'w')
+        try:
+            json.dump({'seed': self.seed, 'start': start,
+                       'columns': columns}, f, indent=1, sort_keys=True,
+                      separators=(',', ': '))
+        finally:
+            f.close()
+
 
 # ------------------------------------------------------------------------------
-class AbstractDataSet(object):
+class ConfigCache(object):
     '''
-    Abstract class base for data sets .
-    Classes based on AbstractDataSet are dynamic and must implement
-    next_value() method .
+    Compiled configurations, i.e. DataSetEvaluators right after loading
+    (templates compiled, data sets validated), pickled in directory .
+    Only the properties of the data sets are stored: their tables and
+    samplers are built again, once, by set_seed() . The key of an entry
+    is the hash of the XML file content, the options it is compiled
+    with, __version__ and the source of this module, so that editing
+    either one misses the cache . The max_entries most recently used
+    entries are kept .
+    Caching is best effort: unreadable entries are compiled again and
+    entries that cannot be written are skipped .
     '''
 
-    __metaclass__ = abc.ABCMeta
+    source_hash = None
+
+    def __init__(self, directory, max_entries=64):
+        self.directory = directory
+        self.max_entries = max_entries
 
-    @abstractclassmethod
-    def validation_list(self):
-        return [];
+    @staticmethod
+    def default_directory():
+        '''
+        $PYSERT_CACHE_DIR, or pysert in $XDG_CACHE_HOME (~/.cache) .
+        '''
+        if os.environ.get('PYSERT_CACHE_DIR'):
+            return os.environ['PYSERT_CACHE_DIR']
+        return os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                            os.path.expanduser(os.path.join('~', '.cache')),
+                            'pysert')
 
-    def validate(self):
-        valid = True
-        vl_list = self.validation_list();
+    @classmethod
+    def generator_hash(cls):
+        if cls.source_hash is None:
+            digest = hashlib.sha1(__version__)
+            filename = globals().get('__file__')
+            if filename is not None:
+                if filename.endswith(('.pyc', '.pyo')):
+                    filename = filename[:-1]
+                try:
+                    f = open(filename, 'rb')
+                    try:
+                        digest.update(f.read())
+                    finally:
+                        f.close()
+                except IOError:
+                    pass
+            cls.source_hash = digest.hexdigest()
+        return cls.source_hash
+
+    def key(self, xml_data, options=()):
+        '''
+        options are the (repr-able) arguments the evaluator is compiled
+        with besides the XML file .
+        '''
+        digest = hashlib.sha1(self.generator_hash())
+        digest.update(repr(options))
+        digest.update(xml_data)
+        return digest.hexdigest()
 
-        for elem in vl_list:
-            if elem not in self.__dict__.keys():
-                sys.stderr.write('Error: Invalid data set : \'%s\' .\n' %
-                                 self.name)
-                sys.stderr.write('Error: Missing property \'%s\' .\n' %
-                                 elem)
-                sys.stderr.write('Exiting (-1).\n')
-                sys.exit(-1)
+    def filename(self, key):
+        return os.path.join(self.directory, key + '.pickle')
 
-    def __init__(self, ds_dict):
+    def load(self, key):
         '''
-        Subclasses will have a dynamic structure based on the
-        ds_dict dictionary .
+        Returns the DataSetEvaluator stored for key, None if there is
+        none (or it cannot be read) .
         '''
-        for (k, v) in ds_dict.items():
-            self.__dict__[k] = v
-        # validate data set based on validation_list
-        self.validate()
+        try:
+            f = open(self.filename(key), 'rb')
+        except IOError:
+            return None
+        try:
+            evaluator = cPickle.load(f)
+        except Exception:
+            return None
+        finally:
+            f.close()
+        try:
+            # the entry is recently used (see prune)
+            os.utime(self.filename(key), None)
+        except OSError:
+            pass
+        return evaluator
 
-    @abc.abstractmethod
-    def next_value(self):
-        return
+    def save(self, key, evaluator):
+        '''
+        Stores evaluator for key . The entry is written to a temporary
+        file first: concurrent runs never read a partial entry .
+        '''
+        filename = self.filename(key)
+        temporary = '%s.%d.tmp' % (filename, os.getpid())
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            f = open(temporary, 'wb')
+            try:
+                cPickle.dump(evaluator, f, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            os.rename(temporary, filename)
+            self.prune()
+        except (IOError, OSError, cPickle.PicklingError):
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def prune(self):
+        '''
+        Removes the least recently used entries beyond max_entries .
+        '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle'):
+                filename = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(filename), filename))
+                except OSError:
+                    pass
+        entries.sort(reverse=True)
+        for (mtime, filename) in entries[self.max_entries:]:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
 
 
 # ------------------------------------------------------------------------------
-class RandomNumber(AbstractDataSet):
+def find_checkpoint(filename):
     '''
-    ds_dict will contain the following:
-            {
-                "name" : <string value>
-                "floating" : "<boolean value>" ,
-                "min": "<integer value>",
-                "max": "<integer value>"
-            }
+    Looks for the last complete checkpoint marker (see
+    DataSetEvaluator.checkpoint_marker) in filename . Returns None or a
+    (offset, row, seed, every) tuple, offset being the position of the
+    marker in the file: truncating the file there and rendering again
+    from row with the same seed and checkpoint interval produces the
+    same bytes as an uninterrupted run .
     '''
+    # the marker follows the text of the previous row, which may end with
+    # the indentation of the template
+    regex = re.compile(br'\n[ \t]*(-- pysert:checkpoint row=(\d+) seed=(\d+) '
+                       br'every=(\d+)\n)')
+    chunk_size = 1 << 20
+    f = open(filename, 'rb')
+    try:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        while end > 0:
+            # chunks overlap so that a marker is never split
+            start = max(0, end - chunk_size)
+            f.seek(start)
+            data = f.read(end - start + 128)
+            if start == 0:
+                # a marker may start the file
+                (data, start) = (b'\n' + data, -1)
+            found = None
+            for found in regex.finditer(data):
+                pass
+            if found is not None:
+                return (start + found.start(1), int(found.group(2)),
+                        int(found.group(3)), int(found.group(4)))
+            end = max(0, start)
+        return None
+    finally:
+        f.close()
 
-    def validation_list(self):
-        return ['name', 'floating', 'min', 'max']
 
-    def next_value(self):
+# ------------------------------------------------------------------------------
+# Output . The rendered text goes through a PipelinedWriter, so that writing
+# (and compressing) happens on its own thread while the rows are rendered .
+
+def report_progress(row):
+    '''
+    The default progress callback: writes row to stderr, never in the
+    generated data .
+    '''
+    sys.stderr.write('%d\n' % row)
+
+
+def parse_size(size):
+    '''
+    '512K' -> 524288, '64M', '2G' or a number of bytes .
+    '''
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    size = size.strip().upper()
+    if size[-1:] in units:
+        return int(size[:-1]) * units[size[-1]]
+    return int(size)
+
+
+def open_output(filename, compression=None, mode='w'):
+    '''
+    Opens filename for writing, compressed with compression ('gzip' or
+    'bz2') if given .
+    '''
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(filename, mode + 'b')
+    if compression == 'bz2':
+        import bz2
+        return bz2.BZ2File(filename, mode)
+    return open(filename, mode)
+
+
+def write_texts(output, texts):
+    '''
+    Writes the list of texts to output, in one write() unless output
+    splits its files between texts (see RollingOutput.write_texts) .
+    '''
+    if hasattr(output, 'write_texts'):
+        output.write_texts(texts)
+    else:
+        output.write(''.join(texts))
+
+
+class RollingOutput(object):
+    '''
+    A file written in parts of at most max_bytes (uncompressed) bytes,
+    split between writes or between the texts of write_texts(), i.e.
+    between rows: a part only exceeds max_bytes if a single row does .
+    meal.sql is written to meal_0001.sql, meal_0002.sql, ...
+    (meal_0001.sql.gz with gzip compression) . Without max_bytes there
+    is a single file, meal.sql (meal.sql.gz) .
+    '''
+
+    extensions = {'gzip': '.gz', 'bz2': '.bz2'}
+
+    def __init__(self, filename, max_bytes=None, compression=None):
+        extension = self.extensions.get(compression, '')
+        if extension and filename.endswith(extension):
+            filename = filename[:-len(extension)]
+        self.filename = filename
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.filenames = []
+        self.file = None
+        self.size = 0
+
+    def next_filename(self):
+        if not self.max_bytes:
+            return self.filename + self.extension
+        (root, ext) = os.path.splitext(self.filename)
+        return '%s_%04d%s%s' % (root, len(self.filenames) + 1, ext,
+                                self.extension)
+
+    def write(self, text):
+        self.write_texts([text])
+
+    def write_texts(self, texts):
         '''
-        Returns a random value based on in the ds_dict properties .
+        Writes texts, starting a new part before a text that does not
+        fit in the current one .
         '''
-        func = random.uniform if self.floating == 'True' else random.randint
-        return func(int(self.min), int(self.max))
+        if self.file is None:
+            self.next_part()
+        part = []
+        for text in texts:
+            if self.max_bytes and self.size and \
+                    self.size + len(text) > self.max_bytes:
+                self.file.write(''.join(part))
+                part = []
+                self.next_part()
+            part.append(text)
+            self.size += len(text)
+        self.file.write(''.join(part))
+
+    def next_part(self):
+        self.close()
+        self.filenames.append(self.next_filename())
+        self.file = open_output(self.filenames[-1], self.compression)
+        self.size = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class PipeError(Exception):
+    '''
+    Raised when the client process of a PipeOutput exits before the end
+    of the output or with a non zero status .
+    '''
+
+    def __init__(self, command, status):
+        if status < 0:
+            message = '\'%s\' was killed by signal %d' % (command, -status)
+        elif status:
+            message = '\'%s\' exited with status %d' % (command, status)
+        else:
+            message = '\'%s\' exited before the end of the output' % command
+        super(PipeError, self).__init__(message)
+        self.status = status
+
+
+class PipeOutput(object):
+    '''
+    Streams the output into the stdin of command, run by the shell,
+    e.g. 'mysql -u root meals' . Writes block while the client is busy
+    (through a PipelinedWriter, rendering stalls once its queue is full)
+    and raise PipeError if the client has exited .
+    '''
+
+    def __init__(self, command):
+        import subprocess
+        self.command = command
+        # Python ignores SIGPIPE, the client (and its own pipes) must not
+        self.process = subprocess.Popen(
+            command, shell=True, stdin=subprocess.PIPE,
+            preexec_fn=lambda: signal.signal(signal.SIGPIPE, signal.SIG_DFL))
+
+    def write(self, text):
+        try:
+            self.process.stdin.write(text)
+        except IOError as err:
+            if err.errno != errno.EPIPE:
+                raise
+            raise PipeError(self.command, self.process.wait())
+
+    def close(self):
+        '''
+        Closes the stdin of the client and waits for it to finish .
+        '''
+        try:
+            self.process.stdin.close()
+        except IOError as err:
+            if err.errno != errno.EPIPE:
+                raise
+        status = self.process.wait()
+        if status:
+            raise PipeError(self.command, status)
+
+
+class PipelinedWriter(object):
+    '''
+    Writes to output on a background thread . write() gathers the texts
+    into chunks of about buffer_size bytes and queues them, at most
+    queue_size chunks ahead of the writer thread: rendering goes on
+    while the previous chunks are compressed and written, and stalls
+    only when the output cannot keep up . A chunk is written as the
+    list of its texts (see write_texts): a RollingOutput still splits
+    it between rows . An error raised by output.write() is raised
+    again by the next write() or close() .
+    '''
+
+    def __init__(self, output, buffer_size=1 << 20, queue_size=16):
+        self.output = output
+        self.buffer_size = buffer_size
+        self.texts = []
+        self.size = 0
+        self.error = None
+        self.queue = Queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            if self.error is None:
+                try:
+                    write_texts(self.output, chunk)
+                except Exception:
+                    # raised on the rendering thread, chunks are dropped
+                    self.error = sys.exc_info()
+
+    def raise_error(self):
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+
+    def write(self, text):
+        self.texts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def write_texts(self, texts):
+        self.texts.extend(texts)
+        self.size += sum(len(text) for text in texts)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.raise_error()
+        if self.texts:
+            self.queue.put(self.texts)
+            self.texts = []
+            self.size = 0
+
+    def close(self):
+        '''
+        Writes what is left and waits for the writer thread . output is
+        flushed, not closed .
+        '''
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.raise_error()
+        if hasattr(self.output, 'flush'):
+            self.output.flush()
 
 
 # ------------------------------------------------------------------------------
-class LoremIpsum(AbstractDataSet):
+# Instrumentation (--stats) . A RunStats wraps the data sets of an evaluator
+# and the outputs to add up where the time of a run goes .
+
+class TimedDataSet(object):
     '''
-    ds_dict will contain the following :
-        {
-            "name" : <string value>
-            "length" : "<integer value>"
-        }
+    Stands for dataset in DataSetEvaluator.instances, counting the calls
+    of value_at() and batch_at(), the rows they return and their time
+    in counters, a [calls, rows, seconds] list . The time includes the
+    dependencies the data set reads (e.g. the inputs of an Expression) .
+    Other attributes are the ones of dataset .
     '''
 
-    lorem_impsum = textwrap.dedent('''
-    Lorem ipsum dolor sit amet, consectetur adipiscing elit. Ut quis justo leo.
-    Quisque congue elit eu ante euismod ut aliquam nisi bibendum. Donec mollis
-    ipsum nec sapien auctor ut blandit ante aliquet. Fusce eget ante nunc.
-    Praesent ullamcorper neque sit amet diam scelerisque condimentum. Nulla
-    faucibus, justo non pretium consequat, tortor ligula consequat elit, vitae
-    dapibus orci metus eget nisl. Fusce ante ante, placerat et gravida ac,
-    fermentum eu nisl. Aenean posuere, orci vel dapibus adipiscing, ipsum dui
-    imperdiet dolor, eu rutrum lorem dolor id felis. Curabitur accumsan enim et
-    ipsum volutpat feugiat. Vivamus eget diam eros, in volutpat justo.
-    Curabitur bibendum, velit ac fermentum tincidunt, dui nulla volutpat nulla,
-    in ornare dui turpis ultrices dolor. Sed gravida suscipit arcu, ut
-    scelerisque augue aliquet non. Sed sagittis, turpis id ullamcorper rhoncus,
-    lorem nisi fringilla leo, et tristique odio augue id tortor. Integer
-    vehicula imperdiet nisl, eu ultrices neque condimentum eu. Ut sed purus
-    diam, eu euismod diam. Fusce eget venenatis arcu. Mauris porta, enim vel
-    pretium sagittis, ligula elit rutrum magna, sed pulvinar orci elit sit amet
-    leo. Pellentesque habitant morbi tristique senectus et netus et malesuada
-    fames ac turpis egestas.
-    ''').strip().replace('\n', '')
+    def __init__(self, dataset, counters):
+        self.dataset = dataset
+        self.counters = counters
+
+    def __getattr__(self, name):
+        return getattr(self.dataset, name)
+
+    def value_at(self, row):
+        started = time.time()
+        value = self.dataset.value_at(row)
+        counters = self.counters
+        counters[0] += 1
+        counters[1] += 1
+        counters[2] += time.time() - started
+        return value
+
+    def batch_at(self, start, n):
+        started = time.time()
+        values = self.dataset.batch_at(start, n)
+        counters = self.counters
+        counters[0] += 1
+        counters[1] += n
+        counters[2] += time.time() - started
+        return values
+
+
+class TimedOutput(object):
+    '''
+    Adds the time spent in output.write() to stats.times[key], and the
+    bytes written to stats.bytes[key] .
+    '''
+
+    def __init__(self, output, stats, key):
+        self.output = output
+        self.stats = stats
+        self.key = key
+
+    def __getattr__(self, name):
+        return getattr(self.output, name)
+
+    def write(self, text):
+        started = time.time()
+        self.output.write(text)
+        self.stats.times[self.key] += time.time() - started
+        self.stats.bytes[self.key] += len(text)
+
+    def write_texts(self, texts):
+        started = time.time()
+        write_texts(self.output, texts)
+        self.stats.times[self.key] += time.time() - started
+        self.stats.bytes[self.key] += sum(len(text) for text in texts)
+
+
+class RunStats(object):
+    '''
+    The statistics of a run: calls, rows and time of every data set
+    (see @instrument), time spent rendering (see @timed), writing and
+    in the output stream (see @output), progress rates and peak memory .
+    report() returns them as a JSON serializable dictionary .
+    '''
+
+    def __init__(self, log=sys.stderr):
+        self.log = log
+        self.started = time.time()
+        self.datasets = {}
+        self.times = {'render': 0.0, 'write': 0.0, 'io': 0.0}
+        self.bytes = {'write': 0, 'io': 0}
+        self.last = (self.started, None)
+        self.first_row = None
+
+    def instrument(self, evaluator):
+        '''
+        Replaces the data sets of evaluator by TimedDataSets . Call it
+        once the evaluator is seeded: the data sets keep the (untimed)
+        dependencies they were linked to .
+        '''
+        for (name, instance) in evaluator.instances.items():
+            self.datasets[name] = [0, 0, 0.0]
+            evaluator.instances[name] = TimedDataSet(instance,
+                                                     self.datasets[name])
+
+    def timed(self, items, key):
+        '''
+        Yields the items of the iterable items, adding the time taken
+        to produce them to times[key] .
+        '''
+        items = iter(items)
+        while True:
+            started = time.time()
+            try:
+                item = next(items)
+            except StopIteration:
+                self.times[key] += time.time() - started
+                return
+            self.times[key] += time.time() - started
+            yield item
+
+    def output(self, output, key):
+        return TimedOutput(output, self, key)
+
+    def progress(self, row):
+        '''
+        A progress callback (see DataSetEvaluator.write_output) writing
+        the rate since the previous call and since the start to log .
+        '''
+        now = time.time()
+        (last, last_row) = self.last
+        self.last = (now, row)
+        if last_row is None:
+            self.first_row = row
+            self.log.write('%d\n' % row)
+            return
+        self.log.write('%d %.0f rows/s (%.0f rows/s overall)\n' %
+                       (row, (row - last_row) / max(now - last, 1e-6),
+                        (row - self.first_row) /
+                        max(now - self.started, 1e-6)))
+
+    @staticmethod
+    def peak_memory():
+        '''
+        Returns the peak resident set size of the process in KB, None
+        where the resource module is missing .
+        '''
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on Mac OS X, KB elsewhere
+        return peak // 1024 if sys.platform == 'darwin' else peak
+
+    def report(self, rows):
+        '''
+        Returns the statistics of a run of rows rows .
+        '''
+        seconds = time.time() - self.started
+        datasets = {}
+        for (name, (calls, values, spent)) in self.datasets.items():
+            datasets[name] = {'calls': calls, 'rows': values,
+                              'seconds': round(spent, 6)}
+        return {'rows': rows, 'seconds': round(seconds, 6),
+                'rows_per_sec': round(rows / max(seconds, 1e-6), 1),
+                'bytes_written': self.bytes['write'],
+                'render_seconds': round(self.times['render'], 6),
+                'write_seconds': round(self.times['write'], 6),
+                'io_seconds': round(self.times['io'], 6),
+                'peak_memory_kb': self.peak_memory(),
+                'datasets': datasets}
+
+    def write_report(self, filename, rows):
+        '''
+        Writes report(rows) as JSON to filename, to log if it is '-' .
+        '''
+        text = json.dumps(self.report(rows), indent=1, sort_keys=True,
+                          separators=(',', ': ')) + '\n'
+        if filename == '-':
+            self.log.write(text)
+            return
+        f = open(filename, 'w')
+        try:
+            f.write(text)
+        finally:
+            f.close()
+
+
+# ------------------------------------------------------------------------------
+# Bulk-load output . The writers take the output of a DataSetEvaluator in
+# record mode, i.e. the records of its InsertStatements (see
+# DataSetEvaluator.use_records), and can be given instead of a stream to
+# DataSetEvaluator.write_output and write_parallel .
+
+class BatchedInsertWriter(object):
+    '''
+    Writes the records as multi-row INSERT statements of up to
+    batch_size rows . When a statement has batch_size rows pending, its
+    rows are written after the pending rows of the statements before it
+    in the template, the rows they may reference . The other statements
+    keep filling their batches .
+    '''
+
+    def __init__(self, output, statements, batch_size=1000):
+        self.output = output
+        self.statements = statements
+        self.batch_size = batch_size
+        self.pending = [[] for _ in statements]
+
+    def write(self, text):
+        for (index, values) in InsertStatement.split_records(text):
+            rows = self.pending[index]
+            rows.append(self.row(values))
+            if len(rows) >= self.batch_size:
+                self.flush(index + 1)
+
+    def row(self, values):
+        return '(' + ', '.join(values) + ')'
+
+    def flush(self, count=None):
+        '''
+        Writes the pending rows of the first count statements (default:
+        all of them), in the order of the template .
+        '''
+        for (statement, rows) in zip(self.statements[:count],
+                                     self.pending[:count]):
+            if rows:
+                self.insert(statement, rows)
+                del rows[:]
+
+    def insert(self, statement, rows):
+        self.output.write('INSERT INTO %s(%s) VALUES\n%s;\n' %
+                          (statement.table_text, statement.columns_text,
+                           ',\n'.join(rows)))
+
+    def close(self):
+        self.flush()
+
+
+class TableFileWriter(object):
+    '''
+    Writes the records of every table to its own delimited file,
+    directory/<table>.csv (or .tsv), starting with a header line,
+    ready for LOAD DATA INFILE / COPY . Quoted SQL string values are
+    unquoted, NULL becomes \\N .
+    '''
+
+    extensions = {'excel': '.csv', 'excel-tab': '.tsv'}
+
+    def __init__(self, directory, statements, dialect='excel'):
+        import csv
+        self.files = []
+        self.writers = []
+        for statement in statements:
+            f = open(os.path.join(directory, statement.table +
+                                  self.extensions[dialect]), 'wb')
+            writer = csv.writer(f, dialect=dialect, lineterminator='\n')
+            writer.writerow(statement.columns)
+            self.files.append(f)
+            self.writers.append(writer)
+
+    @staticmethod
+    def unquote(value):
+        value = InsertStatement.literal(value)
+        return '\\N' if value is None else value
+
+    def write(self, text):
+        unquote = self.unquote
+        writers = self.writers
+        for (index, values) in InsertStatement.split_records(text):
+            writers[index].writerow([unquote(value) for value in values])
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+
+class SQLiteWriter(BatchedInsertWriter):
+    '''
+    Inserts the records into the SQLite database filename . The table
+    of a statement is created (if it does not exist) on its first row,
+    the type of every column being inferred from that row: TEXT for
+    quoted literals, INTEGER or REAL for unquoted numbers . Rows are
+    bound as parameters with executemany() in batches of batch_size
+    rows, in transactions of about commit_rows rows . The indexes, on
+    the id and *_id columns, are built after the load .
+    '''
+
+    def __init__(self, filename, statements, batch_size=1000,
+                 commit_rows=500000, log=sys.stderr):
+        super(SQLiteWriter, self).__init__(None, statements, batch_size)
+        self.filename = filename
+        self.commit_rows = commit_rows
+        self.log = log
+        import sqlite3
+        self.connection = sqlite3.connect(filename, isolation_level=None)
+        self.connection.text_factory = str
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute('PRAGMA journal_mode = MEMORY')
+        self.created = set()
+        self.rows = 0
+        self.uncommitted = 0
+        self.started = time.time()
+        self.connection.execute('BEGIN')
+
+    @staticmethod
+    def quote(name):
+        return '"%s"' % name.replace('"', '""')
+
+    @staticmethod
+    def column_type(value):
+        '''
+        Returns the SQLite type of a column whose first value is value
+        (see @value) .
+        '''
+        if isinstance(value, (int, long)):
+            return 'INTEGER'
+        if isinstance(value, float):
+            return 'REAL'
+        return 'TEXT'
+
+    @staticmethod
+    def value(literal):
+        '''
+        Returns the value bound for a rendered SQL literal: the text of a
+        quoted string (e.g. '035' stays text), None for NULL, an int or
+        a float for an unquoted number and the text of anything else .
+        '''
+        value = InsertStatement.literal(literal)
+        if value is None or literal[:1] in '\'"':
+            return value
+        for parse in (int, float):
+            try:
+                return parse(value)
+            except ValueError:
+                pass
+        return value
+
+    def row(self, values):
+        return tuple(self.value(value) for value in values)
+
+    def insert(self, statement, rows):
+        table = self.quote(statement.table)
+        if statement.table not in self.created:
+            self.created.add(statement.table)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS %s (%s)' % (
+                table, ', '.join('%s %s' % (self.quote(column),
+                                            self.column_type(value))
+                                 for (column, value) in
+                                 zip(statement.columns, rows[0]))))
+        self.connection.executemany(
+            'INSERT INTO %s (%s) VALUES (%s)' % (
+                table, ', '.join(map(self.quote, statement.columns)),
+                ', '.join('?' * len(statement.columns))), rows)
+        self.rows += len(rows)
+        self.uncommitted += len(rows)
+        if self.uncommitted >= self.commit_rows:
+            self.connection.execute('COMMIT')
+            self.connection.execute('BEGIN')
+            self.uncommitted = 0
 
-    def validation_list(self):
-        return ['name', 'length']
+    def create_indexes(self):
+        for statement in self.statements:
+            for column in statement.columns:
+                if column == 'id' or column.endswith('_id'):
+                    self.connection.execute(
+                        'CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (
+                            self.quote('%s_%s' % (statement.table, column)),
+                            self.quote(statement.table), self.quote(column)))
 
-    def next_value(self):
-        '''
-        Returns a lorem ipsum text .
-        '''
-        div = int(int(self.length) / len(LoremIpsum.lorem_impsum))
-        mod = int(self.length) % len(LoremIpsum.lorem_impsum)
-        return div * LoremIpsum.lorem_impsum + LoremIpsum.lorem_impsum[:mod]
+    def close(self):
+        self.flush()
+        self.connection.execute('COMMIT')
+        loaded = time.time()
+        self.create_indexes()
+        self.connection.close()
+        done = time.time()
+        self.log.write('Loaded %d rows into %s in %.1fs (%d rows/s), '
+                       'indexes built in %.1fs .\n' %
+                       (self.rows, self.filename, loaded - self.started,
+                        self.rows / max(loaded - self.started, 1e-6),
+                        done - loaded))
 
 
 # ------------------------------------------------------------------------------
-# ------------------------------------------------------------------------------
-class PersonName(AbstractDataSet):
+# Columnar output . DataSetEvaluator.write_columns writes the values of every
+# data set of the template to its own .npy file, nothing is rendered; a
+# ColumnReader maps them back into memory .
+
+class ColumnWriter(object):
     '''
-    ds_dict will contain the following :
-        {
-            "name" : <string value>
-            "firstname" : "<boolean value>",
-            "lastname" : "<boolean value>"
-        }
+    Writes the rows values of a data set to directory/<name>.npy through
+    a NumPy memory map . kind is the kind of the values the data set
+    declares (see AbstractDataSet.value_kind): 'int' (int64), 'float'
+    (float64), 'date' (datetime64[D], from YYYY-MM-DD strings) or
+    'string', None to take the kind of the first values . Values that do
+    not fit the kind widen it, from int to float to string and from date
+    to string, and the rows already written are converted: no value is
+    ever truncated . Strings are dictionary encoded: the column holds
+    the codes, the distinct values are written to <name>.dict.npy in
+    the order of their codes . The dictionary of a data set with a table
+    (see AbstractDataSet.build) starts with its table, so that the codes
+    are as narrow as the pool is small .
     '''
 
-    ''' Popular first names in 2010 '''
-    fname = ['Ava', 'Aaron', 'Agathe', 'Agnes', 'Alba', 'Alexander', 'Alexis',
-             'Alvaro', 'Andrew', 'Andrei', 'Angelina', 'Anthony', 'Anna', 'Ariana',
-             'Brian', 'Bogdan', 'Carmen', 'Cristopher', 'Connor', 'Daan',
-             'Daniel', 'David', 'Diego', 'Ella', 'Elizabeth', 'Elsa',
-             'Emma', 'Enzo', 'Ethan', 'Gabriel', 'Grace', 'Gustav',
-             'Isaac', 'Jacob', 'Javier', 'Jayden', 'John', 'Juliette',
-             'Kacper', 'Lars', 'Leah', 'Levi', 'Logan', 'Lotte', 'Lucas',
-             'Lieke', 'Linus', 'Lucia', 'Mateusz', 'Maxime', 'Melvin',
-             'Mia', 'Michael', 'Mikolaj', 'Milan', 'Natalie', 'Natalia',
-             'Olivia', 'Oscar', 'Pablo', 'Paul', 'Paula', 'Piotr', 'Quentin',
-             'Sarah', 'Samuel', 'Sophia', 'Sem', 'Szymon', 'Thijs', 'Teodore',
-             'Valeria', 'Valter', 'William', 'Wilma']
+    date_regex = re.compile(r'^\d{4}-\d\d-\d\d$')
 
-    ''' Last names '''
-    lname = ['Abbott', 'Alcott', 'Antonescu', 'Bartok', 'Bayard', 'Banciu',
-             'Bethmann', 'Bergen', 'Botev', 'Brown', 'Bush', 'Corvinus',
-             'Chehachkov', 'Dimitrof', 'Dinev', 'Delano', 'Eisenhower', 'Enescu',
-             'Frels', 'Fugger', 'Gilman', 'Hancock', 'Hoza', 'Ionescu', 'Iordache',
-             'Kalish', 'Kafka', 'Krasniki', 'Lukasewicz', 'McCormick', 'Medici',
-             'Menier', 'Morgan', 'Palagyi', 'Parrocel', 'Romanov', 'Rozycki',
-             'Rufus', 'Olaru', 'Otis', 'Schoenberger', 'Strauss', 'Somoza',
-             'Sowinski', 'Szigete', 'Tessedik', 'Tisch', 'Vajda', 'Vlas',
-             'Walker', 'Warhola', 'Varchol', 'Wojnar', 'Zelenjcik']
+    dtypes = {'int': 'int64', 'float': 'float64', 'date': 'datetime64[D]'}
 
-    def validation_list(self):
-        return ['name', 'firstname', 'lastname']
+    # rows converted at once when the kind is widened
+    chunk = 1 << 16
 
-    def next_value(self):
+    def __init__(self, directory, name, rows, kind=None, table=None):
+        self.directory = directory
+        self.name = name
+        self.rows = rows
+        self.table = table
+        if kind is None and table is not None:
+            kind = self.guess_kind(table)
+        self.kind = None
+        self.column = None
+        # {value: code} and the values by code, for strings
+        self.codes = None
+        self.values = None
+        # rows written so far
+        self.written = 0
+        if kind is not None:
+            dtype = None
+            if kind == 'string' and table is not None:
+                dtype = numpy.min_scalar_type(max(0, len(table) - 1))
+            self.retype(kind, dtype)
+
+    @classmethod
+    def guess_kind(cls, values):
         '''
-        Returns a random string based on ds_dict properties
+        Returns the narrowest kind of values, None if there are none .
         '''
-        ret = ''
-        if self.firstname == 'True':
-            fname_idx = random.randint(0, 1000) % len(self.fname)
-            ret = ret + self.fname[fname_idx]
-        if self.lastname == 'True':
-            lname_idx = random.randint(0, 1000) % len(self.lname)
-            if len(ret) > 0:
-                ret = ' ' + ret
-            ret = ret + self.lname[lname_idx]
-        return ret
+        if not values:
+            return None
+        if all(isinstance(value, (int, long)) and
+               -1 << 63 <= value < 1 << 63 for value in values):
+            return 'int'
+        if all(isinstance(value, float) or
+               isinstance(value, (int, long)) and
+               -1 << 63 <= value < 1 << 63 for value in values):
+            return 'float'
+        if all(isinstance(value, basestring) and cls.date_regex.match(value)
+               for value in values):
+            return 'date'
+        return 'string'
 
+    @staticmethod
+    def widen(kind, other):
+        '''
+        Returns the narrowest kind holding the values of both kinds .
+        '''
+        if other is None or other == kind:
+            return kind
+        if kind is None:
+            return other
+        if set((kind, other)) == set(('int', 'float')):
+            return 'float'
+        return 'string'
 
-# ------------------------------------------------------------------------------
-class Sequence(AbstractDataSet):
-    '''
-     ds_dict will contain the following:
-        {
-            "name" : <string value>
-            "start" : "<integer value>",
-            "increment" : "<integer value>"
-        }
-    '''
+    def code(self, value):
+        if not isinstance(value, basestring):
+            value = str(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
 
-    def __init__(self, ds_dict):
+    def retype(self, kind, dtype=None):
         '''
-        We will need to @override the constructor in order to add
-        the _cval property (current value in sequence) .
+        Makes the column one of kind (and dtype, default: wide enough
+        for any row), converting the rows already written .
         '''
-        super(Sequence, self).__init__(ds_dict)
-        self.__cval = int(self.start) - int(self.increment)
+        (column, previous) = (self.column, self.kind)
+        self.kind = kind
+        if kind == 'string':
+            if self.codes is None:
+                (self.codes, self.values) = ({}, [])
+                for value in self.table or ():
+                    self.code(value)
+            if dtype is None:
+                # at most a code per row besides the table
+                dtype = numpy.min_scalar_type(max(
+                    0, self.rows + len(self.table or ()) - 1))
+        else:
+            dtype = self.dtypes[kind]
+        filename = os.path.join(self.directory, self.name + '.npy')
+        self.column = numpy.lib.format.open_memmap(
+            filename if column is None else filename + '.tmp', mode='w+',
+            dtype=dtype, shape=(self.rows,))
+        if column is None:
+            return
+        for offset in xrange(0, self.written, self.chunk):
+            rows = column[offset:min(self.written, offset + self.chunk)]
+            if previous == 'string':
+                values = [self.values[code] for code in rows.tolist()]
+            elif previous == 'date':
+                values = [value.isoformat() for value in rows.tolist()]
+            else:
+                values = rows.tolist()
+            self.column[offset:offset + len(values)] = self.encode(values)
+        del column
+        os.rename(filename + '.tmp', filename)
 
-    def validation_list(self):
-        return ['name', 'start', 'increment']
+    def encode(self, values):
+        if self.codes is not None:
+            code = self.code
+            return [code(value) for value in values]
+        return values
 
-    def next_value(self):
+    def write(self, offset, values):
+        '''
+        Writes values to the rows offset .. offset + len(values) - 1 .
+        '''
+        kind = self.widen(self.kind, self.guess_kind(values))
+        if kind is None:
+            return
+        if kind != self.kind:
+            self.retype(kind)
+        values = self.encode(values)
+        if self.codes is not None and \
+                len(self.values) - 1 > numpy.iinfo(self.column.dtype).max:
+            self.retype('string')
+        self.column[offset:offset + len(values)] = values
+        self.written = max(self.written, offset + len(values))
+
+    def close(self):
         '''
-        Returns the next value in the sequence by adding the increment to
-        the current value
+        Flushes the column (and writes the dictionary) . Returns the
+        description of the column in the manifest (see ColumnReader) .
         '''
-        self.__cval += int(self.increment)
-        return self.__cval
+        if self.column is None:
+            # no values: an empty string column
+            self.retype('string')
+        self.column.flush()
+        description = {'kind': self.kind, 'rows': self.rows,
+                       'file': self.name + '.npy',
+                       'dtype': str(self.column.dtype)}
+        del self.column
+        if self.codes is not None:
+            values = [value.encode('utf-8') if isinstance(value, unicode)
+                      else value for value in self.values]
+            dictionary = numpy.array(values or [''],
+                                     dtype='S%d' % max([1] + map(len, values)))
+            description['dictionary'] = self.name + '.dict.npy'
+            numpy.save(os.path.join(self.directory,
+                                    description['dictionary']),
+                       dictionary[:len(values)])
+        return description
 
 
-# -----------------------------------------------------------------------------
-class NumberSequence(AbstractDataSet):
+class ColumnReader(object):
     '''
-     ds_dict will contain the following:
-        {
-            "name" : <string value>
-            "length" : "<integer value>",
-        }
+    Reads the columns written by DataSetEvaluator.write_columns into
+    directory . The columns are memory mapped, read only: nothing is
+    copied until the values are used .
+    The manifest, directory/columns.json, lists the columns with their
+    kind, rows, file and (strings) dictionary file .
     '''
-    seen = set()
 
-    def validation_list(self):
-        return ['name', 'length']
+    manifest = 'columns.json'
 
-    def next_value(self):
-        if (int(self.length) <= 0):
-            return ''
-        p = [str(random.randint(1, 9))]
-        p.extend(str(random.randint(0, 9)) for i in xrange(int(self.length) - 1))
-        p = ''.join(p)
-        return p
+    def __init__(self, directory):
+        self.directory = directory
+        f = open(os.path.join(directory, self.manifest))
+        try:
+            info = json.load(f)
+        finally:
+            f.close()
+        self.seed = info['seed']
+        self.start = info['start']
+        self.columns = info['columns']
 
+    def names(self):
+        return sorted(self.columns)
 
-# ------------------------------------------------------------------------------
-class AlphaNumeric(AbstractDataSet):
-    '''
-     ds_dict will contain the following:
-        {
-            "name" : <string value>
-            "min_length" : <long value>
-            "max_length" : <long value>
-            "alphabet" : <boolean value>
-            "numeric" : <boolean value>
-        }
-    '''
-    alpha = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-    number = "0123456789"
+    def kind(self, name):
+        return self.columns[name]['kind']
 
-    def validation_list(self):
-        return ["name", "min_length", "max_length", "alphabet", "numeric"]
+    def column(self, name):
+        '''
+        Returns the memory mapped column of name: the codes of its
+        dictionary for a string column (see @dictionary) .
+        '''
+        return numpy.load(os.path.join(self.directory,
+                                       self.columns[name]['file']),
+                          mmap_mode='r')
 
-    def next_value(self):
-        lst = ""
-        if self.alphabet == "True":
-            lst += self.alpha
-        if self.numeric == "True":
-            lst += self.number
-        return ''.join(lst[random.randint(0, 1000) % len(lst)] for i in
-                       xrange(random.randint(int(self.min_length), int(self.max_length))))
+    def dictionary(self, name):
+        '''
+        Returns the memory mapped bytes array of the distinct values of
+        a string column, indexed by code, None for other kinds .
+        '''
+        filename = self.columns[name].get('dictionary')
+        if filename is None:
+            return None
+        return numpy.load(os.path.join(self.directory, filename),
+                          mmap_mode='r')
+
+    def values(self, name):
+        '''
+        Returns the values of name: the column itself, or for strings
+        the (new) array of the decoded values .
+        '''
+        column = self.column(name)
+        dictionary = self.dictionary(name)
+        if dictionary is None:
+            return column
+        return dictionary[column]
 
 
 # ------------------------------------------------------------------------------
-class Date(AbstractDataSet):
+# Sharded generation . Every worker process builds its own DataSetEvaluator
+# (see _init_worker) and renders shards, i.e. contiguous ranges of rows .
+# Since data set values only depend on (seed, data set, row), every shard
+# renders exactly the rows a single process would .
+
+_worker_evaluator = None
+_worker_options = None
+
+
+def shard_ranges(start, count, shards):
     '''
-     ds_dict will contain the following:
-        {
-            "name" : <string value>
-            "max_year" : "<int value>",
-            "min_year" : "<int value>"
-        }
+    Splits range(start, start + count) in at most shards contiguous
+    (start, count) ranges of (almost) equal size .
     '''
+    size = max(1, -(-count // max(1, shards)))
+    return [(first, min(size, start + count - first))
+            for first in range(start, start + count, size)]
 
-    def validation_list(self):
-        return ["name", "max_year", "min_year"]
 
-    def next_value(self):
-        self.max_year = min(9999, int(self.max_year))
-        self.min_year = max(1, int(self.min_year))
-        if self.max_year == self.min_year:
-            return datetime.date.today().isoformat()
-        if self.max_year < self.min_year:
-            return datetime.date.today().isoformat()
-        dt = datetime.date(random.randint(self.min_year, self.max_year), random.randint(1, 12),
-                           random.randint(1, 28))
-        return dt.isoformat()
+def shard_filename(filename, shard):
+    '''
+    meal.sql -> meal.0003.sql
+    '''
+    (root, ext) = os.path.splitext(filename)
+    return '%s.%04d%s' % (root, shard, ext)
 
 
-# ------------------------------------------------------------------------------
-class RandomFoodImage(AbstractDataSet):
+def _init_worker(xml_filename, seed, block_size, checkpoint, records=False,
+                 cache=None):
+    global _worker_evaluator, _worker_options
+    _worker_evaluator = DataSetEvaluator.load(xml_filename, seed, records,
+                                              cache)
+    _worker_options = (block_size, checkpoint)
+
+
+def _shard_output(start, count):
+    _worker_evaluator.seek(start)
+    (block_size, checkpoint) = _worker_options
+    return _worker_evaluator.iter_output(count, block_size, checkpoint)
+
+
+def _render_shard(args):
+    (start, count) = args
+    return [text for (row, text) in _shard_output(start, count)]
+
+
+def _write_shard(args):
+    (start, count, filename) = args
+    out = open(filename, mode='w')
+    for (row, text) in _shard_output(start, count):
+        out.write(text)
+    out.close()
+    return filename
+
+
+def write_parallel(xml_filename, workers, output=sys.stdout, block_size=None,
+                   seed=None, start=0, count=None, checkpoint=None,
+                   shard_rows=None, records=False, progress=None, cache=None):
     '''
-    ds_dict will contain the following:
-        {
-            "name" : <string value>
-        }
+    Renders the rows of xml_filename on a pool of workers processes .
+    The range of rows is split in shards of shard_rows rows, the
+    shards are rendered by the workers and written to output in order .
+    See DataSetEvaluator for records, DataSetEvaluator.load for cache,
+    DataSetEvaluator.write_output for progress and
+    DataSetEvaluator.iter_output for the other arguments .
     '''
+    dsv = DataSetEvaluator.load(xml_filename, seed, records, cache)
+    if count is None:
+        count = dsv.iterations - start
+    if shard_rows is None:
+        # a few shards per worker keep the pool busy without holding
+        # too many rendered shards in memory
+        shard_rows = max(1, min(50000, -(-count // (workers * 4))))
+    shards = shard_ranges(start, count, -(-count // shard_rows))
 
-    ''' Random food images from Google '''
-    food_img_list = [
-        'http://cdn.playbuzz.com/cdn/89c9243a-e0cd-495e-90e0-11642327f13f/f4b834c8-a506-43f5-8c2c-3e125311275c_560_420.jpg',
-        'http://images2.fanpop.com/images/photos/5400000/Random-Food-random-5409310-1280-800.jpg',
-        'http://images4.fanpop.com/image/photos/23600000/creative-food-3-random-23639450-500-333.jpg',
-        'http://photos1.blogger.com/blogger/3914/618/1600/untitled1.JPG',
-        'http://www.hangukdrama.com/wp-content/uploads/2012/11/IMG_4526.jpg',
-        'http://images2.fanpop.com/images/photos/5400000/Random-Food-random-5409303-1280-800.jpg',
-        'http://40.media.tumblr.com/bbe6be2ef523c45a694cd570eb4d7deb/tumblr_inline_nocovf6iGQ1s9623o_500.jpg',
-        'https://images.rapgenius.com/ce46193adc445413cb49e35c0cefbb90.1000x669x1.jpg',
-        'http://stupiddope.com/wp-content/uploads/2014/04/gold-plated-grilled-cheese-sandwich-1.jpg',
-        'http://images2.fanpop.com/images/photos/5400000/Random-Food-random-5409295-1280-800.jpg',
-        'http://melissadreamsofsushi.com/wp-content/uploads/2013/11/IMG_3490.jpg',
-        'http://static.giantbomb.com/uploads/original/11/118908/2646473-6885497418-sicil.jpg',
-        'http://3.bp.blogspot.com/_VF64TeUDSR0/TSxboB_zruI/AAAAAAAAABY/rlNIAyYNS3E/s1600/bacon-wrapped-hot-dog-maple-bar.jpg',
-        'http://www.hungryhungryhippie.com/wp-content/uploads/2014/12/IMG_0887.jpg',
-        'http://2.bp.blogspot.com/-JRaJSeLq3Sw/Ui8FbMPm6yI/AAAAAAAAHh4/F_uZh6hrG2U/s1600/01+Candy+Show+Time.JPG']
+    import multiprocessing
+    pool = multiprocessing.Pool(workers, _init_worker,
+                                (xml_filename, dsv.seed, block_size,
+                                 checkpoint, records, cache))
+    try:
+        report = -(-start // 10000) * 10000
+        for ((first, size), texts) in \
+                zip(shards, pool.imap(_render_shard, shards)):
+            while progress and report < first + size:
+                progress(report)
+                report += 10000
+            write_texts(output, texts)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
 
-    def validation_list(self):
-        return ['name']
 
-    def next_value(self):
-        return random.choice(self.food_img_list)
+def write_shards(xml_filename, workers, filename, block_size=None,
+                 seed=None, start=0, count=None, checkpoint=None, cache=None):
+    '''
+    Renders the rows of xml_filename on a pool of workers processes,
+    one shard per worker, each shard written to its own file (see
+    @shard_filename) . Returns the list of written files .
+    '''
+    dsv = DataSetEvaluator.load(xml_filename, seed, cache=cache)
+    if count is None:
+        count = dsv.iterations - start
+    shards = [(first, size, shard_filename(filename, shard))
+              for (shard, (first, size)) in
+              enumerate(shard_ranges(start, count, workers))]
+
+    import multiprocessing
+    pool = multiprocessing.Pool(workers, _init_worker,
+                                (xml_filename, dsv.seed, block_size,
+                                 checkpoint, False, cache))
+    try:
+        filenames = pool.map(_write_shard, shards)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return filenames
 
 
 # ------------------------------------------------------------------------------
-class RandomIngredient(AbstractDataSet):
+# Jobs . A job manifest lists several configurations, run in the order of
+# their dependencies and concurrently when independent . A configuration
+# reads the keys of the ones it depends on through a KeySpace: since values
+# only depend on (seed, data set, row), the keys another configuration emits
+# are computed again from its XML file and seed, nothing is exchanged
+# between the processes .
+
+class ImportedKeys(object):
     '''
-    ds_dict will contain the following:
-        {
-            "name" : <string value>
-            "result" : <string value>
-        }
+    Stands in DataSetEvaluator.instances for the data set dataset of the
+    configuration config of a job, referenced as <config>.<data set>
+    by a ForeignKey . It has no values of its own, only the key_pool()
+    of the data set in that configuration .
     '''
 
-    ''' Random food ingredients '''
-    ingredient_type_list = ['curry powder', 'succotash', 'heavy cream', 'tofu', 'leeks', 'raw sugar',
-                            'cream of tartar', 'dried leeks', 'cranberries', 'pig\'s feet', 'lemon juice',
-                            'rabbits', 'peaches', 'black-eyed peas', 'onion powder', 'coriander', 'cannellini beans',
-                            'tortillas', 'chickpeas', 'green beans', 'wine', 'brandy', 'brown rice',
-                            'orange peels', 'cider vinegar', 'haddock', ' wine vinegar', 'spinach', 'amaretto',
-                            'chard', 'brunoise', 'oatmeal', 'navy beans', 'berries', 'cooking wine', 'corn syrup',
-                            'mmolasses', 'swiss cheese', 'thyme', 'breadfruit', 'pepper', 'hot sauce', 'potato chips',
-                            'cornmeal', 'plum tomatoes', 'graham crackers', 'apricot', 'quail', 'almond paste',
-                            'almonds', 'melons', 'mozzarella', 'cream', 'focaccia', 'bard', 'pasta', 'cabbage',
-                            'rosemary', 'crabs', 'pumpkins', 'oregano', 'bacon', 'milk', 'venison', 'pesto', 'sushi',
-                            'lettuce', 'cantaloupes', 'kale', 'eggs', 'shrimp', 'pinto beans', 'tomatoes',
-                            'tomato paste', 'celery seeds', 'garlic powder', 'chicken', 'lamb', 'barbecue sauce',
-                            'mushrooms', 'salt', 'chicory', 'flour', 'onion', 'coconut oil', 'olives', 'passion fruit',
-                            'pea beans', 'cheese', 'tartar sauce', 'pine nuts', 'lobsters', 'plums', 'yogurt',
-                            'oranges', 'corn', 'turkeys', 'ale', 'red beans', 'chestnuts', 'truffles', 'cheddar cheese',
-                            'basil', 'pickles', 'buttermilk', 'potatoes', 'butter', 'sour cream', 'tarragon',
-                            'pork', 'soy beans', 'rice', 'figs', 'salmon', 'hazelnuts', 'broccoli', 'margarine', 'eel',
-                            'parsley', 'sauerkraut', 'beef', 'liver', 'mackerel', 'prunes', 'maple syrup', 'apples',
-                            'granola', 'pears', 'water', 'ham', 'radishes', 'bagels', 'honey', 'steak', 'macaroni',
-                            'pineapples', 'squid', 'cherries', 'walnuts', 'fish sauce', 'cocoa powder',
-                            'brussel sprouts', 'garlic', 'ketchup', 'tonic water', 'ginger', 'tuna']
+    def __init__(self, config, dataset, key_space):
+        self.config = config
+        self.dataset = dataset
+        self.key_space = key_space
+        self.escape = None
 
-    ''' Unit amounts '''
-    ingredient_unit_amt_list = ['1/2', '1/4', '1/5', '3/4', '1/16', '1/8', '3/8', '2/3', '1/6', '1', '2', '3', '4', '5',
-                                '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19', '20',
-                                '100', '140', '160', '200', '240', '300', '180', '220', '250', '280', '500', '450']
+    def dependencies(self):
+        return []
 
-    ''' Ingredient unit '''
-    ingredient_unit_list = ['teaspoon', 'tablespoon', 'cup', 'oz', 'quart', 'lb', 'cubic centimeter', 'cm', 'liter',
-                            'ml', 'gram', 'kg', 'pint', 'gallon', 'ounce']
+    def capacity(self):
+        return None
 
-    def validation_list(self):
-        return ['name', 'result']
+    def is_constant(self):
+        return False
 
-    def next_value(self):
-        if self.result == 'IngredientType':
-            return random.choice(self.ingredient_type_list)
-        elif self.result == 'IngredientUnitAmt':
-            return random.choice(self.ingredient_unit_amt_list)
-        elif self.result == 'IngredientUnit':
-            return random.choice(self.ingredient_unit_list)
+    def set_escape(self, quote):
+        self.escape = quote
 
+    def set_seed(self, seed):
+        # the seed of the configuration is the one of the job
+        pass
 
-# ------------------------------------------------------------------------------
-class MealType(AbstractDataSet):
-    '''
-    ds_dict will contain the following:
-        {
-            "name" : <string value>
-        }
-    '''
+    def link(self, instances, rows):
+        pass
 
-    ''' Valid food types '''
-    food_type_list = ['Breakfast', 'Lunch', 'Dinner']
+    def iterations(self):
+        return self.key_space.evaluator(self.config).iterations
 
-    def validation_list(self):
-        return ['name']
+    def value_kind(self):
+        return None
 
-    def next_value(self):
-        return random.choice(self.food_type_list)
+    def key_pool(self, rows, escape=None):
+        evaluator = self.key_space.evaluator(self.config)
+        if self.dataset not in evaluator.instances:
+            raise ConfigError(['Data set \'%s\' is not used by the '
+                               'configuration \'%s\' .' %
+                               (self.dataset, self.config)])
+        return evaluator.instances[self.dataset].key_pool(rows, escape)
 
 
-# ------------------------------------------------------------------------------
-class DataSetBuilder(object):
+class KeySpace(object):
     '''
-    Returns a new instance of a data set based on
-    subclass name (see @get_name function)
+    The configurations of a job whose data sets a configuration may
+    reference: visible, the names of the configurations it depends on
+    (transitively), among configs, {name: config} (see Job) .
+    The evaluators of the referenced configurations are loaded once
+    (through cache, a ConfigCache, if given) .
     '''
 
-    def __init__(self):
+    def __init__(self, configs, visible, cache=None):
+        self.configs = configs
+        self.visible = set(visible)
+        self.cache = cache
+        self.evaluators = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['evaluators'] = {}
+        return state
+
+    def names(self):
+        return sorted(self.visible)
+
+    def source(self, reference):
         '''
-        __classes will be a dictionary of AbstractDataSet subclasses
-        in the following form:
-        {
-            <__classname__1>:<__class_object__1>,
-            <__classname__2>:<__class_object__2>,
-            ...
-        }
+        Returns the ImportedKeys of reference, <config>.<data set>, None
+        if config is not visible .
         '''
-        # @PydevCodeAnalysisIgnore
-        self.classes = {c.__name__: c for c in \
-                        AbstractDataSet.__subclasses__()}
+        (config, dot, dataset) = reference.partition('.')
+        if not dot or config not in self.visible:
+            return None
+        return ImportedKeys(config, dataset, self)
 
-    def new(self, name, ds_dict):
+    def space(self, name):
         '''
-        Returns the instance of the class based on class name .
-        Every object instantiated with this method will be instances
-        of AbstractDataSet subclasses .
+        Returns the KeySpace of the configuration name .
         '''
-        return self.classes[name](ds_dict)
+        return KeySpace(self.configs, Job.closure(self.configs, name),
+                        self.cache)
 
+    def evaluator(self, name):
+        if name not in self.evaluators:
+            config = self.configs[name]
+            self.evaluators[name] = DataSetEvaluator.load(
+                config['input'], config['seed'], cache=self.cache,
+                key_space=self.space(name), overrides=config['overrides'])
+        return self.evaluators[name]
 
-# ------------------------------------------------------------------------------
-class DataSetEvaluator(object):
-    def __init__(self, xml_filename):
-        # Build element tree
-        self.__elem_tree = ElementTree()
-        self.__elem_tree.parse(xml_filename)
 
-        # Initialize class attributes
-        self.instances = self.init_instances()
-        self.instances_values = self.update_iterations_values()
-        self.iterations = int(self.init_iterations())
-        self.template = self.init_template()
+class Job(object):
+    '''
+    A job manifest, e.g.
+        <job>
+            <config name="users" input="user_gen.xml" output="users.sql"/>
+            <config name="meals" input="meal_gen.xml" depends="users">
+                <dataset name="user_id" type="ForeignKey"
+                         references="users.user_id"/>
+            </config>
+        </job>
+    The attributes of a <config> are:
+        "name" : <string value>
+        "input" : <XML file> (relative to the manifest)
+        "output" : <file or directory> (default: <name>.sql)
+        "format" : sql, insert, csv, tsv, sqlite or columns (default sql)
+        "depends" : <comma separated config names> (default: none)
+        "seed" : <integer value> (default: drawn from the job seed)
+        "block_size", "batch_size" : see the command line options
+    The nested <dataset> elements replace the data sets of the same
+    name in input . A configuration runs after the ones it depends on
+    and its ForeignKeys may reference their data sets as
+    <config>.<data set> (see KeySpace) .
+    '''
 
-    def init_instances(self):
-        '''
-        Parse __elem_tree to determine and new the data
-        set objects present in the XML file .
-        '''
-        # Obtain all the <dataset> elements from the XML file
-        instances = {}
-        dsb = DataSetBuilder()
-        dataset_list = list(self.__elem_tree.iter("dataset"))
-        if len(dataset_list) == 0:
-            sys.stderr.write('Warning: Data sets not defined.\n')
-        for dataset in dataset_list:
-            if 'name' in dataset.attrib.keys():
-                dataset_name = dataset.attrib['name']
-            else:
-                sys.stderr.write('Error: Unnamed data set. Aborting .\n')
-                sys.stderr.write('Exiting (-1)')
-                sys.exit(-1)
-            if 'type' in dataset.attrib.keys():
-                dataset_type = dataset.attrib['type']
-            else:
-                sys.stderr.write('Error: Untyped data set. Aborting. \n')
-                sys.stderr.write('Exiting (-1)')
-                sys.exit(-1)
-            # Create the ds_dict for the Abstract Data Set subclasses
-            ds_dict = {key: value for (key, value) in dataset.attrib.items() if
-                       key != 'type'}
-            # Build instances of Data Sets
-            if dataset_type not in dsb.classes:
-                sys.stderr.write('Error: Unknown type: \'%s\'. Aborting. \n' %
-                                 dataset_type)
-                sys.stderr.write('Exiting (-1) .\n')
-                sys.exit(-1)
-            instances[dataset_name] = dsb.new(dataset_type, ds_dict)
-        return instances
+    formats = ('sql', 'insert', 'csv', 'tsv', 'sqlite', 'columns')
 
-    def init_iterations(self):
+    def __init__(self, filename, seed=None):
         '''
-        Returns the number of iterations (how many subsequent lines
-        to generate)
+        Raises ConfigError listing every problem of the manifest .
         '''
-        return int(self.__elem_tree.getroot().attrib['iterations'])
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(32)
+        self.seed = seed
+        directory = os.path.dirname(os.path.abspath(filename))
+        tree = ElementTree()
+        tree.parse(filename)
+        errors = []
+        self.names = []
+        self.configs = {}
+        for element in tree.getroot().findall('config'):
+            (config, config_errors) = self.parse_config(element, directory)
+            errors.extend(config_errors)
+            if config is not None:
+                self.names.append(config['name'])
+                self.configs[config['name']] = config
+        if not self.names and not errors:
+            errors.append('No <config> in the job .')
+        for name in self.names:
+            for dependency in self.configs[name]['depends']:
+                if dependency not in self.configs:
+                    errors.append('Unknown configuration \'%s\' in the '
+                                  'depends of \'%s\' .' % (dependency, name))
+        if errors:
+            raise ConfigError(errors)
+        for name in self.names:
+            if name in self.closure(self.configs, name):
+                raise ConfigError(['Configuration \'%s\' depends on itself .'
+                                   % name])
 
-    def init_template(self):
+    def parse_config(self, element, directory):
         '''
-        Retrieves the template string from the XML file
+        Returns the (config, errors) of a <config> element, config being
+        None if it cannot be used at all .
         '''
-        return self.__elem_tree.findall('template')[0].text
+        attrib = element.attrib
+        name = attrib.get('name')
+        if name is None or not re.match(r'^\w+$', name):
+            return (None, ['Invalid configuration name \'%s\' .' % name])
+        prefix = 'Configuration \'%s\': ' % name
+        if name in self.configs:
+            return (None, [prefix + 'duplicate name .'])
+        errors = []
+        known = ('name', 'input', 'output', 'format', 'depends', 'seed',
+                 'block_size', 'batch_size')
+        for key in sorted(attrib):
+            if key not in known:
+                errors.append(prefix + 'unknown property \'%s\' .' % key)
+        config = {'name': name, 'format': attrib.get('format', 'sql'),
+                  'depends': [dependency.strip() for dependency in
+                              attrib.get('depends', '').split(',')
+                              if dependency.strip()],
+                  'overrides': [dict(dataset.attrib) for dataset in
+                                element.findall('dataset')]}
+        if 'input' not in attrib:
+            errors.append(prefix + 'missing property \'input\' .')
+        else:
+            config['input'] = os.path.join(directory, attrib['input'])
+            if not os.path.isfile(config['input']):
+                errors.append(prefix + 'no file %s .' % attrib['input'])
+        config['output'] = os.path.join(directory,
+                                        attrib.get('output', name + '.sql'))
+        if config['format'] not in self.formats:
+            errors.append(prefix + 'format \'%s\' is not one of %s .' %
+                          (config['format'], ', '.join(self.formats)))
+        config['seed'] = _mix64((self.seed * CounterRandom.golden +
+                                 (zlib.crc32(name) & 0xffffffff)) &
+                                MASK64) & 0xffffffff
+        for (key, default) in (('seed', config['seed']), ('block_size', None),
+                               ('batch_size', 1000)):
+            config[key] = default
+            if key in attrib:
+                try:
+                    config[key] = int(attrib[key])
+                except ValueError:
+                    errors.append(prefix + 'property \'%s\': \'%s\' is not '
+                                  'an integer .' % (key, attrib[key]))
+        return (config, errors)
 
-    def update_iterations_values(self):
+    @staticmethod
+    def closure(configs, name):
         '''
-        Keep a dictionary with instances values to preserve next_value()
-        across iteration .
+        Returns the set of the configurations name depends on,
+        transitively .
         '''
-        return {key: instance.next_value() for (key, instance) in \
-                self.instances.items()}
+        found = set()
+        pending = list(configs[name]['depends'])
+        while pending:
+            dependency = pending.pop()
+            if dependency not in found:
+                found.add(dependency)
+                pending.extend(configs[dependency]['depends'])
+        return found
+
+    def key_space(self, name, cache=None):
+        return KeySpace(self.configs, self.closure(self.configs, name), cache)
 
-    def write_output(self, output=sys.stdout):
+    def run(self, workers=None, cache=None, block_size=None, log=sys.stderr):
         '''
-        Parse the template and write the output to a stream .
-        The default stream is sys.stdout .
+        Runs the configurations on a pool of workers processes (default:
+        one per CPU), each one as soon as the ones it depends on are
+        done . block_size is the default of the configurations . Writes
+        a line per configuration done to log, if given . Raises
+        ConfigError (and runs nothing more) if a configuration fails .
         '''
-        # Find all #{data_set_names} and replace them with
-        # self.instances[data_set_name].next_value()
-        regex = '(?:^|(?<=[^#]))#{\w+}'
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        pending = list(self.names)
+        running = {}
+        done = set()
+        try:
+            while pending or running:
+                for name in list(pending):
+                    if set(self.configs[name]['depends']) <= done:
+                        pending.remove(name)
+                        running[name] = pool.apply_async(
+                            _run_config, (self.configs[name],
+                                          self.key_space(name, cache), cache,
+                                          block_size))
+                finished = [name for name in sorted(running)
+                            if running[name].ready()]
+                if not finished:
+                    time.sleep(0.05)
+                    continue
+                for name in finished:
+                    (rows, seconds, errors) = running.pop(name).get()
+                    if errors:
+                        raise ConfigError(['%s: %s' % (name, error)
+                                           for error in errors])
+                    done.add(name)
+                    if log is not None:
+                        log.write('%s: %d rows written to %s in %.1fs .\n' %
+                                  (name, rows, self.configs[name]['output'],
+                                   seconds))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+def write_config(dsv, config, block_size=None):
+    '''
+    Writes the output of dsv for the job configuration config (see Job) .
+    '''
+    output = config['output']
+    block_size = config['block_size'] or block_size
+    if config['format'] in ('csv', 'tsv', 'columns'):
+        if not os.path.isdir(output):
+            os.makedirs(output)
+    if config['format'] == 'columns':
+        dsv.write_columns(output, block_size=block_size)
+        return
+    if config['format'] in ('csv', 'tsv'):
+        writer = TableFileWriter(output, dsv.statements,
+                                 {'csv': 'excel', 'tsv': 'excel-tab'}[
+                                     config['format']])
+        dsv.write_output(writer, block_size=block_size)
+        writer.close()
+        return
+    if config['format'] == 'sqlite':
+        writer = SQLiteWriter(output, dsv.statements, config['batch_size'])
+        dsv.write_output(writer, block_size=block_size)
+        writer.close()
+        return
+    compression = {'.gz': 'gzip', '.bz2': 'bz2'}.get(
+        os.path.splitext(output)[1])
+    out = RollingOutput(output, compression=compression)
+    pipe = PipelinedWriter(out)
+    writer = pipe
+    if config['format'] == 'insert':
+        writer = BatchedInsertWriter(pipe, dsv.statements,
+                                     config['batch_size'])
+    dsv.write_output(writer, block_size=block_size)
+    writer.close()
+    if writer is not pipe:
+        pipe.close()
+    out.close()
 
-        def inner_subst(matchobj):
-            # Removing unneeded characters from key
-            key = matchobj.group(0)
-            for c in ['{', '#', '}']:
-                key = key.replace(c, '')
-            # replace #{word} with instance values .
-            return str(self.instances_values[key])
 
-        for i in range(self.iterations):
-            if (i % 10000 == 0):
-                print i
-            output.write(re.sub(regex, inner_subst, self.template))
-            self.instances_values = self.update_iterations_values()
+def _run_config(config, key_space, cache, block_size):
+    '''
+    Runs a configuration of a job in a worker process . Returns (rows,
+    seconds, errors) .
+    '''
+    started = time.time()
+    try:
+        dsv = DataSetEvaluator.load(
+            config['input'], config['seed'],
+            config['format'] not in ('sql', 'columns'), cache, key_space,
+            config['overrides'])
+        write_config(dsv, config, block_size)
+    except ConfigError as err:
+        return (None, None, err.errors)
+    except (IOError, OSError) as err:
+        return (None, None, [str(err)])
+    return (dsv.iterations, time.time() - started, None)
 
 
 # ------------------------------------------------------------------------------
@@ -535,19 +5018,278 @@ class DataSetEvaluator(object):
 if __name__ == '__main__':
     ap = argparse.ArgumentParser(description='  Generate test data.')
     ap.add_argument('-i', '--input', dest='ifile', help='the input file (XML)')
+    ap.add_argument('-j', '--job', dest='job', metavar='MANIFEST',
+                    help='run the configurations of the job MANIFEST (see '
+                         'Job), with --workers processes, instead of IFILE')
     ap.add_argument('-o', '--output', dest='ofile',
                     help='the output file (TEXT)')
+    ap.add_argument('-b', '--block-size', dest='block_size', type=int,
+                    help='render rows in blocks of BLOCK_SIZE rows, '
+                         'drawing each data set\'s values with NumPy')
+    ap.add_argument('-w', '--workers', dest='workers', type=int,
+                    help='generate on a pool of WORKERS processes')
+    ap.add_argument('--per-shard', dest='per_shard', action='store_true',
+                    help='with --workers, write one output file per worker '
+                         '(OFILE.0000, OFILE.0001, ...) instead of merging '
+                         'the shards in order')
+    ap.add_argument('-s', '--seed', dest='seed', type=int,
+                    help='seed of the generated values (default: random); '
+                         'the same seed always generates the same output')
+    ap.add_argument('--start', dest='start', type=int, default=0,
+                    help='index of the first row to generate (default: 0)')
+    ap.add_argument('--count', dest='count', type=int,
+                    help='number of rows to generate, START + COUNT being '
+                         'at most the iterations of the input file (default: '
+                         'up to the iterations)')
+    ap.add_argument('--checkpoint', dest='checkpoint', type=int,
+                    help='write a checkpoint marker every CHECKPOINT rows')
+    ap.add_argument('--resume', dest='resume', action='store_true',
+                    help='resume an interrupted run in OFILE from its last '
+                         'checkpoint marker')
+    ap.add_argument('-f', '--format', dest='format', default='sql',
+                    choices=['sql', 'insert', 'csv', 'tsv', 'sqlite',
+                             'columns'],
+                    help='sql: the template as is (default); insert: '
+                         'multi-row INSERT statements of BATCH_SIZE rows; '
+                         'csv, tsv: one TABLE.csv (.tsv) file per table in '
+                         'the OFILE directory, for LOAD DATA INFILE; '
+                         'sqlite: insert into the SQLite database OFILE; '
+                         'columns: one NAME.npy column file per data set in '
+                         'the OFILE directory (requires NumPy)')
+    ap.add_argument('-z', '--compress', dest='compress',
+                    choices=['gzip', 'bz2'],
+                    help='compress OFILE (default: gzip for a .gz OFILE, bz2 '
+                         'for a .bz2 OFILE)')
+    ap.add_argument('--max-file-size', dest='max_file_size', type=parse_size,
+                    help='split OFILE between rows (statements with '
+                         '--format insert) in files of at most MAX_FILE_SIZE '
+                         'bytes (e.g. 512M) before compression: '
+                         'meal.sql -> meal_0001.sql, meal_0002.sql, ...')
+    ap.add_argument('--pipe-to', dest='pipe_to', metavar='COMMAND',
+                    help='stream the output into the stdin of COMMAND, run '
+                         'by the shell (e.g. "mysql -u root meals"), '
+                         'instead of OFILE')
+    ap.add_argument('-q', '--quiet', dest='quiet', action='store_true',
+                    help='do not report the progress on stderr')
+    ap.add_argument('--stats', dest='stats', nargs='?', const='-',
+                    metavar='FILE',
+                    help='report the rows/s with the progress and write the '
+                         'statistics of the run (time and calls of every '
+                         'data set, rendering and writing time, peak memory) '
+                         'as JSON to FILE (default: stderr)')
+    ap.add_argument('--profile', dest='profile', metavar='PROF',
+                    help='run under cProfile and dump the profile to PROF '
+                         '(see the pstats module)')
+    ap.add_argument('--cache-dir', dest='cache_dir',
+                    default=ConfigCache.default_directory(),
+                    help='directory of the compiled configurations, reused '
+                         'by the runs of the same input file (default: '
+                         '$PYSERT_CACHE_DIR or ~/.cache/pysert)')
+    ap.add_argument('--no-cache', dest='no_cache', action='store_true',
+                    help='compile the input file without the cache')
+    ap.add_argument('--batch-size', dest='batch_size', type=int,
+                    default=1000,
+                    help='rows per INSERT statement with --format insert, '
+                         'per executemany() with --format sqlite '
+                         '(default: 1000)')
 
     results = ap.parse_args()
+    if results.block_size is not None and results.block_size < 1:
+        ap.error('--block-size must be positive')
+    if results.workers is not None and results.workers < 1:
+        ap.error('--workers must be positive')
+    if results.checkpoint is not None and results.checkpoint < 1:
+        ap.error('--checkpoint must be positive')
+    if results.job is not None:
+        if results.ifile is not None or results.ofile is not None:
+            ap.error('--job cannot be combined with an input or output file')
+        try:
+            job = Job(results.job, results.seed)
+            job.run(results.workers, None if results.no_cache else
+                    ConfigCache(results.cache_dir), results.block_size,
+                    None if results.quiet else sys.stderr)
+        except ConfigError as err:
+            for error in err.errors:
+                sys.stderr.write('Error: %s\n' % error)
+            sys.stderr.write('Exiting (-1) .\n')
+            sys.exit(-1)
+        sys.exit(0)
     if results.ifile is None:
         ap.error('Input file (IFILE) cannot be empty')
         sys.exit(-1)
+    if results.per_shard and (results.workers is None or
+                              results.ofile is None):
+        ap.error('--per-shard requires --workers and an output file (OFILE)')
+    records = results.format not in ('sql', 'columns')
+    if results.format != 'sql' and (results.per_shard or results.checkpoint or
+                                    results.resume):
+        ap.error('--format %s cannot be combined with --per-shard, '
+                 '--checkpoint or --resume' % results.format)
+    if results.format == 'columns':
+        if not numpy:
+            ap.error('--format columns requires NumPy')
+        if results.workers is not None:
+            ap.error('--format columns cannot be combined with --workers')
+    if results.batch_size < 1:
+        ap.error('--batch-size must be positive')
+    if results.format == 'sqlite' and results.ofile is None:
+        ap.error('--format sqlite requires a database file (OFILE)')
+    compression = results.compress
+    if compression is None and results.ofile is not None:
+        compression = {'.gz': 'gzip', '.bz2': 'bz2'}.get(
+            os.path.splitext(results.ofile)[1])
+    if compression or results.max_file_size:
+        if results.ofile is None or results.format not in ('sql', 'insert'):
+            ap.error('--compress and --max-file-size require an output file '
+                     '(OFILE) and --format sql or insert')
+        if results.per_shard or results.resume:
+            ap.error('--compress and --max-file-size cannot be combined with '
+                     '--per-shard or --resume')
+    if results.pipe_to is not None:
+        if results.ofile is not None or results.compress or \
+                results.max_file_size or results.per_shard or \
+                results.resume or results.format not in ('sql', 'insert'):
+            ap.error('--pipe-to requires --format sql or insert and cannot '
+                     'be combined with an output file (OFILE), --compress, '
+                     '--max-file-size, --per-shard or --resume')
+    if results.stats is not None and (results.workers is not None or
+                                      results.format == 'columns'):
+        ap.error('--stats cannot be combined with --workers, --per-shard or '
+                 '--format columns')
+    progress = None if results.quiet else report_progress
+
+    cache = None if results.no_cache else ConfigCache(results.cache_dir)
+    try:
+        dsv = DataSetEvaluator.load(results.ifile, results.seed, records,
+                                    cache)
+    except ConfigError as err:
+        for error in err.errors:
+            sys.stderr.write('Error: %s\n' % error)
+        sys.stderr.write('Exiting (-1) .\n')
+        sys.exit(-1)
+
+    mode = 'w'
+    if results.resume:
+        if results.ofile is None or results.per_shard:
+            ap.error('--resume requires a single output file (OFILE)')
+        if results.start or results.count is not None:
+            ap.error('--resume cannot be combined with --start or --count')
+        found = None
+        if os.path.exists(results.ofile):
+            found = find_checkpoint(results.ofile)
+        if found is not None:
+            (offset, results.start, seed, results.checkpoint) = found
+            if results.seed is not None and results.seed != seed:
+                ap.error('--seed %d does not match the seed of %s (%d)' %
+                         (results.seed, results.ofile, seed))
+            results.seed = seed
+            dsv.set_seed(seed)
+            # drop everything rendered after the checkpoint
+            out = open(results.ofile, mode='r+b')
+            out.truncate(offset)
+            out.close()
+            mode = 'a'
+        elif results.checkpoint is None:
+            ap.error('--resume requires --checkpoint when %s has no '
+                     'checkpoint marker yet' % results.ofile)
+    try:
+        dsv.check_rows(results.start, results.count)
+    except ConfigError as err:
+        for error in err.errors:
+            sys.stderr.write('Error: %s\n' % error)
+        sys.stderr.write('Exiting (-1) .\n')
+        sys.exit(-1)
+
+    if results.format == 'columns':
+        directory = results.ofile or '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        try:
+            dsv.write_columns(directory, block_size=results.block_size,
+                              start=results.start, count=results.count,
+                              progress=progress)
+        except ConfigError as err:
+            for error in err.errors:
+                sys.stderr.write('Error: %s\n' % error)
+            sys.stderr.write('Exiting (-1) .\n')
+            sys.exit(-1)
+        sys.exit(0)
 
-    dsv = DataSetEvaluator(results.ifile)
+    if results.per_shard:
+        write_shards(results.ifile, results.workers, results.ofile,
+                     block_size=results.block_size, seed=dsv.seed,
+                     start=results.start, count=results.count,
+                     checkpoint=results.checkpoint, cache=cache)
+        sys.exit(0)
 
-    if results.ofile is None:
-        dsv.write_output()
+    stats = None
+    if results.stats is not None:
+        stats = RunStats()
+        stats.instrument(dsv)
+        if progress is not None:
+            progress = stats.progress
+
+    # the text output (of --format sql and insert), written on its own thread
+    out = None
+    if results.format in ('sql', 'insert'):
+        if results.pipe_to is not None:
+            out = PipeOutput(results.pipe_to)
+        elif results.ofile is None:
+            out = sys.stdout
+        elif compression or results.max_file_size:
+            out = RollingOutput(results.ofile, results.max_file_size,
+                                compression)
+        else:
+            out = open(results.ofile, mode=mode)
+        pipe = PipelinedWriter(out if stats is None else
+                               stats.output(out, 'io'))
+
+    if results.format in ('csv', 'tsv'):
+        directory = results.ofile or '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        writer = TableFileWriter(directory, dsv.statements,
+                                 {'csv': 'excel', 'tsv': 'excel-tab'}[
+                                     results.format])
+    elif results.format == 'sqlite':
+        writer = SQLiteWriter(results.ofile, dsv.statements,
+                              results.batch_size)
+    elif results.format == 'insert':
+        writer = BatchedInsertWriter(pipe, dsv.statements, results.batch_size)
     else:
-        out = open(results.ofile, mode='w')
-        dsv.write_output(output=out)
-        out.close()
+        writer = pipe
+
+    options = dict(block_size=results.block_size, start=results.start,
+                   count=results.count, checkpoint=results.checkpoint,
+                   progress=progress)
+    profiler = None
+    if results.profile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        if results.workers is not None:
+            write_parallel(results.ifile, results.workers, output=writer,
+                           seed=dsv.seed, records=records, cache=cache,
+                           **options)
+        elif stats is not None:
+            dsv.write_output(output=stats.output(writer, 'write'),
+                             stats=stats, **options)
+        else:
+            dsv.write_output(output=writer, **options)
+        writer.close()
+        if out is not None:
+            if writer is not pipe:
+                pipe.close()
+            if out is not sys.stdout:
+                out.close()
+    except PipeError as err:
+        sys.stderr.write('Error: %s\n' % err)
+        sys.stderr.write('Exiting (-1) .\n')
+        sys.exit(-1)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(results.profile)
+    if stats is not None:
+        stats.write_report(results.stats, dsv.row - results.start)
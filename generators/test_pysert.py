@@ -0,0 +1,644 @@
+'''
+Tests of pysert.py, run with pytest . pysert.py is run as a script by the
+Python 2 interpreter PYSERT_PYTHON (default: the interpreter running the
+tests if it is Python 2, python2 otherwise), on the shipped configurations
+shrunk to a few iterations . Every test fails if that interpreter is not
+a Python 2 one .
+'''
+import csv
+import json
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PYTHON = os.environ.get('PYSERT_PYTHON', sys.executable
+                        if sys.version_info[0] == 2 else 'python2')
+
+INSERT = re.compile(r"INSERT INTO (\w+)\(([^)]*)\) VALUES\s*\((.*?)\);", re.S)
+LITERAL = re.compile(r"'((?:[^']|'')*)'")
+
+
+def pysert(*args, **kwargs):
+    '''
+    Runs pysert.py with args and returns its output (text) .
+    '''
+    env = dict(os.environ, PYSERT_CACHE_DIR=kwargs.get('cache', ''))
+    command = [PYTHON, os.path.join(HERE, 'pysert.py'), '-q']
+    if 'cache' not in kwargs:
+        command.append('--no-cache')
+    output = subprocess.check_output(command + list(args), env=env)
+    return output.decode('utf-8')
+
+
+def pysert_error(*args, **kwargs):
+    '''
+    Runs pysert.py with args, which must fail, and returns its error
+    output (text) .
+    '''
+    env = dict(os.environ, PYSERT_CACHE_DIR=kwargs.get('cache', ''))
+    process = subprocess.Popen([PYTHON, os.path.join(HERE, 'pysert.py'),
+                                '-q', '--no-cache'] + list(args), env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (output, error) = process.communicate()
+    assert process.returncode != 0, output
+    return error.decode('utf-8')
+
+
+def config(tmpdir, name, iterations):
+    '''
+    Writes the shipped configuration name with iterations iterations
+    to tmpdir and returns its path .
+    '''
+    with open(os.path.join(HERE, name)) as f:
+        text = re.sub(r'iterations="\d+"', 'iterations="%d"' % iterations,
+                      f.read(), count=1)
+    path = tmpdir.join(name)
+    path.write(text)
+    return str(path)
+
+
+@pytest.fixture(scope='module', autouse=True)
+def python2():
+    try:
+        subprocess.check_output([PYTHON, '-c', 'import sys; '
+                                 'assert sys.version_info[0] == 2'])
+    except (OSError, subprocess.CalledProcessError):
+        pytest.fail('%s is not a Python 2 interpreter: set PYSERT_PYTHON to '
+                    'one to run the tests' % PYTHON, pytrace=False)
+
+
+def test_foreign_keys_reference_emitted_keys(tmpdir):
+    '''
+    Every key column of meal_gen (a column named like the <table>_id
+    key of a table) holds a key already inserted into that table, in
+    the outer and in the nested templates .
+    '''
+    xml = config(tmpdir, 'meal_gen.xml', 2000)
+    for args in ([], ['-b', '300']):
+        emitted = {}
+        checked = 0
+        for match in INSERT.finditer(pysert('-i', xml, '-s', '7', *args)):
+            table = match.group(1).lower()
+            columns = [column.strip(' `')
+                       for column in match.group(2).split(',')]
+            row = dict(zip(columns, LITERAL.findall(match.group(3))))
+            for (column, value) in row.items():
+                if column != table + '_id' and column in emitted:
+                    assert value in emitted[column], (table, column, value)
+                    checked += 1
+            if columns[0] == table + '_id':
+                emitted.setdefault(columns[0], set()).add(row[columns[0]])
+        assert checked > 2000
+
+
+def test_blocks_render_the_rows(tmpdir):
+    '''
+    Rows rendered in blocks of any size (values drawn with batch_at())
+    are the rows rendered one by one, byte for byte .
+    '''
+    for name in ('meal_gen.xml', 'user_gen.xml'):
+        xml = config(tmpdir, name, 300)
+        expected = pysert('-i', xml, '-s', '3')
+        for size in ('1', '7', '64', '1000'):
+            assert pysert('-i', xml, '-s', '3', '-b', size) == expected, \
+                (name, size)
+
+
+def test_block_size_is_positive(tmpdir):
+    xml = config(tmpdir, 'user_gen.xml', 10)
+    for size in ('0', '-1'):
+        assert '--block-size must be positive' in \
+            pysert_error('-i', xml, '-b', size)
+
+
+def test_workers_render_the_rows(tmpdir):
+    '''
+    The shards rendered by a pool of workers, merged in order or written
+    one file per shard, are the rows a single process renders .
+    '''
+    xml = config(tmpdir, 'meal_gen.xml', 300)
+    expected = pysert('-i', xml, '-s', '3')
+    for args in (['-w', '1'], ['-w', '2'], ['-w', '3', '-b', '50']):
+        assert pysert('-i', xml, '-s', '3', *args) == expected, args
+    output = str(tmpdir.join('meal.sql'))
+    pysert('-i', xml, '-s', '3', '-w', '2', '--per-shard', '-o', output)
+    texts = []
+    for path in sorted(tmpdir.listdir('meal.*.sql')):
+        texts.append(path.read())
+    assert len(texts) > 1
+    assert ''.join(texts) == expected
+
+
+def test_workers_and_checkpoint_are_positive(tmpdir):
+    xml = config(tmpdir, 'user_gen.xml', 10)
+    assert '--workers must be positive' in pysert_error('-i', xml, '-w', '0')
+    assert '--checkpoint must be positive' in \
+        pysert_error('-i', xml, '--checkpoint', '0')
+
+
+def test_row_ranges_render_the_rows(tmpdir):
+    '''
+    Any row can be rendered on its own: the --start/--count pieces of a
+    run, in row or block mode, put together are the output of the run,
+    and ranges outside the iterations are refused .
+    '''
+    xml = config(tmpdir, 'meal_gen.xml', 300)
+    expected = pysert('-i', xml, '-s', '3')
+    for args in ([], ['-b', '64']):
+        assert ''.join(pysert('-i', xml, '-s', '3', '--start', str(start),
+                              '--count', str(count), *args)
+                       for (start, count) in ((0, 1), (1, 99), (100, 137),
+                                              (237, 63))) == expected
+    for args in (['--start', '301'], ['--start', '-1'],
+                 ['--start', '200', '--count', '101'], ['--count', '-1']):
+        pysert_error('-i', xml, '-s', '3', *args)
+
+
+def test_resume_completes_the_output(tmpdir):
+    '''
+    A run resumed from the last checkpoint of its truncated output file
+    writes the output of the uninterrupted run .
+    '''
+    xml = config(tmpdir, 'meal_gen.xml', 300)
+    output = str(tmpdir.join('meal.sql'))
+    pysert('-i', xml, '-s', '3', '--checkpoint', '50', '-o', output)
+    with open(output, 'rb') as f:
+        expected = f.read()
+    for size in (len(expected) // 3, len(expected) * 2 // 3):
+        with open(output, 'wb') as f:
+            f.write(expected[:size])
+        pysert('-i', xml, '--checkpoint', '50', '-o', output, '--resume')
+        with open(output, 'rb') as f:
+            assert f.read() == expected
+
+
+UNIQUE = '''<pysert iterations="%d">
+    <dataset name="number" type="NumberSequence" length="2" unique="True"/>
+    <dataset name="code" type="AlphaNumeric" min_length="2" max_length="2"
+             alphabet="False" numeric="True" unique="True"/>
+    <template>#{number} #{code}
+</template>
+</pysert>'''
+
+
+def test_unique_values_are_distinct(tmpdir):
+    '''
+    Data sets with unique="True" never repeat a value: up to the size of
+    their value space they draw a permutation of it, in every mode, and
+    a run needing more rows fails before writing anything .
+    '''
+    xml = tmpdir.join('unique.xml')
+    xml.write(UNIQUE % 90)
+    for args in ([], ['-b', '16']):
+        rows = [line.split() for line in
+                pysert('-i', str(xml), '-s', '2', *args).splitlines()]
+        assert sorted(int(number) for (number, code) in rows) == \
+            list(range(10, 100))
+        assert len(set(code for (number, code) in rows)) == 90
+    xml.write(UNIQUE % 91)
+    with pytest.raises(subprocess.CalledProcessError):
+        pysert('-i', str(xml), '-s', '2')
+    xml = config(tmpdir, 'user_gen.xml', 1000)
+    values = {}
+    for match in INSERT.finditer(pysert('-i', xml, '-s', '2', '-b', '128')):
+        columns = [column.strip(' `') for column in match.group(2).split(',')]
+        row = dict(zip(columns, LITERAL.findall(match.group(3))))
+        for column in ('email_address', 'password', 'phone'):
+            if column in row:
+                values.setdefault(column, set()).add(row[column])
+    assert [len(values[column]) for column in sorted(values)] == [1000] * 3
+
+
+
+NESTED_UNIQUE = '''<pysert iterations="%d">
+    <dataset name="n" type="Sequence" start="1" increment="1"/>
+    <dataset name="count" type="RandomNumber" min="0" max="4"/>
+    <dataset name="number" type="NumberSequence" length="2" unique="True"/>
+    <template>#{n}
+<template count="%s"> #{number}
+</template></template>
+</pysert>'''
+
+
+def test_unique_capacity_counts_nested_rows(tmpdir):
+    '''
+    A unique data set in a nested template generates a value per row of
+    that template, not per outer row: a run whose nested rows exceed
+    its capacity fails before writing anything .
+    '''
+    xml = tmpdir.join('nested.xml')
+    for (iterations, count, fits) in ((9, '10', True), (10, '10', False),
+                                      (20, 'count', True),
+                                      (60, 'count', False)):
+        xml.write(NESTED_UNIQUE % (iterations, count))
+        for args in ([], ['-b', '8']):
+            if fits:
+                numbers = [line.strip() for line in
+                           pysert('-i', str(xml), '-s', '1',
+                                  *args).splitlines()
+                           if line.startswith(' ')]
+                assert len(set(numbers)) == len(numbers) > 20
+            else:
+                output = str(tmpdir.join('nested.sql'))
+                assert 'unique values' in pysert_error(
+                    '-i', str(xml), '-s', '1', '-o', output, *args)
+                assert not os.path.exists(output) or \
+                    os.path.getsize(output) == 0
+
+
+CODES = '''<pysert iterations="200">
+    <dataset name="n" type="Sequence" start="1" increment="1"/>
+    <dataset name="code" type="AlphaNumeric" min_length="3" max_length="3"
+             alphabet="False" numeric="True"/>
+    <dataset name="ratio" type="RandomNumber" floating="True" min="0"
+             max="1"/>
+    <template>
+        INSERT INTO t(n, code, ratio) VALUES (#{n}, '#{code}', #{ratio});
+    </template>
+</pysert>'''
+
+
+def test_sqlite_keeps_quoted_values_as_text(tmpdir):
+    '''
+    Quoted literals are stored as TEXT even when they look like numbers
+    (codes with leading zeros are kept), unquoted numbers as INTEGER or
+    REAL: the database holds the values of the CSV export .
+    '''
+    xml = tmpdir.join('codes.xml')
+    xml.write(CODES)
+    directory = str(tmpdir.join('csv'))
+    pysert('-i', str(xml), '-s', '1', '-f', 'csv', '-o', directory)
+    with open(os.path.join(directory, 't.csv')) as f:
+        expected = list(csv.reader(f))[1:]
+    assert [row for row in expected if row[1].startswith('0')]
+    database = str(tmpdir.join('codes.db'))
+    pysert('-i', str(xml), '-s', '1', '-f', 'sqlite', '-o', database,
+           '--batch-size', '32')
+    connection = sqlite3.connect(database)
+    rows = connection.execute('SELECT n, typeof(n), code, typeof(code), '
+                              'ratio, typeof(ratio) FROM t ORDER BY n')
+    rows = [tuple(row) for row in rows]
+    connection.close()
+    assert [(int(n), 'integer', code, 'text', float(ratio), 'real')
+            for (n, code, ratio) in expected] == rows
+
+
+ESCAPES = '''<pysert iterations="20">
+    <dataset name="n" type="Sequence" start="1" increment="1"/>
+    <dataset name="text" type="Expression"
+             expression="&quot;it's \\\\ &quot; + str(n) + ' &quot;x&quot;'"/>
+    <template>
+        INSERT INTO t(n, single, double) VALUES
+        (#{n}, '#{text}', "#{text}");
+    </template>
+</pysert>'''
+
+
+def unescape(literal, quote):
+    return re.sub(r'\\(.)|' + quote * 2,
+                  lambda matchobj: matchobj.group(1) or quote, literal)
+
+
+def test_values_are_escaped(tmpdir):
+    '''
+    Values with quotes and backslashes are escaped for the SQL literals
+    they are rendered in, quoted with ' or ", and come back unescaped
+    in the CSV files and the SQLite database .
+    '''
+    xml = tmpdir.join('escapes.xml')
+    xml.write(ESCAPES)
+    xml = str(xml)
+    expected = ['it\'s \\ %d "x"' % n for n in range(1, 21)]
+    rows = re.findall(r"\((\d+), '(.*)', \"(.*)\"\);",
+                      pysert('-i', xml, '-s', '1'))
+    assert [int(n) for (n, single, double) in rows] == list(range(1, 21))
+    assert [unescape(single, "'") for (n, single, double) in rows] == \
+        expected
+    assert [unescape(double, '"') for (n, single, double) in rows] == \
+        expected
+    directory = str(tmpdir.join('csv'))
+    pysert('-i', xml, '-s', '1', '-f', 'csv', '-o', directory)
+    with open(os.path.join(directory, 't.csv')) as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['n', 'single', 'double']
+    assert [row[1] for row in rows[1:]] == expected
+    assert [row[2] for row in rows[1:]] == expected
+    database = str(tmpdir.join('escapes.db'))
+    pysert('-i', xml, '-s', '1', '-f', 'sqlite', '-o', database)
+    connection = sqlite3.connect(database)
+    rows = connection.execute('SELECT single, double FROM t ORDER BY n')
+    assert [tuple(row) for row in rows] == [(value, value)
+                                            for value in expected]
+    connection.close()
+
+
+EXPRESSION = '''<pysert iterations="3">
+    <dataset name="n" type="Sequence" start="1" increment="1"/>
+    <dataset name="day" type="Date" min_year="2000" max_year="2001"/>
+    <dataset name="word" type="LoremIpsum" length="1"/>
+    <dataset name="e" type="Expression" expression="%s"/>
+    <template>INSERT INTO t(e) VALUES ('#{e}');</template>
+</pysert>'''
+
+
+@pytest.mark.parametrize('expression, error', [
+    ('n + nope', "Unknown data set 'nope' used by 'e'"),
+    ('n.real', 'Attribute is not supported'),
+    ('(lambda: n)()', 'unknown function Lambda()'),
+    ('n +', "invalid syntax in 'n +'"),
+    ('lower(n)', 'argument 1 of lower() is a number, not a string'),
+    ('day + 5', 'unsupported operand types for +: date and number'),
+    ('substr(word, 1)', 'substr() takes 3 arguments'),
+])
+def test_expression_errors_fail_at_startup(tmpdir, expression, error):
+    '''
+    Unknown names, unsupported syntax and type errors in an expression
+    are configuration errors reported before any output .
+    '''
+    xml = tmpdir.join('expression.xml')
+    xml.write(EXPRESSION % expression)
+    output = str(tmpdir.join('out.sql'))
+    assert error in pysert_error('-i', str(xml), '-s', '1', '-o', output)
+    assert not os.path.exists(output)
+
+
+@pytest.mark.parametrize('expression, value', [
+    ('day + 3 days - day', '3 days, 0:00:00'),
+    ('upper(word) * 2 if n &gt; 0 else word', 'LL'),
+    ('max(n, 2.5) % 2', '0.5'),
+])
+def test_expressions_render(tmpdir, expression, value):
+    '''
+    Expressions mixing dates, durations, strings and numbers pass the
+    type check and render their values .
+    '''
+    xml = tmpdir.join('expression.xml')
+    xml.write(EXPRESSION % expression)
+    assert re.findall(r"VALUES \('(.*?)'\);", pysert('-i', str(xml), '-s',
+                                                      '1'))[0] == value
+
+
+
+def test_max_file_size_splits_between_rows(tmpdir):
+    '''
+    With --max-file-size the output is split in files of at most that
+    size, between rows (statements with --format insert): the files
+    put together are the output of the run .
+    '''
+    xml = config(tmpdir, 'meal_gen.xml', 300)
+    expected = pysert('-i', xml, '-s', '4')
+    pysert('-i', xml, '-s', '4', '-o', str(tmpdir.join('meal.sql')),
+           '--max-file-size', '16K')
+    files = sorted(str(path) for path in tmpdir.listdir('meal_*.sql'))
+    assert len(files) > 3
+    texts = []
+    for filename in files:
+        assert os.path.getsize(filename) <= 16 * 1024
+        with open(filename) as f:
+            texts.append(f.read())
+    assert ''.join(texts) == expected
+    pysert('-i', xml, '-s', '4', '-o', str(tmpdir.join('batch.sql')),
+           '-f', 'insert', '--batch-size', '20', '--max-file-size', '16K')
+    files = sorted(str(path) for path in tmpdir.listdir('batch_*.sql'))
+    assert len(files) > 3
+    for filename in files:
+        assert os.path.getsize(filename) <= 16 * 1024
+        with open(filename) as f:
+            text = f.read()
+        assert text.startswith('INSERT INTO ') and text.endswith(');\n')
+
+
+def test_pipe_to_streams_the_output(tmpdir):
+    '''
+    --pipe-to feeds the output to the stdin of a command: the command
+    receives the output written to a file, and a command that exits
+    early or fails makes the run fail with its status .
+    '''
+    xml = config(tmpdir, 'meal_gen.xml', 300)
+    for args in ([], ['-b', '64'], ['-f', 'insert']):
+        output = str(tmpdir.join('file.sql'))
+        piped = str(tmpdir.join('piped.sql'))
+        pysert('-i', xml, '-s', '3', '-o', output, *args)
+        pysert('-i', xml, '-s', '3', '--pipe-to', 'cat > "%s"' % piped,
+               *args)
+        with open(output, 'rb') as f, open(piped, 'rb') as g:
+            assert f.read() == g.read(), args
+    head = str(tmpdir.join('head.sql'))
+    assert 'exited before the end of the output' in pysert_error(
+        '-i', xml, '-s', '3', '--pipe-to', 'head -c 100 > "%s"' % head)
+    assert os.path.getsize(head) == 100
+    assert 'exited with status 3' in pysert_error(
+        '-i', xml, '-s', '3', '--pipe-to', 'cat > /dev/null; exit 3')
+
+
+DISTRIBUTIONS = '''<pysert iterations="20000">
+    <dataset name="weighted" type="RandomNumber" min="1" max="4"
+             distribution="weights" weights="1,2,3,4"/>
+    <dataset name="zipf" type="RandomNumber" min="0" max="9"
+             distribution="zipf" skew="1.2"/>
+    <dataset name="normal" type="RandomNumber" min="0" max="1000"
+             distribution="normal" mean="500" stddev="50"/>
+    <dataset name="exponential" type="RandomNumber" min="0" max="100000"
+             distribution="exponential" mean="50"/>
+    <template>#{weighted} #{zipf} #{normal} #{exponential}
+</template>
+</pysert>'''
+
+
+def moments(values):
+    mean = float(sum(values)) / len(values)
+    variance = sum((value - mean) ** 2 for value in values) / len(values)
+    return (mean, variance ** 0.5)
+
+
+def test_distributions(tmpdir):
+    '''
+    The values follow their distribution: the weights and the zipf
+    frequencies, the mean and standard deviation of the normal and
+    exponential ones, within a few standard errors . Row and block mode
+    draw the same values .
+    '''
+    xml = tmpdir.join('distributions.xml')
+    xml.write(DISTRIBUTIONS)
+    output = pysert('-i', str(xml), '-s', '5')
+    assert pysert('-i', str(xml), '-s', '5', '-b', '999') == output
+    columns = list(zip(*[[int(value) for value in line.split()]
+                         for line in output.splitlines()]))
+    rows = float(len(columns[0]))
+    for value in range(1, 5):
+        assert abs(columns[0].count(value) / rows - value / 10.0) < 0.015
+    harmonic = sum(1 / (k + 1) ** 1.2 for k in range(10))
+    for value in range(10):
+        assert abs(columns[1].count(value) / rows -
+                   1 / (value + 1) ** 1.2 / harmonic) < 0.015
+    (mean, stddev) = moments(columns[2])
+    assert abs(mean - 500) < 2 and abs(stddev - 50) < 2
+    (mean, stddev) = moments(columns[3])
+    assert abs(mean - 50) < 2 and abs(stddev - 50) < 2
+    assert min(columns[3]) == 0
+
+
+COLUMNS = '''<pysert iterations="300">
+    <dataset name="user_id" type="Sequence" start="1" increment="1"/>
+    <dataset name="name" type="PersonName" firstname="True" lastname="False"/>
+    <dataset name="email" type="Expression"
+             expression="lower(name) + '.' + str(user_id) + '@email.com'"/>
+    <dataset name="score" type="RandomNumber" min="0" max="10"
+             floating="True"/>
+    <dataset name="born" type="Date" min_year="1950" max_year="2000"/>
+    <dataset name="country" type="LoremIpsum" length="5"/>
+    <template>
+        INSERT INTO User(user_id, name, email) VALUES
+        (#{user_id}, '#{name}', '#{email}');
+        INSERT INTO Profile(user_id, score, born, country) VALUES
+        (#{user_id}, #{score}, '#{born}', '#{country}');
+    </template>
+</pysert>'''
+
+# Prints the values of the columns in sys.argv[1] as the CSV output
+# formats them
+READ_COLUMNS = '''
+import json, sys
+import pysert
+reader = pysert.ColumnReader(sys.argv[1])
+print(json.dumps(dict((name, [str(value) for value in
+                              reader.values(name).tolist()])
+                      for name in reader.names())))
+'''
+
+
+def test_columns_match_csv(tmpdir):
+    '''
+    The columns written by --format columns, read back with
+    ColumnReader, hold the values of the CSV output for the same seed,
+    constant data sets included .
+    '''
+    xml = tmpdir.join('columns.xml')
+    xml.write(COLUMNS)
+    directory = str(tmpdir.join('columns'))
+    pysert('-i', str(xml), '-s', '7', '-f', 'columns', '-o', directory,
+           '-b', '64')
+    output = subprocess.check_output([PYTHON, '-c', READ_COLUMNS, directory],
+                                     cwd=HERE)
+    columns = json.loads(output.decode('utf-8'))
+    directory = str(tmpdir.join('csv'))
+    pysert('-i', str(xml), '-s', '7', '-f', 'csv', '-o', directory)
+    found = set()
+    for table in ('User', 'Profile'):
+        with open(os.path.join(directory, table + '.csv')) as f:
+            rows = list(csv.reader(f))
+        for (i, name) in enumerate(rows[0]):
+            assert columns[name] == [row[i] for row in rows[1:]], name
+            found.add(name)
+    assert found == set(columns)
+
+
+STATS = '''<pysert iterations="40">
+    <dataset name="id" type="Sequence" start="1" increment="1"/>
+    <dataset name="items" type="RandomNumber" min="0" max="4"/>
+    <dataset name="item" type="Sequence" start="1" increment="1"/>
+    <dataset name="word" type="LoremIpsum" length="5"/>
+    <template>INSERT INTO o(id, word) VALUES (#{id}, '#{word}');
+<template count="items">INSERT INTO i(item, o) VALUES (#{item}, #{parent.id});
+</template></template>
+</pysert>'''
+
+
+def test_stats_count_the_rows(tmpdir):
+    '''
+    --stats writes the statistics of the run as JSON: a data set counts
+    a row per value emitted (none for the constant folded into the
+    template), and bytes_written is the size of the output . --profile
+    dumps a profile pstats reads .
+    '''
+    xml = tmpdir.join('stats.xml')
+    xml.write(STATS)
+    output = str(tmpdir.join('stats.sql'))
+    report = str(tmpdir.join('stats.json'))
+    profile = str(tmpdir.join('stats.prof'))
+    for args in ([], ['-b', '16']):
+        pysert('-i', str(xml), '-s', '1', '-o', output, '--stats', report,
+               '--profile', profile, *args)
+        with open(report) as f:
+            stats = json.load(f)
+        assert set(stats) == {'rows', 'seconds', 'rows_per_sec',
+                              'bytes_written', 'render_seconds',
+                              'write_seconds', 'io_seconds',
+                              'peak_memory_kb', 'datasets'}
+        with open(output) as f:
+            text = f.read()
+        outer = text.count('INSERT INTO o(')
+        inner = text.count('INSERT INTO i(')
+        assert stats['rows'] == outer == 40
+        assert stats['bytes_written'] == os.path.getsize(output)
+        assert {name: counters['rows'] for (name, counters)
+                in stats['datasets'].items()} == \
+            {'id': outer, 'items': outer, 'item': inner, 'word': 0}
+        assert all(set(counters) == {'calls', 'rows', 'seconds'}
+                   for counters in stats['datasets'].values())
+        subprocess.check_call([PYTHON, '-c', 'import pstats, sys; '
+                               'pstats.Stats(sys.argv[1])', profile])
+
+
+def test_job_references_emitted_users(tmpdir):
+    '''
+    Running environment.xml, every user_id of the meals is the user_id
+    of a user emitted by the users configuration it depends on .
+    '''
+    with open(os.path.join(HERE, 'environment.xml')) as f:
+        tmpdir.join('environment.xml').write(f.read())
+    config(tmpdir, 'user_gen.xml', 200)
+    config(tmpdir, 'meal_gen.xml', 300)
+    for args in ([], ['-w', '2']):
+        pysert('-j', str(tmpdir.join('environment.xml')), '-s', '1', *args)
+        user_ids = {}
+        for name in ('users', 'meals'):
+            with open(str(tmpdir.join(name + '.sql'))) as f:
+                for match in INSERT.finditer(f.read()):
+                    columns = [column.strip(' `')
+                               for column in match.group(2).split(',')]
+                    row = dict(zip(columns, LITERAL.findall(match.group(3))))
+                    if 'user_id' in row:
+                        user_ids.setdefault(match.group(1), []).append(
+                            row['user_id'])
+        users = set(user_ids['User'])
+        authors = user_ids['Recipe']
+        assert len(users) == 200
+        assert len(authors) == 300
+        assert set(authors) <= users
+
+
+def test_cache_hits_render_the_rows(tmpdir):
+    '''
+    A run of an XML file compiled before loads it from the cache and
+    renders what a --no-cache run does, for any seed . Changing the XML
+    file or the options it is compiled with misses the cache .
+    '''
+    cache = str(tmpdir.join('cache'))
+    xml = config(tmpdir, 'meal_gen.xml', 50)
+
+    def entries():
+        return sorted(name for name in os.listdir(cache)
+                      if name.endswith('.pickle'))
+
+    first = pysert('-i', xml, '-s', '1', cache=cache)
+    assert first == pysert('-i', xml, '-s', '1')
+    [entry] = entries()
+    entry = os.path.join(cache, entry)
+    for (seed, args) in (('1', []), ('2', []), ('2', ['-b', '16'])):
+        os.utime(entry, (0, 0))
+        assert pysert('-i', xml, '-s', seed, cache=cache, *args) == \
+            pysert('-i', xml, '-s', seed, *args)
+        assert os.path.getmtime(entry) > 0
+    assert entries() == [os.path.basename(entry)]
+    pysert('-i', xml, '-s', '1', '-f', 'csv', '-o', str(tmpdir.join('csv')),
+           cache=cache)
+    assert len(entries()) == 2
+    config(tmpdir, 'meal_gen.xml', 60)
+    pysert('-i', xml, '-s', '1', cache=cache)
+    assert len(entries()) == 3